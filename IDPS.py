@@ -1,22 +1,37 @@
 # idps_gui_showtime_scroll.py
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import threading, time, re, subprocess, os, queue, json, urllib.request, random, csv, wave, struct, math
-from datetime import datetime, timedelta
+import threading, time, os, queue, random, math
 from collections import deque
-import winsound
+from datetime import datetime
+from idps_engine import DetectionEngine, THRESHOLD_DEFAULT, BLOCK_SECONDS_DEFAULT, utc
+from idps_firewall import admin_check
+from idps_audio import Siren
+from idps_async import AsyncRuntime
+from idps_sketch import SubnetDetector
+from idps_journal import StateJournal
+from idps_model import EventTable, MapModel, COLUMNS
+from idps_store import EventStore, STORED, REPORT_COLUMNS
+from idps_loadgen import fail_line, scan_line
+from idps_metrics import REGISTRY, PROFILER, UI_RENDER_SECONDS, METRICS_PORT, gauge, serve
 
 # =============== CONFIG ===============
 APP_TITLE = "IDPS — Sci‑Fi Demo Console"
-RULE_PREFIX = "IDPS_BLOCK_"
-THRESHOLD_DEFAULT = 3
-BLOCK_SECONDS_DEFAULT = 1800       # 30 min
-WINDOW_SECONDS = 180               # Count within last 3 min
-GEOLOOKUP = True
 MAP_W, MAP_H = 820, 410
-ALARM_WAV = "alarm.wav"            # will auto-generate if missing
 FAKE_LOG = "fake_auth.log"         # simulator writes here
-STATS_WINDOW_SEC = 60              # graph window
+STATS_WINDOW_SEC = 60              # default graph window (60, 3600 or 86400)
+UI_POLL_MS = 100                   # event_q drain interval when idle
+UI_FRAME_BUDGET = 0.03             # seconds of event handling per drain; the rest waits a tick
+TABLE_MAX_ROWS = 500               # live rows in the events table (one per attacker + type)
+HISTORY_PAGE = 500                 # rows per page in the Event History window
+LOG_MAX_LINES = 2000
+MAP_CLUSTER = "cell"               # attack dots grouped per map cell, "city" or "country"
+ANIM_FPS = 15                      # animation clock: radar, banner and map pulses
+ANIM_FPS_BUSY = 5                  # while events are backing up: leave the GIL to detection
+ANIM_BUSY_HOLD = 2.0               # seconds to stay at ANIM_FPS_BUSY after the last backlog
+RADAR_DEG_PER_SEC = 50.0
+STATS_EVERY = 1.0                  # engine tick + chart, also with animation off
+LOW_POWER = os.environ.get("IDPS_LOW_POWER","")=="1"    # start with animation off (wall screens, RDP)
 ABOUT_TEXT = (
     "Developer: Abdulrahaman Raji\n"
     "Company: Arc Robotics\n"
@@ -24,22 +39,11 @@ ABOUT_TEXT = (
     "Email: rajialex433@gmail.com"
 )
 
-# Patterns
-FAIL_RE = re.compile(r"Failed password.*from (\d+\.\d+\.\d+\.\d+)")
-SCAN_RE = re.compile(r"Port scan .* from (\d+\.\d+\.\d+\.\d+)")
-
 # =============== STATE ===============
+# Detection state lives in DetectionEngine; the GUI is just a subscriber.
 event_q = queue.Queue()
-fail_events = deque()              # (ts, ip)
-scan_events = deque()              # (ts, ip)
-blocked_until = {}                 # ip -> datetime
-whitelist = set()
 monitoring = False
-stop_flag = False
-playing_siren = False
-protect_mode = True
-stats_counts = deque()             # timestamps of alerts for per-minute graph
-radar_angle = 0
+siren = Siren()                    # alarm.wav if present, else a generated siren cached on disk (idps_audio)
 # =====================================
 
 def now(): return datetime.utcnow()
@@ -48,173 +52,26 @@ def ensure_log():
     try: open(FAKE_LOG, "a").close()
     except: pass
 
-def admin_check():
-    try:
-        out = subprocess.run(["net","session"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        return "Access is denied" not in out.stdout
-    except:
-        return False
-
-def run_netsh(args):
-    proc = subprocess.run(["netsh","advfirewall","firewall"]+args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    return proc.stdout.strip()
-
-def firewall_block(ip):
-    name_in=f"{RULE_PREFIX}{ip}_IN"; name_out=f"{RULE_PREFIX}{ip}_OUT"
-    o1=run_netsh(["add","rule",f"name={name_in}","dir=in","action=block","enable=yes","profile=any",f"remoteip={ip}"])
-    o2=run_netsh(["add","rule",f"name={name_out}","dir=out","action=block","enable=yes","profile=any",f"remoteip={ip}"])
-    return o1+"\n"+o2
-
-def firewall_unblock(ip):
-    name_in=f"{RULE_PREFIX}{ip}_IN"; name_out=f"{RULE_PREFIX}{ip}_OUT"
-    o1=run_netsh(["delete","rule",f"name={name_in}"])
-    o2=run_netsh(["delete","rule",f"name={name_out}"])
-    return o1+"\n"+o2
-
-def firewall_list_rules():
-    out=run_netsh(["show","rule","name=all"])
-    lines=[ln for ln in out.splitlines() if RULE_PREFIX in ln]
-    return "\n".join(lines) if lines else "(No IDPS rules found)"
-
-def get_geo(ip):
-    if not GEOLOOKUP: return ("Unknown", None, None)
-    try:
-        with urllib.request.urlopen(f"http://ip-api.com/json/{ip}?fields=status,country,city,lat,lon,query") as r:
-            d=json.loads(r.read().decode())
-            if d.get("status")=="success":
-                city=d.get("city") or ""; country=d.get("country") or ""
-                lat=d.get("lat"); lon=d.get("lon")
-                label=f"{city}, {country}".strip(", ")
-                return (label or "Unknown", lat, lon)
-    except: pass
-    return ("Unknown", None, None)
-
-def gc_events():
-    cutoff=now()-timedelta(seconds=WINDOW_SECONDS)
-    while fail_events and fail_events[0][0]<cutoff: fail_events.popleft()
-    while scan_events and scan_events[0][0]<cutoff: scan_events.popleft()
-
-def window_count(seq, ip):
-    cutoff=now()-timedelta(seconds=WINDOW_SECONDS)
-    return sum(1 for t,x in seq if x==ip and t>=cutoff)
-
-# ---- Siren (loop) ----
-def ensure_alarm_wav():
-    if os.path.exists(ALARM_WAV): return
-    try:
-        generate_siren_wav(ALARM_WAV, duration_sec=3)
-    except: pass
-
-def start_siren():
-    global playing_siren
-    if playing_siren: return
-    playing_siren=True
-    def loop():
-        if os.path.exists(ALARM_WAV):
-            winsound.PlaySound(ALARM_WAV, winsound.SND_ASYNC|winsound.SND_LOOP|winsound.SND_FILENAME)
-            return
-        while playing_siren:
-            winsound.Beep(980,300); time.sleep(0.1); winsound.Beep(1200,300); time.sleep(0.15)
-    threading.Thread(target=loop,daemon=True).start()
-
-def stop_siren():
-    global playing_siren
-    if not playing_siren: return
-    playing_siren=False
-    try: winsound.PlaySound(None,0)
-    except: pass
-
-def generate_siren_wav(path="alarm.wav", duration_sec=3, sr=44100):
-    n=int(duration_sec*sr); amp=32767//3; f1,f2=800.0,1400.0
-    with wave.open(path,"w") as wf:
-        wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(sr)
-        for i in range(n):
-            t=i/sr; phase=(t/duration_sec)%1.0
-            frac=phase*2 if phase<0.5 else (2-phase*2)
-            f=f1+(f2-f1)*frac
-            s=int(amp*math.sin(2*math.pi*f*t))
-            wf.writeframesraw(struct.pack("<h",s))
-
-# ---- Blocking with timeout ----
-def block_with_timeout(ip, secs, ui_log):
-    if ip in whitelist:
-        ui_log(f"[{now()}] Skipped block (whitelisted): {ip}")
-        return
-    if not protect_mode:
-        ui_log(f"[{now()}] Protect Mode OFF — alert only (no block) for {ip}")
-        return
-    resp=firewall_block(ip)
-    until=now()+timedelta(seconds=secs)
-    blocked_until[ip]=until
-    ui_log(f"[{now()}] BLOCKED {ip} for {secs}s\n{resp}")
-    def later():
-        time.sleep(secs)
-        if blocked_until.get(ip) and now()>=blocked_until[ip]:
-            firewall_unblock(ip); blocked_until.pop(ip,None)
-            event_q.put(("unblocked",ip,now()))
-    threading.Thread(target=later,daemon=True).start()
-
-# ---- Tail worker ----
-def tail_worker(path, threshold, block_seconds, ui_log):
-    ensure_log()
-    try:
-        with open(path,"r",encoding="utf-8",errors="ignore") as f:
-            f.seek(0,os.SEEK_END)
-            while monitoring and not stop_flag:
-                line=f.readline()
-                if not line:
-                    time.sleep(0.2); continue
-                m1=FAIL_RE.search(line); m2=SCAN_RE.search(line)
-                if not (m1 or m2): continue
-                ip=(m1 or m2).group(1)
-                if ip in whitelist:
-                    ui_log(f"[{now()}] Ignored whitelisted IP {ip}")
-                    continue
-                if ip in blocked_until and now()<blocked_until[ip]: continue
-
-                if m1:
-                    fail_events.append((now(),ip)); gc_events()
-                    cnt=window_count(fail_events,ip)
-                    event_q.put(("fail",ip,now(),cnt))
-                    if cnt>=threshold:
-                        event_q.put(("alert",ip,now(),"FAILED_LOGIN",cnt))
-                        def enrich_and_act():
-                            start_siren()
-                            label,lat,lon=get_geo(ip)
-                            event_q.put(("enrich",ip,label,lat,lon,"FAILED_LOGIN"))
-                            block_with_timeout(ip, block_seconds, ui_log)
-                        threading.Thread(target=enrich_and_act,daemon=True).start()
-
-                if m2:
-                    scan_events.append((now(),ip)); gc_events()
-                    sc=window_count(scan_events,ip)
-                    event_q.put(("scan",ip,now(),sc))
-                    if sc>=max(5,threshold-1):
-                        event_q.put(("alert",ip,now(),"PORT_SCAN",sc))
-                        def enrich_and_act2():
-                            start_siren()
-                            label,lat,lon=get_geo(ip)
-                            event_q.put(("enrich",ip,label,lat,lon,"PORT_SCAN"))
-                            block_with_timeout(ip, block_seconds, ui_log)
-                        threading.Thread(target=enrich_and_act2,daemon=True).start()
-    except Exception as e:
-        event_q.put(("error",str(e)))
-
 # =============== GUI ===============
 class MapPane(tk.Canvas):
+    # Dots live in a MapModel (idps_model): one per cluster, at most MAP_MAX_CLUSTERS,
+    # items reused. Nothing here schedules itself: the GUI's animation clock
+    # calls render() and sweep(), and every item is moved in place.
     def __init__(self, parent, w, h):
         super().__init__(parent,width=w,height=h,bg="#0b0e17",highlightthickness=0)
-        self.img=None; self.dots=[]; self.radar=None
-        if os.path.exists("world_map.png"):
-            try:
-                self.img=tk.PhotoImage(file="world_map.png")
-                self.create_image(w//2,h//2,image=self.img)
-            except: self.draw_grid()
-        else:
-            self.draw_grid()
+        self.img=None; self.model=MapModel(w,h,mode=MAP_CLUSTER)
+        self._texts={}; self.angle=0.0
+        self.draw_grid()
+        if os.path.exists("world_map.png"): self.after_idle(self.load_image)    # decode after the first paint
         # radar center
         self.cx, self.cy = w//2, h//2
         self.create_oval(self.cx-6,self.cy-6,self.cx+6,self.cy+6, outline="#00ffaa")
+        self.radar=self.create_line(self.cx,self.cy,self.cx,self.cy,fill="#00ffaa",width=2)
+
+    def load_image(self):
+        try: self.img=tk.PhotoImage(file="world_map.png")
+        except tk.TclError: return
+        self.tag_lower(self.create_image(MAP_W//2,MAP_H//2,image=self.img))
 
     def draw_grid(self):
         self.create_rectangle(0,0,MAP_W,MAP_H, fill="#0b0e17", outline="")
@@ -222,68 +79,66 @@ class MapPane(tk.Canvas):
         for y in range(0,MAP_H,40): self.create_line(0,y,MAP_W,y,fill="#13233f")
         self.create_text(MAP_W-10,MAP_H-10,text="MAP",fill="#1ac8ff",anchor="se",font=("Consolas",10,"bold"))
 
-    def lonlat_to_xy(self, lon, lat):
-        x=(lon+180.0)/360.0*MAP_W
-        y=(90.0-float(lat))/180.0*MAP_H
-        return (x,y)
-
-    def add_dot(self, lon, lat, label=""):
-        try: x,y=self.lonlat_to_xy(lon,lat)
-        except: return
-        r=5
-        dot=self.create_oval(x-r,y-r,x+r,y+r,fill="#ff3b3b",outline="#ffaaaa")
-        if label: self.create_text(x+10,y-10,text=label,fill="#e9f6ff",anchor="w",font=("Segoe UI",9))
-        self.dots.append(dot)
-        # pulse
-        def pulse():
-            grow=True; rr=r
-            for _ in range(10):
-                self.coords(dot,x-rr,y-rr,x+rr,y+rr); self.update_idletasks(); time.sleep(0.04)
-                rr=rr+1 if grow else rr-1
-                if rr>=r+4: grow=False
-            self.coords(dot,x-r,y-r,x+r,y+r)
-        threading.Thread(target=pulse,daemon=True).start()
+    def add_dot(self, lon, lat, label="", pulse=True):
+        try: self.model.add(lon,lat,label,time.monotonic() if pulse else None)
+        except (TypeError,ValueError): return
 
     def clear_dots(self):
-        for d in self.dots: self.delete(d)
-        self.dots.clear()
-
-    def sweep(self, angle_deg):
+        self.model.clear()
+
+    def render(self, now):
+        if self.model.busy: self.model.frame(now,self._draw,self._hide)
+
+    def _draw(self, c, r):
+        if c.items is None:
+            c.items=(self.create_oval(0,0,0,0,fill="#ff3b3b",outline="#ffaaaa"),
+                     self.create_text(0,0,text="",fill="#e9f6ff",anchor="w",font=("Segoe UI",9)))
+        dot,txt=c.items; text=c.text()
+        self.coords(dot,c.x-r,c.y-r,c.x+r,c.y+r); self.coords(txt,c.x+r+5,c.y-10)
+        if self._texts.get(txt)!=text:
+            self._texts[txt]=text; self.itemconfigure(txt,text=text,state="normal"); self.itemconfigure(dot,state="normal")
+
+    def _hide(self, items):
+        for i in items: self.itemconfigure(i,state="hidden")
+        self._texts.pop(items[1],None)
+
+    def sweep(self, dt):
+        self.angle=(self.angle+RADAR_DEG_PER_SEC*dt)%360
         length=min(MAP_W,MAP_H)//2 - 10
-        rad=math.radians(angle_deg)
-        x2=self.cx+length*math.cos(rad)
-        y2=self.cy-length*math.sin(rad)
-        if self.radar: self.delete(self.radar)
-        self.radar=self.create_line(self.cx,self.cy,x2,y2,fill="#00ffaa",width=2)
+        rad=math.radians(self.angle)
+        self.coords(self.radar,self.cx,self.cy,self.cx+length*math.cos(rad),self.cy-length*math.sin(rad))
+
+    def show_radar(self, on):
+        self.itemconfigure(self.radar,state="normal" if on else "hidden")
 
 class StatsPane(tk.Canvas):
+    SPANS = {60:"ATTACKS / MINUTE", 3600:"ATTACKS / HOUR", 86400:"ATTACKS / 24 H"}
+
     def __init__(self,parent,width=340,height=120):
         super().__init__(parent,width=width,height=height,bg="#0b0e17",highlightthickness=0)
-        self.w=width; self.h=height
-
-    def draw(self, timestamps, window_sec=60):
-        self.delete("all")
+        self.w=width; self.h=height; self.bars=[]; self.span=None
         self.create_rectangle(0,0,self.w,self.h, fill="#0b0e17", outline="#13233f")
-        nowt=time.time()
-        # grid
         for x in range(0,self.w,40): self.create_line(x,0,x,self.h,fill="#13233f")
         for y in range(0,self.h,30): self.create_line(0,y,self.w,y,fill="#13233f")
-        # counts per 5-second bucket
-        bucket=5
-        buckets=max(1, int(window_sec/bucket))
-        counts=[0]*buckets
-        for t in timestamps:
-            dt=nowt-t
-            if 0<=dt<=window_sec:
-                idx=buckets-1-int(dt//bucket)
-                if 0<=idx<buckets: counts[idx]+=1
-        # draw bars
-        bw=self.w/buckets
-        for i,c in enumerate(counts):
-            x0=i*bw+2; y0=self.h-2
-            h=min(self.h-4, c*12)
-            self.create_rectangle(x0,y0-h,x0+bw-4,y0, fill="#1ac8ff", outline="")
-        self.create_text(6,6, text="ATTACKS / MINUTE", anchor="nw", fill="#cfe4ff", font=("Consolas",10,"bold"))
+        self.title=self.create_text(6,6, text="", anchor="nw", fill="#cfe4ff", font=("Consolas",10,"bold"))
+        self.peak=self.create_text(self.w-6,6, text="", anchor="ne", fill="#7f9cc0", font=("Consolas",9))
+
+    def set_span(self, span, n):
+        # bar items are made once per span; draw() only moves them
+        for b in self.bars: self.delete(b)
+        bw=self.w/n; y0=self.h-2
+        self.bars=[self.create_rectangle(i*bw+2,y0,i*bw+bw-2,y0, fill="#1ac8ff", outline="") for i in range(n)]
+        self.span=span; self.itemconfigure(self.title, text=self.SPANS.get(span,f"ATTACKS / {span}s"))
+        self.tag_raise(self.title); self.tag_raise(self.peak)
+
+    def draw(self, counts, span=60):
+        if span!=self.span or len(counts)!=len(self.bars): self.set_span(span,len(counts))
+        top=max(counts) if counts else 0
+        scale=12 if top*12<=self.h-20 else (self.h-20)/top
+        bw=self.w/len(self.bars); y0=self.h-2
+        for i,(b,c) in enumerate(zip(self.bars,counts)):
+            self.coords(b, i*bw+2, y0-min(self.h-4, c*scale), i*bw+bw-2, y0)
+        self.itemconfigure(self.peak, text=f"peak {top}" if top else "")
 
 class IDPSGUI(tk.Tk):
     def __init__(self):
@@ -303,7 +158,20 @@ class IDPSGUI(tk.Tk):
             self.style.configure(k, background="#0a0a0a", foreground="#d9e6ff")
         self.style.configure("Header.TLabel", font=("Segoe UI",18,"bold"), foreground="#7efcff")
         self.style.configure("Alarm.TLabel", font=("Consolas",28,"bold"), foreground="#ffffff", background="#225522")
-        self.admin_ok=admin_check()
+        self.admin_ok=None             # probed in the background; see poll_events "admin"
+        threading.Thread(target=lambda: event_q.put(("admin",admin_check())),name="idps-admin-probe",daemon=True).start()
+
+        # Detection engine; the GUI sees it only through event_q
+        self.engine=DetectionEngine()
+        self.engine.subscribe(event_q.put)
+        self.journal=StateJournal(self.engine); self.journal.load()   # counters, blocks, whitelist from last run
+        self.journal.start()
+        self.store=EventStore().open().attach(self.engine)             # every event, for history and reports
+        # tailing, geo and firewall run on one asyncio loop thread; Tk reaches it
+        # only through the runtime's bridge, and hears back through event_q
+        self.responder=AsyncRuntime(self.engine).start()
+        gauge("idps_event_queue_depth","Events waiting for the GUI",event_q.qsize)
+        self._metrics_srv=None; self._diag_last=(None,None)
 
         # Vars
         self.threshold=tk.IntVar(value=THRESHOLD_DEFAULT)
@@ -311,7 +179,9 @@ class IDPSGUI(tk.Tk):
         self.log_path=tk.StringVar(value=FAKE_LOG)
         self.protect_var=tk.BooleanVar(value=True)
         self.auto_sim=tk.BooleanVar(value=False)
-        self._pulse_on=False
+        self.low_power=tk.BooleanVar(value=LOW_POWER)
+        self._alarm_on=False; self._banner_bg=None; self._busy_until=0.0
+        self._frame_t=time.monotonic(); self._next_stats=self._frame_t+STATS_EVERY
 
         # Menu: Help → About Us
         menubar=tk.Menu(self)
@@ -327,8 +197,9 @@ class IDPSGUI(tk.Tk):
         self.set_alarm_state(False)
 
         topbar=ttk.Frame(self); topbar.pack(fill="x", padx=10)
-        ttk.Label(topbar,text=f"Admin rights: {'OK' if self.admin_ok else 'Not Admin'}").pack(side="left", padx=5)
+        self.admin_lbl=ttk.Label(topbar,text="Admin rights: checking…"); self.admin_lbl.pack(side="left", padx=5)
         ttk.Checkbutton(topbar, text="Protect Mode (Alert + Block)", variable=self.protect_var, command=self.on_toggle_protect).pack(side="right", padx=6)
+        ttk.Checkbutton(topbar, text="Low-power (no animation)", variable=self.low_power, command=self.on_toggle_low_power).pack(side="right", padx=6)
 
         nb=ttk.Notebook(self); nb.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -337,49 +208,51 @@ class IDPSGUI(tk.Tk):
         self.frame_white=ttk.Frame(nb,padding=10); nb.add(self.frame_white,text="Whitelist")
         self.frame_sim=ttk.Frame(nb,padding=10); nb.add(self.frame_sim,text="Simulator")
         self.frame_logs=ttk.Frame(nb,padding=10); nb.add(self.frame_logs,text="Logs")
-
+        self.frame_diag=ttk.Frame(nb,padding=10); nb.add(self.frame_diag,text="Diagnostics")
+        self.nb=nb
+
+        # only the Dashboard is built now; the other tabs on first view
+        self.txt=None; self._log_buf=deque(maxlen=LOG_MAX_LINES)
+        self._unbuilt={str(self.frame_ctrl):self.build_controls,str(self.frame_white):self.build_whitelist,
+                       str(self.frame_sim):self.build_simulator,str(self.frame_logs):self.build_logs,
+                       str(self.frame_diag):self.build_diagnostics}
         self.build_dashboard()
-        self.build_controls()
-        self.build_whitelist()
-        self.build_simulator()
-        self.build_logs()
+        nb.bind("<<NotebookTabChanged>>", self.on_tab)
 
-        ensure_alarm_wav()
-        self.after(150, self.poll_events)
-        self.after(80, self.animate_radar)
-        self.after(1000, self.refresh_stats)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(UI_POLL_MS, self.poll_events)
+        self.on_toggle_low_power(); self.after(0, self.frame)
 
     # ----- Visuals -----
     def set_alarm_state(self, danger):
+        self._alarm_on=bool(danger)
         if danger:
-            self.alarm_banner.configure(text="ATTACK DETECTED — ALERT ACTIVE", background="#cc0000")
-            self.start_pulse(); start_siren()
+            self.alarm_banner.configure(text="ATTACK DETECTED — ALERT ACTIVE")
+            self.set_banner("#cc0000"); siren.start()
         else:
-            self.alarm_banner.configure(text="SYSTEM NORMAL", background="#225522")
-            self.stop_pulse()
-            if not blocked_until: stop_siren()
-
-    def start_pulse(self):
-        if self._pulse_on: return
-        self._pulse_on=True
-        def loop():
-            t=0
-            while self._pulse_on:
-                shade=int(170+50*(0.5+0.5*((t%20)+1)/20))
-                self.alarm_banner.configure(background=f"#{shade:02x}0000")
-                self.update_idletasks(); time.sleep(0.05); t+=1
-        threading.Thread(target=loop,daemon=True).start()
-
-    def stop_pulse(self):
-        self._pulse_on=False; self.alarm_banner.configure(background="#225522")
+            self.alarm_banner.configure(text="SYSTEM NORMAL")
+            self.set_banner("#225522")
+            if not self.engine.blocked_until: siren.stop()
+
+    def set_banner(self, bg):
+        if bg!=self._banner_bg: self._banner_bg=bg; self.alarm_banner.configure(background=bg)
+
+    def on_toggle_low_power(self):
+        low=self.low_power.get()
+        self.map.show_radar(not low)
+        if low and self._alarm_on: self.set_banner("#cc0000")
 
     # ----- Build panes -----
+    def on_tab(self, _=None):
+        build=self._unbuilt.pop(str(self.nb.select()),None)
+        if build is not None: build()
+
     def build_dashboard(self):
         # Top action buttons
         btns=ttk.Frame(self.frame_dash); btns.pack(fill="x")
         self.btn_start=ttk.Button(btns,text="▶ Start Monitoring",command=self.start_monitor)
         self.btn_stop =ttk.Button(btns,text="⏹ Stop Monitoring", command=self.stop_monitor, state="disabled")
-        self.btn_silence=ttk.Button(btns,text="🔇 Silence Alarm", command=lambda: stop_siren())
+        self.btn_silence=ttk.Button(btns,text="🔇 Silence Alarm", command=siren.stop)
         self.btn_export=ttk.Button(btns,text="📝 Export Report", command=self.export_report)
         self.btn_start.pack(side="left",padx=4); self.btn_stop.pack(side="left",padx=4)
         self.btn_silence.pack(side="left",padx=10); self.btn_export.pack(side="left",padx=10)
@@ -425,7 +298,7 @@ class IDPSGUI(tk.Tk):
 
         self.tree = ttk.Treeview(
             tbl_frame,
-            columns=("ip","time","type","count","geo","status"),
+            columns=COLUMNS,
             show="headings",
             height=18,
             yscrollcommand=ysb.set,
@@ -438,13 +311,20 @@ class IDPSGUI(tk.Tk):
         for c,w in [("ip",160),("time",180),("type",110),("count",70),("geo",250),("status",110)]:
             self.tree.heading(c, text=c.upper()); self.tree.column(c, width=w, anchor="center")
 
+        self.table=EventTable(TABLE_MAX_ROWS)   # what the tree shows; see idps_model
+
         qa = ttk.Frame(right); qa.pack(fill="x", pady=4)
         ttk.Button(qa, text="Unblock Selected", command=self.unblock_selected).pack(side="left", padx=4)
         ttk.Button(qa, text="List IDPS Rules", command=self.list_rules_popup).pack(side="left", padx=4)
+        ttk.Button(qa, text="Event History", command=self.history_popup).pack(side="left", padx=4)
 
         # Lower row: Attacks / Minute chart (now scrolls into view if small screen)
         bottom = ttk.Frame(wrap); bottom.pack(fill="x", pady=8)
         self.stats=StatsPane(bottom, width=MAP_W, height=130); self.stats.pack()
+        self.stats_span=tk.IntVar(value=STATS_WINDOW_SEC)
+        spans=ttk.Frame(bottom); spans.pack(pady=2)
+        for span,lbl in ((60,"1 min"),(3600,"1 h"),(86400,"24 h")):
+            ttk.Radiobutton(spans,text=lbl,value=span,variable=self.stats_span,command=self.refresh_chart).pack(side="left",padx=6)
 
     def build_controls(self):
         frm=self.frame_ctrl
@@ -458,6 +338,8 @@ class IDPSGUI(tk.Tk):
         ttk.Spinbox(r2,from_=1,to=50,textvariable=self.threshold,width=6).pack(side="left",padx=6)
         ttk.Label(r2,text="BLOCK TIME (seconds):").pack(side="left")
         ttk.Spinbox(r2,from_=60,to=86400,textvariable=self.block_seconds,width=10).pack(side="left",padx=6)
+        self.subnet_var=tk.BooleanVar(value=self.engine.subnets is not None)
+        ttk.Checkbutton(r2,text="Subnet detection (/24, /16 with many attacking IPs)",variable=self.subnet_var,command=self.on_toggle_subnets).pack(side="left",padx=10)
 
         r3=ttk.Frame(frm); r3.pack(fill="x", pady=6)
         ttk.Button(r3,text="Delete ALL IDPS Rules (cleanup)",command=self.cleanup_rules).pack(side="left",padx=4)
@@ -467,13 +349,17 @@ class IDPSGUI(tk.Tk):
 
     def build_whitelist(self):
         frm=self.frame_white
-        ttk.Label(frm,text="Add IP to Whitelist (never blocked):").pack(anchor="w")
+        ttk.Label(frm,text="Add IP or CIDR (IPv4/IPv6) to Whitelist (never blocked):").pack(anchor="w")
         row=ttk.Frame(frm); row.pack(fill="x",pady=6)
         self.wh_ip_var=tk.StringVar()
-        ttk.Entry(row,textvariable=self.wh_ip_var,width=24).pack(side="left",padx=6)
+        ttk.Entry(row,textvariable=self.wh_ip_var,width=30).pack(side="left",padx=6)
         ttk.Button(row,text="Add",command=self.add_whitelist).pack(side="left")
         ttk.Button(row,text="Remove",command=self.remove_whitelist).pack(side="left",padx=6)
+        ttk.Button(row,text="Import Whitelist File…",command=lambda: self.import_list("whitelist")).pack(side="left",padx=6)
+        ttk.Button(row,text="Import Blocklist File…",command=lambda: self.import_list("blocklist")).pack(side="left",padx=6)
+        self.bl_info=ttk.Label(frm,text=""); self.bl_info.pack(anchor="w")
         self.wl_list=tk.Listbox(frm,height=12); self.wl_list.pack(fill="both",expand=True,pady=6)
+        self.refresh_whitelist()       # entries restored from the state journal
 
     def build_simulator(self):
         frm=self.frame_sim
@@ -506,84 +392,175 @@ class IDPSGUI(tk.Tk):
         frm=self.frame_logs
         self.txt=tk.Text(frm,height=20,bg="#0b0e17",fg="#cfe4ff")
         self.txt.pack(fill="both",expand=True)
+        if self._log_buf: self.append_log("\n".join(self._log_buf)); self._log_buf.clear()
         btns=ttk.Frame(frm); btns.pack(fill="x",pady=6)
         ttk.Button(btns,text="Clear Log View",command=lambda:self.txt.delete("1.0","end")).pack(side="right",padx=6)
 
+    def build_diagnostics(self):
+        frm=self.frame_diag
+        btns=ttk.Frame(frm); btns.pack(fill="x",pady=6)
+        self.serve_var=tk.BooleanVar(value=False)
+        ttk.Checkbutton(btns,text=f"Serve /metrics on 127.0.0.1:{METRICS_PORT}",variable=self.serve_var,command=self.toggle_metrics_server).pack(side="left",padx=6)
+        self.btn_prof=ttk.Button(btns,text="Start Profiler",command=self.toggle_profiler); self.btn_prof.pack(side="left",padx=6)
+        ttk.Button(btns,text="Reset Profile",command=PROFILER.reset).pack(side="left",padx=6)
+        self.diag_txt=tk.Text(frm,height=30,bg="#0b0e17",fg="#cfe4ff",font=("Consolas",10))
+        self.diag_txt.pack(fill="both",expand=True)
+
+    def toggle_metrics_server(self):
+        if self.serve_var.get() and self._metrics_srv is None:
+            try: self._metrics_srv=serve(METRICS_PORT)
+            except OSError as e:
+                self.serve_var.set(False); messagebox.showerror("Metrics",str(e)); return
+            self.append_log(f"[{now()}] Metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+        elif not self.serve_var.get() and self._metrics_srv is not None:
+            srv=self._metrics_srv; self._metrics_srv=None
+            threading.Thread(target=srv.shutdown,daemon=True).start()
+
+    def toggle_profiler(self):
+        if PROFILER.running: PROFILER.stop(); self.btn_prof.configure(text="Start Profiler")
+        else: PROFILER.start(); self.btn_prof.configure(text="Stop Profiler")
+
+    def refresh_diagnostics(self):
+        last,t_last=self._diag_last; t=time.monotonic()
+        text,counters=REGISTRY.summary(last,t-t_last if t_last else None)
+        self._diag_last=(counters,t)
+        if str(self.nb.select())!=str(self.frame_diag): return   # nothing to draw while hidden
+        if PROFILER.taken: text+="\n\n"+PROFILER.report(20)
+        self.diag_txt.delete("1.0","end"); self.diag_txt.insert("end",text)
+
     # ----- actions -----
     def append_log(self,msg):
-        self.txt.insert("end",msg+"\n"); self.txt.see("end")
+        if self.txt is None: self._log_buf.append(msg); return    # Logs tab not built yet
+        self.txt.insert("end",msg+"\n")
+        lines=int(self.txt.index("end-1c").split(".")[0])
+        if lines>LOG_MAX_LINES: self.txt.delete("1.0",f"{lines-LOG_MAX_LINES}.0")
+        self.txt.see("end")
+
+    def sync_table(self):
+        tv=self.tree
+        self.table.sync(lambda vals: tv.insert("", "end", values=vals),
+                        lambda iid,vals: tv.item(iid, values=vals),
+                        tv.delete)
+
+    def history_popup(self):
+        top=tk.Toplevel(self); top.title("IDPS — Event History")
+        flt=ttk.Frame(top); flt.pack(fill="x",pady=4)
+        ip_var=tk.StringVar(); type_var=tk.StringVar(value="all")
+        ttk.Label(flt,text="IP:").pack(side="left",padx=(6,2)); ttk.Entry(flt,textvariable=ip_var,width=24).pack(side="left")
+        ttk.Label(flt,text="Type:").pack(side="left",padx=(10,2))
+        ttk.Combobox(flt,textvariable=type_var,values=("all",)+STORED,width=10,state="readonly").pack(side="left")
+        tv=ttk.Treeview(top,columns=REPORT_COLUMNS,show="headings",height=24)
+        for c,w in [("time",180),("ip",160),("type",90),("count",70),("detail",200),("geo",250)]:
+            tv.heading(c, text=c.upper()); tv.column(c, width=w, anchor="center")
+        tv.pack(fill="both",expand=True)
+        nav=ttk.Frame(top); nav.pack(fill="x",pady=4)
+        info=ttk.Label(nav); cursors=[None]; last=[None]      # cursors[-1] = `before` of the page shown
+        def show(step=0):
+            if step>0 and last[0] is None: return
+            if step>0: cursors.append(last[0])
+            elif step<0 and len(cursors)>1: cursors.pop()
+            filters=dict(ip=ip_var.get().strip() or None,type=None if type_var.get()=="all" else type_var.get())
+            rows=self.store.page(cursors[-1],HISTORY_PAGE,**filters)     # keyset paging: cost doesn't grow with depth
+            last[0]=rows[-1] if len(rows)==HISTORY_PAGE else None
+            tv.delete(*tv.get_children())
+            for r in rows: tv.insert("", "end", values=r[2:])
+            info.configure(text=f"Page {len(cursors)}  ({len(rows)} rows, newest first)")
+        def apply(*_):
+            del cursors[1:]; show()
+        ttk.Button(flt,text="Apply",command=apply).pack(side="left",padx=8)
+        ttk.Button(nav,text="◀ Older",command=lambda: show(1)).pack(side="left",padx=4)
+        ttk.Button(nav,text="Newer ▶",command=lambda: show(-1)).pack(side="left",padx=4)
+        info.pack(side="left",padx=10)
+        self.store.flush(); show()
 
     def on_toggle_protect(self):
-        global protect_mode
-        protect_mode=self.protect_var.get()
-        self.append_log(f"[{now()}] Protect Mode set to {'ON (Alert+Block)' if protect_mode else 'OFF (Alert-only)'}")
+        self.engine.protect_mode=self.protect_var.get()
+        self.append_log(f"[{now()}] Protect Mode set to {'ON (Alert+Block)' if self.engine.protect_mode else 'OFF (Alert-only)'}")
+
+    def on_toggle_subnets(self):
+        with self.engine.lock: self.engine.subnets=SubnetDetector() if self.subnet_var.get() else None
+        self.append_log(f"[{now()}] Subnet detection {'ON' if self.engine.subnets else 'OFF'}")
 
     def start_monitor(self):
-        global monitoring, stop_flag
+        global monitoring
         if monitoring: return
         path=self.log_path.get().strip()
         if not os.path.exists(path):
             try: open(path,"a").close()
             except Exception as e:
                 messagebox.showerror("Error",f"Cannot open log file:\n{e}"); return
-        stop_flag=False; monitoring=True
+        self.engine.threshold=self.threshold.get(); self.engine.block_seconds=self.block_seconds.get()
+        monitoring=True
         self.set_alarm_state(False)
         self.append_log(f"[{now()}] Monitoring started: {path}")
         self.after(50, lambda: self.btn_stop.configure(state="normal"))
         self.btn_start.configure(state="disabled")
-        t=threading.Thread(target=tail_worker,daemon=True,args=(path,self.threshold.get(),self.block_seconds.get(),self.append_log))
-        t.start()
+        self.responder.follow(path)
+
+    def on_close(self):
+        siren.stop()
+        self.responder.close(wait=False)          # stops tailing, saves block deadlines for next start
+        self.journal.close(); self.store.close()
+        self.destroy()
 
     def stop_monitor(self):
-        global monitoring, stop_flag
-        stop_flag=True; monitoring=False
+        global monitoring
+        self.responder.unfollow(); monitoring=False
         self.btn_start.configure(state="normal"); self.btn_stop.configure(state="disabled")
         self.set_alarm_state(False); self.append_log(f"[{now()}] Monitoring stopped.")
 
     def unblock_selected(self):
         sel=self.tree.selection()
         if not sel: messagebox.showinfo("Info","Select a row first."); return
-        ip=self.tree.item(sel[0])["values"][0]
-        resp=firewall_unblock(ip); blocked_until.pop(ip,None)
+        ip=self.table.row(sel[0]).ip
+        resp=self.responder.unblock(ip)
         self.append_log(f"[{now()}] UNBLOCK requested for {ip}\n{resp}")
-        if not blocked_until: self.set_alarm_state(False)
+        if not self.engine.blocked_until: self.set_alarm_state(False)
 
     def list_rules_popup(self):
-        rules=firewall_list_rules()
+        rules=self.responder.firewall.list_rules()
         top=tk.Toplevel(self); top.title("IDPS Rules")
         txt=tk.Text(top,width=110,height=32,bg="#0b0e17",fg="#cfe4ff"); txt.pack(fill="both",expand=True)
         txt.insert("end",rules)
 
     def cleanup_rules(self):
-        out=run_netsh(["show","rule","name=all"]); names=[]
-        for ln in out.splitlines():
-            if RULE_PREFIX in ln and "Rule Name:" in ln:
-                nm=ln.split("Rule Name:",1)[1].strip(); names.append(nm)
-        for nm in names: run_netsh(["delete","rule",f"name={nm}"])
-        self.append_log(f"[{now()}] Deleted {len(names)} IDPS firewall rules.")
-        blocked_until.clear(); self.set_alarm_state(False)
+        n=self.responder.firewall.cleanup()
+        self.append_log(f"[{now()}] Deleted {n} IDPS firewall rules.")
+        self.responder.forget_all(); self.set_alarm_state(False)
 
     def add_whitelist(self):
         ip=self.wh_ip_var.get().strip()
         if not ip: return
-        whitelist.add(ip); self.refresh_whitelist()
+        try: self.engine.whitelist.add(ip)
+        except ValueError as e: messagebox.showerror("Whitelist",str(e)); return
+        self.refresh_whitelist()
         self.append_log(f"[{now()}] Whitelisted {ip}")
 
     def remove_whitelist(self):
         ip=self.wh_ip_var.get().strip()
-        whitelist.discard(ip); self.refresh_whitelist()
+        self.engine.whitelist.discard(ip); self.refresh_whitelist()
         self.append_log(f"[{now()}] Removed {ip} from whitelist")
 
+    def import_list(self, which):
+        path=filedialog.askopenfilename(title=f"Import {which}",filetypes=[("Text","*.txt *.lst *.conf"),("All","*.*")])
+        if not path: return
+        try: n,bad=getattr(self.engine,which).load_file(path)
+        except (OSError,ValueError) as e: messagebox.showerror("Import",str(e)); return
+        self.refresh_whitelist()
+        self.append_log(f"[{now()}] Imported {n} {which} entries from {os.path.basename(path)}"+(f" ({bad} skipped)" if bad else ""))
+
     def refresh_whitelist(self):
         self.wl_list.delete(0,"end")
-        for ip in sorted(whitelist): self.wl_list.insert("end",ip)
+        ips=list(self.engine.whitelist)
+        if ips: self.wl_list.insert("end",*ips)
+        self.bl_info.config(text=f"Whitelist: {len(ips)} entries    Blocklist: {len(self.engine.blocklist)} entries (blocked on first hit)")
 
     def sim_failed(self):
         ip=self.sim_ip.get().strip(); n=int(self.sim_times.get())
         try:
             with open(FAKE_LOG,"a") as f:
                 for _ in range(n):
-                    f.write(f"{datetime.now()} Failed password for invalid user test from {ip}\n")
+                    f.write(fail_line(ip))
             self.append_log(f"[{now()}] Simulator wrote {n} failed‑login lines for {ip}")
         except Exception as e: messagebox.showerror("Error",str(e))
 
@@ -593,7 +570,7 @@ class IDPSGUI(tk.Tk):
             with open(FAKE_LOG,"a") as f:
                 for _ in range(cnt_ips):
                     last=random.randint(1,254); ip=f"{base}{last}"
-                    for _ in range(burst): f.write(f"{datetime.now()} Port scan (SYN burst) from {ip}\n")
+                    for _ in range(burst): f.write(scan_line(ip))
             self.append_log(f"[{now()}] Simulator fired port‑scan burst: {cnt_ips} IPs × {burst}")
         except Exception as e: messagebox.showerror("Error",str(e))
 
@@ -611,94 +588,115 @@ class IDPSGUI(tk.Tk):
                 if random.random()<0.6:
                     ip=f"198.51.100.{random.randint(2,250)}"
                     n=random.randint(2,5)
-                    for _ in range(n): f.write(f"{datetime.now()} Failed password for demo from {ip}\n")
+                    for _ in range(n): f.write(fail_line(ip,user="demo"))
                 else:
                     ip=f"203.0.113.{random.randint(2,250)}"
-                    for _ in range(random.randint(6,12)): f.write(f"{datetime.now()} Port scan (SYN burst) from {ip}\n")
+                    for _ in range(random.randint(6,12)): f.write(scan_line(ip))
         except: pass
         self.after(random.randint(2000,5000), self.auto_sim_tick)
 
     def export_report(self):
-        rows=[]
-        for iid in self.tree.get_children():
-            vals=self.tree.item(iid)["values"]
-            if vals: rows.append(vals)
-        if not rows:
-            messagebox.showinfo("Export","No events to export yet."); return
-
         csv_path=filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV","*.csv")], initialfile="idps_report.csv")
-        if csv_path:
-            with open(csv_path,"w",newline="",encoding="utf-8") as fp:
-                w=csv.writer(fp); w.writerow(["IP","Time","Type","Count","Geo","Status"]); w.writerows(rows)
         html_path=os.path.splitext(csv_path)[0]+".html" if csv_path else filedialog.asksaveasfilename(defaultextension=".html", filetypes=[("HTML","*.html")], initialfile="idps_report.html")
-        if html_path:
-            with open(html_path,"w",encoding="utf-8") as fp:
-                fp.write("<html><head><meta charset='utf-8'><title>IDPS Report</title>")
-                fp.write("<style>body{font-family:Segoe UI;background:#0b0e17;color:#eaf2ff;}table{border-collapse:collapse;width:100%;}th,td{border:1px solid #22324a;padding:8px;}th{background:#12223a;}</style></head><body>")
-                fp.write(f"<h2>IDPS Report — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</h2>")
-                fp.write("<table><tr><th>IP</th><th>Time</th><th>Type</th><th>Count</th><th>Geo</th><th>Status</th></tr>")
-                for r in rows:
-                    fp.write("<tr>"+"".join(f"<td>{str(x)}</td>" for x in r)+"</tr>")
-                fp.write("</table></body></html>")
-        messagebox.showinfo("Export","Report exported (CSV/HTML). You can print the HTML to PDF.")
+        if not csv_path and not html_path: return
+        self.btn_export.configure(state="disabled"); self.append_log(f"[{now()}] Exporting report…")
+        def work():
+            # streamed from the store off the UI thread: memory stays flat with millions of rows
+            try:
+                self.store.flush(); n=0
+                if csv_path: n=self.store.export_csv(csv_path)
+                if html_path: n=self.store.export_html(html_path)
+                event_q.put(("export",True,f"Report exported ({n:,} events, CSV/HTML). You can print the HTML to PDF."))
+            except Exception as e:
+                event_q.put(("export",False,f"Export failed:\n{e}"))
+        threading.Thread(target=work,name="idps-export",daemon=True).start()
 
     # ----- Loops -----
     def poll_events(self):
+        # Drain for at most UI_FRAME_BUDGET into the table model, then push
+        # only the rows that changed to the widget.
+        t0=time.perf_counter(); deadline=t0+UI_FRAME_BUDGET
+        table=self.table; logs=[]; alarm=None; animate=self.anim_fps()>0
         try:
-            while True:
+            while time.perf_counter()<deadline:
                 ev=event_q.get_nowait()
                 kind=ev[0]
                 if kind in ("fail","scan"):
                     _,ip,ts,cnt = ev
-                    typ="FAILED_LOGIN" if kind=="fail" else "PORT_SCAN"
-                    self.tree.insert("", "end", values=(ip, ts.strftime("%Y-%m-%d %H:%M:%S"), typ, cnt, "", "seen"))
+                    table.hit(ip,"FAILED_LOGIN" if kind=="fail" else "PORT_SCAN",ts,cnt)
                 elif kind=="alert":
                     _,ip,ts,typ,cnt=ev
-                    self.set_alarm_state(True)
-                    self.tree.insert("", "end", values=(ip, ts.strftime("%Y-%m-%d %H:%M:%S"), typ, cnt, "", "ALERT"))
-                    self.append_log(f"[{now()}] ALERT: {typ} — {ip} (count={cnt})")
-                    # feed the ATTACKS/MINUTE chart
-                    stats_counts.append(time.time())
+                    table.hit(ip,typ,ts,cnt,"ALERT"); alarm=True
+                    logs.append(f"[{now()}] ALERT: {typ} — {ip} (count={cnt})")
                 elif kind=="enrich":
                     _,ip,label,lat,lon,typ=ev
-                    for iid in reversed(self.tree.get_children()):
-                        vals=list(self.tree.item(iid)["values"])
-                        if vals and vals[0]==ip and vals[4]=="":
-                            vals[4]=label; vals[5]="BLOCKED" if protect_mode else "ALERT"
-                            self.tree.item(iid, values=vals); break
+                    table.enrich(ip,label,"BLOCKED" if self.engine.protect_mode else "ALERT")
                     if lat is not None and lon is not None:
-                        self.map.add_dot(lon,lat,label)
+                        self.map.add_dot(lon,lat,label,pulse=animate)
+                elif kind=="blocked":
+                    _,ip,ts,until,resp=ev
+                    logs.append(f"[{utc(ts)}] BLOCKED {ip} for {int(until-ts)}s\n{resp}")
                 elif kind=="unblocked":
                     _,ip,t=ev
-                    self.append_log(f"[{now()}] UNBLOCKED {ip} (timeout)")
-                    if not blocked_until: self.set_alarm_state(False)
+                    logs.append(f"[{now()}] UNBLOCKED {ip}")
+                    if not self.engine.blocked_until: alarm=False
+                elif kind=="ignored":
+                    _,ip,ts=ev; logs.append(f"[{utc(ts)}] Ignored whitelisted IP {ip}")
+                elif kind=="log":
+                    _,msg=ev; logs.append(f"[{now()}] {msg}")
                 elif kind=="error":
-                    _,msg=ev; self.append_log(f"[ERROR] {msg}")
-                event_q.task_done()
+                    _,msg=ev; logs.append(f"[ERROR] {msg}")
+                elif kind=="admin":
+                    self.admin_ok=ev[1]; self.admin_lbl.configure(text=f"Admin rights: {'OK' if ev[1] else 'Not Admin'}")
+                    if not ev[1]:
+                        self.after(0,lambda: messagebox.showwarning("Admin Required","Not running as Administrator.\nFirewall actions will fail.\nRight‑click Command Prompt → Run as administrator."))
+                elif kind=="export":
+                    _,ok,msg=ev; self.btn_export.configure(state="normal")
+                    self.after(0,lambda ok=ok,msg=msg: (messagebox.showinfo if ok else messagebox.showerror)("Export",msg))
         except queue.Empty:
             pass
-        self.after(150, self.poll_events)
-
-    def animate_radar(self):
-        global radar_angle
-        radar_angle=(radar_angle+3)%360
-        self.map.sweep(radar_angle)
-        self.after(60, self.animate_radar)
+        self.sync_table()
+        if alarm is not None: self.set_alarm_state(alarm)
+        if logs: self.append_log("\n".join(logs[-LOG_MAX_LINES:]))
+        if not animate: self.map.render(time.monotonic())       # no clock frames: draw new dots now
+        UI_RENDER_SECONDS.since(t0)
+        # still behind: come straight back instead of waiting a full tick
+        behind=not event_q.empty()
+        if behind: self._busy_until=time.monotonic()+ANIM_BUSY_HOLD
+        self.after(1 if behind else UI_POLL_MS, self.poll_events)
+
+    def anim_fps(self):
+        """0 while nothing animated can be seen; fewer frames while events back up."""
+        if self.low_power.get() or self.state() in ("iconic","withdrawn"): return 0
+        return ANIM_FPS_BUSY if time.monotonic()<self._busy_until else ANIM_FPS
+
+    def frame(self):
+        # The one animation clock: radar, banner pulse and map pulses move their
+        # existing items by the time since the last frame; stats every STATS_EVERY.
+        t=time.monotonic(); dt=t-self._frame_t; self._frame_t=t
+        fps=self.anim_fps()
+        if fps:
+            if str(self.nb.select())==str(self.frame_dash):
+                self.map.sweep(dt); self.map.render(t)
+            if self._alarm_on:
+                self.set_banner(f"#{int(170+50*(0.5+0.5*(t%1.0))):02x}0000")
+        if t>=self._next_stats:
+            self._next_stats=t+STATS_EVERY; self.refresh_stats()
+        wait=1/fps if fps else self._next_stats-t
+        self.after(max(1,int(wait*1000)), self.frame)
 
     def refresh_stats(self):
-        cutoff=time.time()-STATS_WINDOW_SEC
-        while stats_counts and stats_counts[0]<cutoff:
-            stats_counts.popleft()
-        # draw the chart
-        # Using StatsPane under Dashboard bottom frame
-        # (StatsPane instance is created in build_dashboard)
-        self.stats.draw(list(stats_counts), window_sec=STATS_WINDOW_SEC)
-        self.after(1000, self.refresh_stats)
+        self.engine.tick()
+        if self.state()!="iconic":
+            if str(self.nb.select())==str(self.frame_dash): self.refresh_chart()
+            self.refresh_diagnostics()
+
+    def refresh_chart(self):
+        span=self.stats_span.get()
+        self.stats.draw(self.engine.alert_rate.series(span,self.engine.clock()), span=span)
 
 # =============== MAIN ===============
 if __name__=="__main__":
     app=IDPSGUI()
-    if not admin_check():
-        messagebox.showwarning("Admin Required","Not running as Administrator.\nFirewall actions will fail.\nRight‑click Command Prompt → Run as administrator.")
     ensure_log()
     app.mainloop()
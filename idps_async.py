@@ -0,0 +1,386 @@
+# idps_async.py — the headless pipeline on one asyncio event loop
+#
+#   AsyncTailer --feed_text--> engine --alerts--> Queue(n) --> enrich workers --> AsyncFirewall
+#                                                 (held back     (AsyncGeo: limit     (one awaited subprocess
+#                                                  when full)     + timeout)           per batch)
+#   block deadlines: BlockScheduler's heap, woken by one timer task
+#
+# Tailers, workers, the firewall and the timer are tasks on a single loop
+# thread, so the thread count stays the same however many IPs attack: no
+# thread per alert, per block or per timer. A full alert queue stops the
+# tailers reading until the workers catch up. Other threads (Tk, signal
+# handlers, the shard pump) reach the loop only through Bridge.
+import asyncio, os, threading, time
+from collections import deque
+from idps_tail import Tailer, make_waiter, POLL_SECONDS
+from idps_geo import GeoCache, RangeDB, UNKNOWN, GEO_DB, GEO_TIMEOUT, IP_API_HOST, IP_API_PATH, parse_ip_api
+import idps_geo
+from idps_firewall import default_backend, FIREWALL_BATCH_SECONDS
+from idps_response import BlockScheduler, BLOCKS_STATE, BLOCKS_SAVE_EVERY, RESPONSE_WORKERS, RESPONSE_QUEUE, RESPONSE_PUT_TIMEOUT
+from idps_metrics import ENRICH_SECONDS, FIREWALL_SECONDS, gauge
+
+GEO_CONCURRENCY = 8                # online geo lookups in flight at once
+
+# ---- Bridge ----
+class Bridge:
+    """Owns the loop thread; the only way other threads touch the loop.
+
+    call() schedules a plain function on the loop and returns at once;
+    run() waits for a coroutine (or call_wait() for a function) and hands
+    back its result. The loop talks back to Tk the way the engine always
+    has: events land on the GUI's queue, which Tk drains with after().
+    """
+    def __init__(self, name="idps-loop"):
+        self.name=name; self.loop=None; self.thread=None; self.ident=None
+
+    def start(self):
+        ready=threading.Event()
+        def main():
+            self.loop=asyncio.new_event_loop(); asyncio.set_event_loop(self.loop)
+            self.ident=threading.get_ident(); ready.set()
+            try: self.loop.run_forever()
+            finally:
+                left=asyncio.all_tasks(self.loop)
+                for t in left: t.cancel()
+                self.loop.run_until_complete(asyncio.gather(*left,return_exceptions=True))
+                self.loop.close()
+        self.thread=threading.Thread(target=main,name=self.name,daemon=True); self.thread.start()
+        ready.wait(); return self
+
+    @property
+    def in_loop(self): return threading.get_ident()==self.ident
+
+    def call(self, fn, *args):
+        self.loop.call_soon_threadsafe(fn,*args)
+
+    def run(self, coro, timeout=None):
+        if self.in_loop: raise RuntimeError("Bridge.run() from the loop thread would deadlock")
+        return asyncio.run_coroutine_threadsafe(coro,self.loop).result(timeout)
+
+    def call_wait(self, fn, *args, timeout=None):
+        async def call(): return fn(*args)
+        return fn(*args) if self.in_loop else self.run(call(),timeout)
+
+    def stop(self, timeout=5.0):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+
+# ---- Tailing ----
+class AsyncTailer:
+    """Tailer driven by the loop: the inotify fd is watched with add_reader, otherwise it polls."""
+    def __init__(self, path, from_end=True, poll=POLL_SECONDS):
+        self.tailer=Tailer(path,from_end=from_end,poll=poll)
+
+    async def run(self, on_block):
+        """await on_block(text) for every new block until cancelled."""
+        t=self.tailer; loop=asyncio.get_running_loop(); woke=asyncio.Event()
+        waiter=make_waiter(t.path) if t.use_inotify else None
+        if waiter is not None:
+            try: loop.add_reader(waiter.fd,lambda: (waiter.drain(),woke.set()))
+            except NotImplementedError:        # e.g. the Windows proactor loop
+                waiter.close(); waiter=None
+        try:
+            while True:
+                woke.clear()
+                text=t.read_block()
+                if text:
+                    await on_block(text); continue
+                try: await asyncio.wait_for(woke.wait(),t.poll*5 if waiter is not None else t.poll)
+                except asyncio.TimeoutError: pass
+        finally:
+            if waiter is not None:
+                loop.remove_reader(waiter.fd); waiter.close()
+            t.close()
+
+# ---- Geo ----
+async def http_geo(ip):
+    """ip-api.com over a plain asyncio connection; same answers as HttpGeo."""
+    reader,writer=await asyncio.open_connection(IP_API_HOST,80)
+    try:
+        writer.write(f"GET {IP_API_PATH.format(ip=ip)} HTTP/1.0\r\nHost: {IP_API_HOST}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        data=await reader.read()
+    finally:
+        writer.close()
+    head,_,body=data.partition(b"\r\n\r\n")
+    if b" 200 " not in head.split(b"\r\n",1)[0]: return UNKNOWN
+    return parse_ip_api(body.decode())
+
+class AsyncGeo:
+    """Cache, then the offline DB inline, then at most `limit` online lookups of `timeout` seconds."""
+    def __init__(self, offline=None, online=True, limit=GEO_CONCURRENCY, timeout=GEO_TIMEOUT, fetch=http_geo, cache=None):
+        self.offline=offline; self.online=online; self.timeout=timeout; self.fetch=fetch
+        self.cache=cache or GeoCache(lambda ip: UNKNOWN)
+        self.limit=limit; self._sem=asyncio.Semaphore(limit)
+        self.timeouts=0; self.failures=0; self.active=0; self.active_max=0
+
+    async def __call__(self, ip):
+        if not idps_geo.GEOLOOKUP: return UNKNOWN
+        r=self.cache.get(ip)
+        if r is not None: return r
+        r=self.offline(ip) if self.offline is not None else UNKNOWN
+        if r==UNKNOWN and self.online:
+            async with self._sem:
+                self.active+=1; self.active_max=max(self.active_max,self.active)
+                try: r=await asyncio.wait_for(self.fetch(ip),self.timeout)
+                except asyncio.TimeoutError: self.timeouts+=1
+                except Exception: self.failures+=1          # no answer is just Unknown: the block goes ahead
+                finally: self.active-=1
+        self.cache.put(ip,r)
+        return r
+
+def make_async_geo(db_path=GEO_DB, online=True, limit=GEO_CONCURRENCY, timeout=GEO_TIMEOUT):
+    return AsyncGeo(RangeDB.open(db_path) if db_path and os.path.exists(db_path) else None,online,limit,timeout)
+
+# ---- Firewall ----
+class AsyncFirewall:
+    """BatchingFirewall on the loop: requests inside `interval` go out as one awaited call per op."""
+    def __init__(self, backend, interval=FIREWALL_BATCH_SECONDS, on_result=None):
+        self.backend=backend; self.interval=interval; self.on_result=on_result
+        self.name=backend.name; self.volatile=backend.volatile
+        self.pending={}                # ip -> "block" | "unblock"
+        self.batches=0; self.applied=0; self._kick=None
+
+    def block(self, ip): return self._queue(ip,"block")
+    def unblock(self, ip): return self._queue(ip,"unblock")
+
+    def _queue(self, ip, op):
+        self.pending[ip]=op
+        if self._kick is not None: self._kick.set()
+        return f"{op} queued ({self.name})"
+
+    async def run(self):
+        self._kick=asyncio.Event()
+        if self.pending: self._kick.set()
+        while True:
+            await self._kick.wait()
+            await asyncio.sleep(self.interval)     # let the window fill up
+            self._kick.clear()
+            await self.flush()
+
+    async def flush(self):
+        batch=self.pending; self.pending={}
+        for op in ("unblock","block"):
+            ips=[ip for ip,o in batch.items() if o==op]
+            if not ips: continue
+            t=time.perf_counter()
+            try: out=await self.backend.apply_async(op,ips); err=None
+            except Exception as e: out=""; err=str(e)
+            FIREWALL_SECONDS.since(t)
+            self.batches+=1; self.applied+=len(ips)
+            if self.on_result:
+                try: self.on_result(op,ips,out,err)
+                except Exception: pass
+
+    # operator actions, from any thread (same as calling the backend directly)
+    def list_rules(self): return self.backend.list_rules()
+    def cleanup(self):
+        self.pending={}
+        return self.backend.cleanup()
+
+# ---- Runtime ----
+class AsyncRuntime:
+    """Tail, enrich, block and expire on one loop thread.
+
+    Stands in for Responder plus tail threads: unblock(), forget_all(),
+    stats(), close() and .firewall work from any thread. follow(path)
+    starts a tailer task; alerts from other threads (ShardedIngest) are
+    handed over through the bridge and wait for queue room like the tailers.
+    """
+    def __init__(self, engine, geo=None, backend=None, workers=RESPONSE_WORKERS, queue_size=RESPONSE_QUEUE,
+                 put_timeout=RESPONSE_PUT_TIMEOUT, batch_interval=FIREWALL_BATCH_SECONDS,
+                 state_path=BLOCKS_STATE, save_every=BLOCKS_SAVE_EVERY):
+        self.engine=engine; self.geo=geo; self.workers=workers; self.queue_size=queue_size
+        self.put_timeout=put_timeout; self.save_every=save_every
+        self.firewall=AsyncFirewall(backend or default_backend(),batch_interval,on_result=self._fw_result)
+        self.scheduler=BlockScheduler(None,clock=engine.clock,path=state_path)   # heap + file only; the timer is a task here
+        self.bridge=Bridge()
+        self.alerts=None; self.inflight=set(); self._pending=[]; self._tails={}; self._tasks=[]
+        # metrics: changed on the loop thread only (submit and the workers run there), so no lock
+        self.queued=0; self.done=0; self.deduped=0; self.dropped=0; self.failed=0
+        self.queue_max=0; self.latencies=deque(maxlen=2048)
+
+    def start(self):
+        self.bridge.start()
+        self.bridge.run(self._setup())
+        self.engine.subscribe(self.on_event)
+        gauge("idps_response_queue_depth","Alerts waiting for a responder worker",lambda: self.alerts.qsize())
+        gauge("idps_tracked_ips","IPs with events in the sliding window",lambda: len(self.engine.fail_events)+len(self.engine.scan_events))
+        gauge("idps_blocked_ips","IPs currently blocked",lambda: len(self.engine.blocked_until))
+        return self
+
+    async def _setup(self):
+        if self.geo is None: self.geo=make_async_geo()
+        self.alerts=asyncio.Queue(self.queue_size); self._rearm=asyncio.Event()
+        spawn=asyncio.get_running_loop().create_task
+        self._tasks=[spawn(self._worker()) for _ in range(self.workers)]
+        self._tasks+=[spawn(self.firewall.run()),spawn(self._timer())]
+        self.restore()
+
+    def restore(self):
+        """Re-arm blocks saved by a previous run; lift the ones that ran out meanwhile."""
+        eng=self.engine; now=eng.clock(); n=0
+        saved=self.scheduler.load()
+        for ip,until in list(eng.blocked_until.items()): saved.setdefault(ip,until)   # from the state journal
+        for ip,until in saved.items():
+            if until>now:
+                eng.mark_blocked(ip,until); self.scheduler.schedule(ip,until); n+=1
+                if self.firewall.volatile: self.firewall.block(ip)
+            else:
+                self._expire(ip,until)
+        if n: eng.emit("log",f"Re-armed {n} saved blocks")
+        self._rearm.set()
+        return n
+
+    # ---- tailing ----
+    def follow(self, path, from_end=True):
+        """Start tailing `path` (any thread)."""
+        self.bridge.call_wait(self._follow,path,from_end)
+
+    def _follow(self, path, from_end):
+        if path in self._tails: return
+        self._tails[path]=asyncio.get_running_loop().create_task(self._tail(path,from_end))
+
+    async def _tail(self, path, from_end):
+        try:
+            await AsyncTailer(path,from_end).run(self._on_block)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.engine.emit("error",f"{path}: {e}")
+
+    async def _on_block(self, text):
+        self.engine.feed_text(text)
+        if self._pending:
+            todo=self._pending; self._pending=[]
+            for ip,typ in todo: await self.submit(ip,typ)        # waits for queue room: backpressure
+
+    def unfollow(self, path=None):
+        """Stop one tailer, or all of them (any thread)."""
+        def stop():
+            for p in ([path] if path else list(self._tails)):
+                t=self._tails.pop(p,None)
+                if t is not None: t.cancel()
+        self.bridge.call_wait(stop)
+
+    # ---- alerts ----
+    def on_event(self, ev):
+        if ev[0]!="alert": return
+        _,ip,ts,typ,cnt=ev
+        if self.bridge.in_loop: self._pending.append((ip,typ))     # submitted after the block: see _on_block
+        else:
+            try: self.bridge.run(self.submit(ip,typ))
+            except RuntimeError: pass                               # loop already stopped
+
+    async def submit(self, ip, typ):
+        eng=self.engine; until=eng.blocked_until.get(ip)
+        if (until is not None and until>eng.clock()) or ip in self.inflight:
+            self.deduped+=1; return False
+        self.inflight.add(ip)
+        try:
+            await asyncio.wait_for(self.alerts.put((ip,typ,time.perf_counter())),self.put_timeout)
+        except asyncio.TimeoutError:
+            self.inflight.discard(ip); self.dropped+=1
+            eng.emit("error",f"response queue full — dropped alert for {ip}")
+            return False
+        self.queued+=1; self.queue_max=max(self.queue_max,self.alerts.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            ip,typ,t0=await self.alerts.get()
+            try:
+                await self.enrich_and_act(ip,typ)
+            except Exception as e:
+                self.failed+=1; self.engine.emit("error",f"block for {ip}: {e}")
+            finally:
+                self.inflight.discard(ip); self.done+=1
+                self.latencies.append(time.perf_counter()-t0)
+
+    async def enrich_and_act(self, ip, typ):
+        t=time.perf_counter(); eng=self.engine
+        try: label,lat,lon=await self.geo(ip.partition("/")[0])
+        except Exception as e: label,lat,lon=UNKNOWN; eng.emit("error",f"geo lookup for {ip}: {e}")
+        ENRICH_SECONDS.since(t)
+        eng.emit("enrich",ip,label,lat,lon,typ)
+        why=eng.may_block(ip)
+        if why=="whitelisted":
+            eng.emit("log",f"Skipped block (whitelisted): {ip}"); return
+        if why:
+            eng.emit("log",f"Protect Mode OFF — alert only (no block) for {ip}"); return
+        resp=self.firewall.block(ip)
+        ts=eng.clock(); until=ts+eng.block_seconds
+        eng.mark_blocked(ip,until); self.scheduler.schedule(ip,until); self._rearm.set()
+        eng.emit("blocked",ip,ts,until,resp)
+
+    def adopt(self, ip, until, origin):
+        """A peer's block (any thread): no geo lookup, the same checks and expiry as our own blocks."""
+        def go():
+            eng=self.engine
+            if eng.may_block(ip): return False
+            resp=self.firewall.block(ip)
+            eng.mark_blocked(ip,until); self.scheduler.schedule(ip,until); self._rearm.set()
+            eng.emit("blocked",ip,eng.clock(),until,f"{resp} (from peer {origin})")
+            return True
+        return self.bridge.call_wait(go)
+
+    # ---- expiry ----
+    async def _timer(self):
+        sch=self.scheduler; clock=self.engine.clock; last_save=time.monotonic()
+        while True:
+            nxt=sch.next_deadline(); wait=self.save_every
+            if nxt is not None: wait=min(wait,max(0.0,nxt-clock()))
+            self._rearm.clear()
+            try: await asyncio.wait_for(self._rearm.wait(),wait)
+            except asyncio.TimeoutError: pass
+            for ip,until in sch.due(clock()): self._expire(ip,until)
+            if sch.dirty and time.monotonic()-last_save>=self.save_every:
+                sch.save(); last_save=time.monotonic()
+
+    def _expire(self, ip, until):
+        self.firewall.unblock(ip); self.engine.mark_unblocked(ip,until)
+        self.engine.emit("unblocked",ip,self.engine.clock())
+
+    def _fw_result(self, op, ips, out, err):
+        if err: self.engine.emit("error",f"firewall {op} of {len(ips)} IP(s) failed: {err}")
+        elif len(ips)>1: self.engine.emit("log",f"Firewall {op}: {len(ips)} IPs in one batch")
+
+    # ---- operator actions (any thread) ----
+    def unblock(self, ip):
+        """Operator-requested unblock; returns the firewall output."""
+        def go():
+            self.scheduler.cancel(ip); resp=self.firewall.unblock(ip)
+            if self.engine.mark_unblocked(ip): self.engine.emit("unblocked",ip,self.engine.clock())
+            return resp
+        return self.bridge.call_wait(go)
+
+    def forget_all(self):
+        """After the firewall rules were wiped wholesale."""
+        def go():
+            self.scheduler.clear()
+            self.engine.unblock_all()
+        self.bridge.call_wait(go)
+
+    def stats(self):
+        lat=sorted(self.latencies)
+        pct=lambda p: round(lat[min(len(lat)-1,int(p*len(lat)))]*1e3,2) if lat else None
+        return {"workers":self.workers,"queue_depth":self.alerts.qsize() if self.alerts else 0,"queue_max":self.queue_max,
+                "inflight":len(self.inflight),"queued":self.queued,"done":self.done,
+                "deduped":self.deduped,"dropped":self.dropped,"failed":self.failed,
+                "geo_timeouts":getattr(self.geo,"timeouts",0),"tails":len(self._tails),
+                "latency_ms_p50":pct(0.5),"latency_ms_p95":pct(0.95),"latency_ms_max":pct(1.0)}
+
+    def close(self, wait=True):
+        """Stop tailers and tasks, apply what the firewall still holds, save deadlines."""
+        self.engine.unsubscribe(self.on_event)
+        async def shutdown():
+            for t in list(self._tails.values())+self._tasks: t.cancel()
+            await asyncio.gather(*self._tails.values(),*self._tasks,return_exceptions=True)
+            self._tails.clear(); self._tasks=[]
+            await self.firewall.flush()
+        try: self.bridge.run(shutdown(),timeout=10 if wait else 2)
+        except Exception: pass
+        self.scheduler.save()
+        self.bridge.stop()
+        self.firewall.backend.close()
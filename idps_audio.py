@@ -0,0 +1,87 @@
+# idps_audio.py — the alarm siren
+#
+# The siren wav is synthesized in one pass into an array and cached on disk
+# under a name derived from its parameters, so it is made once per machine
+# (and again only if the parameters change), and only when the alarm first
+# sounds. The platform sound module (winsound) is imported on first use;
+# where there is none the siren is silent and the banner alone signals.
+import hashlib, math, os, sys, tempfile, threading, time, wave
+from array import array
+
+ALARM_WAV = "alarm.wav"            # used as-is if present
+ASSET_CACHE = os.environ.get("IDPS_CACHE") or os.path.join(os.path.expanduser("~"),".cache","idps")
+SIREN = {"duration":3.0,"sr":44100,"f1":800.0,"f2":1400.0,"amp":32767//3}
+
+def siren_samples(duration=3.0, sr=44100, f1=800.0, f2=1400.0, amp=32767//3):
+    """16-bit mono sweep f1 -> f2 -> f1 over `duration` seconds.
+
+    The frequency is linear in each half, so the phase is a quadratic in the
+    sample index: one multiply-add and a sin() per sample, no per-sample pack."""
+    n=int(duration*sr); sin=math.sin; k=2*math.pi/sr; df=f2-f1; h=-(-n//2)
+    a_up=k*f1; a_down=k*(f1+2*df); b=k*2*df/n
+    return array("h",[int(amp*sin((a_up+b*i)*i)) for i in range(h)]+
+                     [int(amp*sin((a_down-b*i)*i)) for i in range(h,n)])
+
+def write_wav(path, samples, sr):
+    if sys.byteorder=="big": samples=array("h",samples); samples.byteswap()
+    with wave.open(path,"wb") as wf:
+        wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(sr)
+        wf.writeframes(samples.tobytes())
+
+def cached_asset(name, params, make, ext=".wav"):
+    """Path of `name` built by make(path, **params), reusing an earlier build with the same params."""
+    tag=hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:12]
+    path=os.path.join(ASSET_CACHE,f"{name}-{tag}{ext}")
+    if not os.path.exists(path):
+        os.makedirs(ASSET_CACHE,exist_ok=True)
+        fd,tmp=tempfile.mkstemp(dir=ASSET_CACHE,suffix=ext); os.close(fd)
+        try:
+            make(tmp,**params); os.replace(tmp,path)      # readers never see a half-written file
+        finally:
+            if os.path.exists(tmp): os.unlink(tmp)
+    return path
+
+def generate_siren_wav(path, duration=3.0, sr=44100, f1=800.0, f2=1400.0, amp=32767//3):
+    write_wav(path,siren_samples(duration,sr,f1,f2,amp),sr)
+
+def siren_path():
+    if os.path.exists(ALARM_WAV): return ALARM_WAV
+    try: return cached_asset("siren",SIREN,generate_siren_wav)
+    except OSError: return None
+
+def _winsound():
+    try: import winsound
+    except ImportError: return None
+    return winsound
+
+class Siren:
+    """start()/stop() a looping alarm on a background thread; a no-op without a sound backend."""
+    def __init__(self):
+        self.playing=False; self._ws=False     # False = backend not looked up yet
+
+    def backend(self):
+        if self._ws is False: self._ws=_winsound()
+        return self._ws
+
+    def start(self):
+        if self.playing: return
+        self.playing=True
+        threading.Thread(target=self._loop,name="idps-siren",daemon=True).start()
+
+    def _loop(self):
+        ws=self.backend()
+        if ws is None: return
+        path=siren_path()
+        if path and self.playing:
+            ws.PlaySound(path,ws.SND_ASYNC|ws.SND_LOOP|ws.SND_FILENAME)
+            return
+        while self.playing:
+            ws.Beep(980,300); time.sleep(0.1); ws.Beep(1200,300); time.sleep(0.15)
+
+    def stop(self):
+        if not self.playing: return
+        self.playing=False
+        ws=self.backend()
+        if ws is not None:
+            try: ws.PlaySound(None,0)
+            except RuntimeError: pass
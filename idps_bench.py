@@ -0,0 +1,1009 @@
+# idps_bench.py — micro-benchmarks for the detection hot path
+#   python idps_bench.py window --ips 10000 100000 1000000
+#   python idps_bench.py classify --lines 1000000 --hit-ratio 0.02
+#   python idps_bench.py tail --lines 500000 --rotate-every 50000
+#   python idps_bench.py geo --ranges 1000000
+#   python idps_bench.py blocks --ips 100000
+#   python idps_bench.py firewall --ips 5000 --call-ms 50
+#   python idps_bench.py ui --rate 50000 --ips 2000
+#   python idps_bench.py map --ips 500 5000 20000
+#   python idps_bench.py startup --runs 5       (add --gui for the Tk console; needs a display)
+#   python idps_bench.py idle --gui IDPS_before.py IDPS.py   (needs a display; git show <rev>:IDPS.py > IDPS_before.py)
+#   python idps_bench.py shard --lines 2000000 --procs 1 2 4
+#   python idps_bench.py iplist --ranges 50000
+#   python idps_bench.py memory --ips 200000 --per-ip 1 3 10
+#   python idps_bench.py sketch --ips 20000 100000 --widths 1024 4096 16384 --hll-p 6 8
+#   python idps_bench.py peer --nodes 4 --rounds 200       (block propagation across local instances; --multicast)
+#   python idps_bench.py async --ips 100 1000 5000 --geo-ms 200
+#   python idps_bench.py store --rows 2000000
+#   python idps_bench.py suite --out bench.json      (parse, latency, memory; JSON for regression tracking)
+import argparse, os, random, re, shutil, sys, tempfile, threading, time, json, tracemalloc
+from collections import deque
+from idps_tail import Tailer
+from idps_geo import RangeDB, GeoCache
+from idps_response import BlockScheduler, Responder
+from idps_loadgen import LoadGen, fail_line
+from idps_firewall import BatchingFirewall, RecordingBackend, default_backend
+from idps_model import EventTable, MapModel
+from idps_shard import scan_file, unpack_hits
+from idps_iplist import IPList
+from idps_async import AsyncRuntime, AsyncGeo
+from idps_store import EventStore
+from idps_peer import PeerSync
+from idps_sketch import SubnetDetector, mix64, subnet_levels
+from idps_engine import DetectionEngine, WindowCounter, ip_key, WINDOW_SECONDS, FAIL_RE, SCAN_RE, Classifier, DEFAULT_SIGNATURES, EXTRA_SIGNATURES, IP_PATTERN
+
+def rand_ips(n, seed=1):
+    rnd=random.Random(seed); seen=set()
+    while len(seen)<n:
+        seen.add(f"{rnd.randint(1,223)}.{rnd.randint(0,255)}.{rnd.randint(0,255)}.{rnd.randint(1,254)}")
+    return list(seen)
+
+# ---- window: per-IP counters vs. the old linear deque scan ----
+def legacy_window(events, ips, t0, dt):
+    # what tail_worker did before WindowCounter: append, gc, full scan
+    t=t0; t_start=time.perf_counter()
+    for ip in ips:
+        t+=dt; events.append((t,ip))
+        cutoff=t-WINDOW_SECONDS
+        while events and events[0][0]<cutoff: events.popleft()
+        sum(1 for ts,x in events if x==ip and ts>=cutoff)
+    return len(ips)/(time.perf_counter()-t_start)
+
+def counter_window(wc, ips, t0, dt):
+    t=t0; t_start=time.perf_counter()
+    for ip in ips:
+        t+=dt; wc.add(ip,t); wc.sweep(t)
+    return len(ips)/(time.perf_counter()-t_start)
+
+def bench_window(args):
+    results=[]
+    for n in args.ips:
+        ips=rand_ips(n)
+        # steady state: every IP already has one event inside the window
+        dt=WINDOW_SECONDS/(n*4)
+        wc=WindowCounter(WINDOW_SECONDS); legacy=deque(); t=0.0
+        for ip in ips:
+            t+=dt; wc.add(ip,t); legacy.append((t,ip))
+        rnd=random.Random(2)
+        stream=[ips[rnd.randrange(n)] for _ in range(args.lines)]
+        new_rate=counter_window(wc, stream, t, dt)
+        old_rate=legacy_window(legacy, stream[:args.legacy_lines], t, dt) if args.legacy_lines else None
+        row={"distinct_ips":n,"lines":args.lines,"counter_lines_per_sec":round(new_rate),
+             "legacy_lines_per_sec":round(old_rate) if old_rate else None,"tracked_ips":len(wc)}
+        results.append(row)
+        print(f"{n:>9} IPs  counter {new_rate:>12,.0f} lines/s" +
+              (f"   legacy {old_rate:>10,.0f} lines/s  (x{new_rate/old_rate:,.0f})" if old_rate else ""))
+    if args.json: print(json.dumps(results,indent=2))
+
+# ---- classify: literal prefilter + one combined pattern vs. two searches ----
+NOISE = [
+    "{d} host sshd[{p}]: Accepted publickey for deploy from {ip} port {port} ssh2",
+    "{d} host CRON[{p}]: pam_unix(cron:session): session opened for user root by (uid=0)",
+    "{d} host sudo:   admin : TTY=pts/0 ; PWD=/home/admin ; USER=root ; COMMAND=/usr/bin/apt update",
+    "{d} host systemd-logind[{p}]: New session {p} of user deploy.",
+    "{d} host sshd[{p}]: Connection closed by {ip} port {port} [preauth]",
+    "{d} host kernel: [UFW BLOCK] IN=eth0 OUT= SRC={ip} DST=10.0.0.5 PROTO=TCP SPT={port} DPT=23",
+]
+HITS = [
+    "{d} host sshd[{p}]: Failed password for invalid user test from {ip} port {port} ssh2",
+    "{d} Port scan (SYN burst) from {ip}",
+]
+
+def mixed_log(n, hit_ratio, seed=3):
+    rnd=random.Random(seed); ips=rand_ips(5000,seed); out=[]
+    for i in range(n):
+        tpl=rnd.choice(HITS) if rnd.random()<hit_ratio else rnd.choice(NOISE)
+        out.append(tpl.format(d="Oct 18 06:25:%02d"%(i%60),p=rnd.randint(100,65000),
+                              ip=rnd.choice(ips),port=rnd.randint(1024,65535))+"\n")
+    return out
+
+def bench_classify(args):
+    lines=mixed_log(args.lines, args.hit_ratio); n=len(lines)
+    sigs=DEFAULT_SIGNATURES+(list(EXTRA_SIGNATURES.values()) if args.extra else [])
+    # the old way: FAIL_RE/SCAN_RE, plus one more full search per extra signature
+    regexes=[FAIL_RE,SCAN_RE]+[re.compile(pat.replace("{ip}",f"({IP_PATTERN})"),re.M)
+                               for _,_,pat in sigs[len(DEFAULT_SIGNATURES):]]
+    def legacy():
+        hits=0
+        for line in lines:
+            ms=[rx.search(line) for rx in regexes]
+            if any(ms): hits+=1
+        return hits
+    clf=Classifier(sigs)
+    def per_line():
+        classify=clf.classify
+        return sum(1 for line in lines if classify(line) is not None)
+    text="".join(lines)
+    def block():
+        return len(clf.scan(text))
+    results={"lines":n,"hit_ratio":args.hit_ratio,"signatures":len(sigs)}
+    for name,fn in (("legacy_per_regex",legacy),("classifier_per_line",per_line),("classifier_block",block)):
+        best=None
+        for _ in range(args.repeat):
+            t=time.perf_counter(); hits=fn(); dt=time.perf_counter()-t
+            best=dt if best is None else min(best,dt)
+        results[name]={"ns_per_line":round(best*1e9/n,1),"hits":hits}
+        print(f"{name:<22} {best*1e9/n:>8.1f} ns/line   hits={hits}")
+    if args.json: print(json.dumps(results,indent=2))
+
+# ---- tail: throughput with rotation under load (correctness: tests/test_tail.py) ----
+def tail_scenario(mode, n, every, batch, use_inotify):
+    d=tempfile.mkdtemp(prefix="idps_tail_"); path=os.path.join(d,"auth.log")
+    open(path,"w").close()
+    got=[]; stop=threading.Event()
+    tailer=Tailer(path,from_end=False,use_inotify=use_inotify)
+    def on_block(text):
+        got.extend(int(ln[:ln.index(" ")]) for ln in text.splitlines())
+    reader=threading.Thread(target=tailer.run,args=(on_block,stop),daemon=True); reader.start()
+    while tailer.fd is None: time.sleep(0.001)        # it has to be following the file before the first line
+    pad=" sshd[4242]: Failed password for invalid user test from 198.51.100.23 port 52113 ssh2\n"
+    def open_log(): return os.open(path,os.O_WRONLY|os.O_APPEND|os.O_CREAT)
+    def caught_up(k, timeout=10):
+        t_end=time.time()+timeout
+        while len(got)<k and time.time()<t_end: time.sleep(0.0005)
+    fd=open_log(); t0=time.perf_counter(); i=0
+    while i<n:
+        k=min(batch,n-i)
+        os.write(fd,"".join(f"{j}{pad}" for j in range(i,i+k)).encode())
+        i+=k
+        if i<n and i%every<k:
+            if mode=="rename":         # no waiting: the old file still holds lines the reader has not seen
+                os.close(fd); os.replace(path,f"{path}.{i}"); fd=open_log()
+            else:
+                caught_up(i)           # truncation only keeps what the reader already has
+                if mode=="copytruncate": shutil.copyfile(path,path+".1")
+                os.truncate(path,0)
+    os.close(fd)
+    caught_up(n); dt=time.perf_counter()-t0
+    stop.set(); reader.join(2)
+    shutil.rmtree(d,ignore_errors=True)
+    lost=len(set(range(n))-set(got)); repeated=len(got)-len(set(got))
+    # generations rotated within one clock tick share an mtime: their order is a guess, their lines are not
+    return {"mode":mode,"lines":n,"received":len(got),"lost":lost,"repeated":repeated,
+            "ok":not lost and not repeated,"in_order":got==list(range(n)),"lines_per_sec":round(n/dt),
+            "rotations":tailer.rotations,"truncations":tailer.truncations,"inotify":use_inotify}
+
+def bench_tail(args):
+    results=[]
+    for mode in args.modes:
+        r=tail_scenario(mode,args.lines,args.rotate_every,args.batch,not args.poll)
+        results.append(r)
+        print(f"{mode:<13} {'OK  ' if r['ok'] else 'FAIL'} {r['lines_per_sec']:>10,} lines/s  "
+              f"lost={r['lost']} repeated={r['repeated']} rotations={r['rotations']} truncations={r['truncations']}"
+              f"{'' if r['in_order'] else '  (some generations out of order)'}")
+    if args.json: print(json.dumps(results,indent=2))
+
+# ---- geo: offline range DB build/load/lookup + cache ----
+def bench_geo(args):
+    d=tempfile.mkdtemp(prefix="idps_geo_"); csv_path=os.path.join(d,"geoip.csv")
+    rnd=random.Random(5); step=(1<<32)//args.ranges
+    with open(csv_path,"w") as fp:
+        fp.write("start_ip,end_ip,country,city,lat,lon\n")
+        for i in range(args.ranges):
+            s=i*step; e=s+step-1
+            fp.write(f"{s},{e},C{i%250},City{i%5000},{rnd.uniform(-60,70):.3f},{rnd.uniform(-180,180):.3f}\n")
+    res={"ranges":args.ranges}
+    t=time.perf_counter(); RangeDB.open(csv_path); res["compile_sec"]=round(time.perf_counter()-t,3)
+    t=time.perf_counter(); db=RangeDB.open(csv_path); res["load_sec"]=round(time.perf_counter()-t,4)
+    ips=[f"{rnd.randint(1,223)}.{rnd.randint(0,255)}.{rnd.randint(0,255)}.{rnd.randint(1,254)}" for _ in range(args.lookups)]
+    t=time.perf_counter()
+    for ip in ips: db(ip)
+    res["lookup_us"]=round((time.perf_counter()-t)*1e6/len(ips),2)
+    cache=GeoCache(db,size=len(ips)); [cache(ip) for ip in ips]
+    t=time.perf_counter()
+    for ip in ips: cache(ip)
+    res["cache_hit_us"]=round((time.perf_counter()-t)*1e6/len(ips),2)
+    shutil.rmtree(d,ignore_errors=True)
+    print(f"{args.ranges:,} ranges: compile {res['compile_sec']}s, load {res['load_sec']*1e3:.1f} ms, "
+          f"lookup {res['lookup_us']} us, cached {res['cache_hit_us']} us")
+    if args.json: print(json.dumps(res,indent=2))
+
+# ---- blocks: one timer thread for any number of blocks (correctness: tests/test_response.py) ----
+def bench_blocks(args):
+    n=args.ips; ips=rand_ips(n); expired=[]; done=threading.Event()
+    d=tempfile.mkdtemp(prefix="idps_blocks_"); path=os.path.join(d,"blocks.json")
+    def on_expire(ip,deadline):
+        expired.append(ip)
+        if len(expired)>=n: done.set()
+    threads0=threading.active_count()
+    tracemalloc.start()
+    sch=BlockScheduler(on_expire,path=path).start()
+    now=time.time(); res={"ips":n}
+    t=time.perf_counter()
+    for i,ip in enumerate(ips): sch.schedule(ip,now+3600+i)
+    res["schedule_us"]=round((time.perf_counter()-t)*1e6/n,2)
+    res["threads_added"]=threading.active_count()-threads0
+    t=time.perf_counter()
+    for ip in ips: sch.schedule(ip,now+7200)
+    res["extend_us"]=round((time.perf_counter()-t)*1e6/n,2)
+    res["heap_entries"]=len(sch._heap)
+    t=time.perf_counter(); sch.save(); res["save_ms"]=round((time.perf_counter()-t)*1e3,1)
+    t=time.perf_counter(); saved=sch.load(); res["load_ms"]=round((time.perf_counter()-t)*1e3,1)
+    res["mem_mb"]=round(tracemalloc.get_traced_memory()[0]/1e6,1)
+    # bring every deadline forward so the single thread has to fire them all
+    now=time.time()
+    for i,ip in enumerate(ips): sch.schedule(ip,now+0.5+i/n)
+    ok=done.wait(30)
+    res["expire_all_sec"]=round(time.time()-now,2)   # last deadline is now+1.5s
+    res["expired"]=len(expired); res["threads_added_after"]=threading.active_count()-threads0
+    res["mem_mb_after"]=round(tracemalloc.get_traced_memory()[0]/1e6,1)
+    tracemalloc.stop(); sch.stop(); shutil.rmtree(d,ignore_errors=True)
+    res["ok"]=ok and len(set(expired))==n and len(saved)==n and res["threads_added_after"]<=1
+    print(f"{n:,} blocks: +{res['threads_added_after']} thread(s), schedule {res['schedule_us']} us, "
+          f"extend {res['extend_us']} us, save {res['save_ms']} ms, {res['mem_mb']} MB -> {res['mem_mb_after']} MB, "
+          f"expired {res['expired']:,} in {res['expire_all_sec']}s  {'OK' if res['ok'] else 'FAIL'}")
+    if args.json: print(json.dumps(res,indent=2))
+
+# ---- firewall: block/unblock ops per second, per call vs. batched ----
+def bench_firewall(args):
+    ips=rand_ips(args.ips); res={"ips":args.ips,"backend":args.backend,"call_ms":args.call_ms}
+    def backend():
+        return RecordingBackend(delay=args.call_ms/1e3) if args.backend=="dry-run" else default_backend(args.backend)
+    # one call per IP (the old way); a sample is enough to get the rate
+    be=backend(); sample=ips[:args.unbatched]
+    t=time.perf_counter()
+    for ip in sample: be.block(ip)
+    for ip in sample: be.unblock(ip)
+    res["unbatched_ops_per_sec"]=round(2*len(sample)/(time.perf_counter()-t))
+    be.cleanup()
+    # coalesced
+    be=backend(); fw=BatchingFirewall(be,interval=args.batch_ms/1e3)
+    t=time.perf_counter()
+    for ip in ips: fw.block(ip)
+    while fw.applied<len(ips): time.sleep(0.001)
+    for ip in ips: fw.unblock(ip)
+    while fw.applied<2*len(ips): time.sleep(0.001)
+    res["batched_ops_per_sec"]=round(2*len(ips)/(time.perf_counter()-t)); res["batches"]=fw.batches
+    fw.close(); be.cleanup()
+    print(f"{args.backend}: per-IP calls {res['unbatched_ops_per_sec']:,} ops/s, "
+          f"batched {res['batched_ops_per_sec']:,} ops/s ({res['batches']} batches for {2*len(ips):,} ops)")
+    if args.json: print(json.dumps(res,indent=2))
+
+# ---- ui: table model under a burst, widget calls per tick (no display needed) ----
+def bench_ui(args):
+    ips=rand_ips(args.ips); per_tick=int(args.rate*args.tick_ms/1e3)
+    evs=[(random.choice(ips),random.choice(("FAILED_LOGIN","PORT_SCAN"))) for _ in range(per_tick)]
+    tbl=EventTable(args.rows); ops=[0]; iids=iter(range(1<<62))
+    def ins(vals): ops[0]+=1; return next(iids)
+    def upd(iid,vals): ops[0]+=1
+    def dele(iid): ops[0]+=1
+    t_model=t_sync=0.0; ts=time.time(); cnt=0
+    for _ in range(args.ticks):
+        t=time.perf_counter()
+        for ip,typ in evs:
+            cnt+=1; tbl.hit(ip,typ,ts,cnt)
+        for ip in ips[:per_tick//100]: tbl.enrich(ip,"Somewhere","BLOCKED")
+        t2=time.perf_counter(); tbl.sync(ins,upd,dele); t_sync+=time.perf_counter()-t2
+        t_model+=t2-t
+    n=per_tick*args.ticks; ms=lambda x: round(x/args.ticks*1e3,2)
+    res={"events_per_tick":per_tick,"ticks":args.ticks,"rows":len(tbl),
+         "model_ms_per_tick":ms(t_model),"sync_calls_per_tick":round(ops[0]/args.ticks),
+         "widget_calls_before":per_tick,"events_per_sec":round(n/(t_model+t_sync))}
+    print(f"{per_tick:,} events/tick -> {res['sync_calls_per_tick']:,} widget calls "
+          f"(was {per_tick:,}); model {res['model_ms_per_tick']} ms/tick, {res['events_per_sec']:,} events/s")
+    if args.json: print(json.dumps(res,indent=2))
+
+def bench_map(args):
+    """Attack-map model under geolocated alerts: widget calls per frame and canvas items kept,
+    on virtual time (frame_ms apart) so the numbers don't depend on a display."""
+    rnd=random.Random(1)
+    cities=[(f"City{i}, C{i%60}",rnd.uniform(-170,170),rnd.uniform(-60,70)) for i in range(args.cities)]
+    results=[]
+    for n in args.ips:
+        for mode in args.modes:
+            m=MapModel(820,410,mode=mode,max_clusters=args.max_clusters); made=[0]; calls=[0]
+            def draw(c, r):
+                if c.items is None: c.items=(made[0],made[0]+1); made[0]+=2
+                calls[0]+=2
+            per_frame=max(1,round(args.rate*args.frame_ms/1e3)); now=0.0; frames=0; worst=0.0; spent=0.0; i=0
+            while i<n:
+                t=time.perf_counter()
+                for _ in range(min(per_frame,n-i)):
+                    label,lon,lat=cities[rnd.randrange(len(cities))]
+                    m.add(lon+rnd.uniform(-2,2),lat+rnd.uniform(-2,2),label,now); i+=1
+                m.frame(now,draw); d=time.perf_counter()-t
+                spent+=d; worst=max(worst,d); frames+=1; now+=args.frame_ms/1e3
+            while m.busy:
+                m.frame(now,draw); frames+=1; now+=args.frame_ms/1e3
+            row={"attackers":n,"mode":mode,"clusters":len(m),"canvas_items":made[0],"evicted":m.evicted,
+                 "frames":frames,"widget_calls_per_frame":round(calls[0]/frames,1),
+                 "frame_ms_avg":round(spent/max(1,frames)*1e3,3),"frame_ms_max":round(worst*1e3,3),
+                 "items_before":2*n,"threads_before":n}
+            results.append(row)
+            print(f"{n:>6} attackers ({mode:>7}): {row['clusters']} dots, {row['canvas_items']} canvas items "
+                  f"(was {2*n:,} items + {n:,} threads); {row['widget_calls_per_frame']} widget calls/frame, "
+                  f"model {row['frame_ms_avg']} ms/frame (max {row['frame_ms_max']})")
+    if args.json: print(json.dumps(results,indent=2))
+
+IDLE_CHILD = r"""
+import importlib.util, json, os, sys, time
+path,repo,warm,secs,low=sys.argv[1],sys.argv[2],float(sys.argv[3]),float(sys.argv[4]),sys.argv[5]=="1"
+sys.path.insert(0,repo)
+spec=importlib.util.spec_from_file_location("idps_gui_under_test",path); gui=importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gui)
+app=gui.IDPSGUI(); mark={}
+if low:
+    if not hasattr(app,"low_power"): print(json.dumps(None)); sys.exit()
+    app.low_power.set(True); app.on_toggle_low_power()
+def start(): mark["cpu"]=time.process_time(); mark["wall"]=time.perf_counter()
+def stop():
+    cpu=time.process_time()-mark["cpu"]; wall=time.perf_counter()-mark["wall"]
+    print(json.dumps({"cpu_percent":round(100*cpu/wall,2),"cpu_seconds":round(cpu,3),"seconds":round(wall,1)}),flush=True)
+    app.on_close()
+app.after(int(warm*1000),start); app.after(int((warm+secs)*1000),stop)
+app.mainloop()
+"""
+
+def bench_idle(args):
+    """Whole-process CPU of the GUI sitting idle (no log traffic), per GUI file and mode."""
+    import subprocess
+    repo=os.path.dirname(os.path.abspath(__file__)); results=[]
+    for path in args.gui:
+        for mode in args.modes:
+            d=tempfile.mkdtemp(prefix="idps_idle_")
+            try:
+                r=subprocess.run([sys.executable,"-c",IDLE_CHILD,os.path.abspath(path),repo,str(args.warmup),
+                                  str(args.seconds),"1" if mode=="low-power" else "0"],
+                                 cwd=d,stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True,timeout=args.seconds+args.warmup+60)
+            finally:
+                shutil.rmtree(d,ignore_errors=True)
+            lines=r.stdout.strip().splitlines()
+            if r.returncode or not lines:
+                print(f"{path} ({mode}): failed: {r.stderr.strip().splitlines()[-1:] or r.returncode}", file=sys.stderr); continue
+            row=json.loads(lines[-1])
+            if row is None:
+                print(f"{path} ({mode}): no low-power mode"); continue
+            row.update(gui=path,mode=mode); results.append(row)
+            print(f"{path} ({mode}): {row['cpu_percent']}% CPU idle over {row['seconds']}s")
+    if args.json: print(json.dumps(results,indent=2))
+
+STARTUP_CHILD = r"""
+import json, os, sys, time
+t_spawn,repo,log=float(sys.argv[1]),sys.argv[2],sys.argv[3]
+sys.path.insert(0,repo); sys.argv=[sys.argv[0]]
+import IDPS
+t_import=time.time()
+app=IDPS.IDPSGUI(); t_built=time.time(); out={}
+app.engine.subscribe(lambda ev: out.setdefault("alert",time.time()) if ev[0]=="alert" else None)
+def painted():
+    out["paint"]=time.time(); app.log_path.set(log); app.start_monitor()
+def feed():
+    if "alert" in out:
+        print(json.dumps({k:round(v-t_spawn,4) for k,v in
+                          {"import":t_import,"built":t_built,"first_paint":out["paint"],"first_detection":out["alert"]}.items()}),flush=True)
+        app.on_close(); return
+    with open(log,"a") as fp: fp.write("Failed password for root from 198.51.100.77 port 22 ssh2\n")
+    app.after(20,feed)
+app.after_idle(lambda: app.after(0,painted)); app.after(50,feed)
+app.mainloop()
+"""
+
+def siren_legacy(duration=3, sr=44100):
+    """The per-sample struct.pack + writeframesraw generator the GUI used before idps_audio."""
+    import io, math, struct, wave
+    n=int(duration*sr); amp=32767//3; f1,f2=800.0,1400.0
+    with wave.open(io.BytesIO(),"w") as wf:
+        wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(sr)
+        for i in range(n):
+            t=i/sr; phase=(t/duration)%1.0
+            frac=phase*2 if phase<0.5 else (2-phase*2)
+            wf.writeframesraw(struct.pack("<h",int(amp*math.sin(2*math.pi*(f1+(f2-f1)*frac)*t))))
+
+def bench_startup(args):
+    """Time to first detection: process spawn -> first alert for a line written to the log."""
+    import subprocess, idps_audio
+    repo=os.path.dirname(os.path.abspath(__file__)); res={}
+    d=tempfile.mkdtemp(prefix="idps_startup_")
+    try:
+        t=time.perf_counter(); siren_legacy(); legacy=time.perf_counter()-t
+        idps_audio.ASSET_CACHE=os.path.join(d,"cache")
+        t=time.perf_counter(); idps_audio.cached_asset("siren",idps_audio.SIREN,idps_audio.generate_siren_wav); cold=time.perf_counter()-t
+        t=time.perf_counter(); idps_audio.cached_asset("siren",idps_audio.SIREN,idps_audio.generate_siren_wav); warm=time.perf_counter()-t
+        res["siren_ms"]={"legacy_generate":round(legacy*1e3,1),"generate_and_cache":round(cold*1e3,1),"cached":round(warm*1e3,3)}
+        print(f"siren wav: legacy {res['siren_ms']['legacy_generate']} ms, array synthesis + cache "
+              f"{res['siren_ms']['generate_and_cache']} ms, cached {res['siren_ms']['cached']} ms (and only when the alarm first sounds)")
+        runs=[]
+        for i in range(args.runs):
+            log=os.path.join(d,f"auth{i}.log"); open(log,"w").close()
+            t0=time.perf_counter()
+            p=subprocess.Popen([sys.executable,os.path.join(repo,"idpsd.py"),"--log",log,"--threshold","1","--firewall","dry-run",
+                                "--no-online-geo","--state","","--blocks-file","","--store",""],
+                               cwd=d,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,text=True)
+            stop=threading.Event()
+            def writer():
+                while not stop.wait(0.02):
+                    with open(log,"a") as fp: fp.write("Failed password for root from 198.51.100.77 port 22 ssh2\n")
+            th=threading.Thread(target=writer,daemon=True); th.start()
+            for line in p.stdout:
+                if "ALERT" in line: break
+            runs.append(time.perf_counter()-t0)
+            stop.set(); p.terminate(); p.wait(10); th.join()
+        res["daemon_first_detection_ms"]={"p50":pct(runs,.5),"max":pct(runs,1)}
+        print(f"idpsd: spawn -> first detection p50 {pct(runs,.5)} ms, max {pct(runs,1)} ms over {args.runs} runs")
+        if args.gui:
+            gruns=[]
+            for i in range(args.runs):
+                log=os.path.join(d,f"gui{i}.log"); open(log,"w").close()
+                r=subprocess.run([sys.executable,"-c",STARTUP_CHILD,repr(time.time()),repo,log],cwd=d,
+                                 stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True,timeout=120)
+                lines=r.stdout.strip().splitlines()
+                if r.returncode or not lines:
+                    print(f"gui: failed: {r.stderr.strip().splitlines()[-1:] or r.returncode}", file=sys.stderr); break
+                gruns.append(json.loads(lines[-1]))
+            if gruns:
+                res["gui_ms"]={k:pct([g[k] for g in gruns],.5) for k in gruns[0]}
+                print("gui (p50 from spawn): "+", ".join(f"{k} {v} ms" for k,v in res["gui_ms"].items()))
+    finally:
+        shutil.rmtree(d,ignore_errors=True)
+    if args.json: print(json.dumps(res,indent=2))
+
+# ---- shard: whole-file parse + sharded counting across 1..N processes ----
+def bench_shard(args):
+    d=tempfile.mkdtemp(prefix="idps_shard_"); path=os.path.join(d,"big.log")
+    try:
+        with open(path,"w") as fp: fp.writelines(mixed_log(args.lines,args.hit_ratio))
+        res={"lines":args.lines,"cpus":os.cpu_count(),"runs":[]}
+        for p in args.procs:
+            t=time.perf_counter()
+            lines,per_shard=scan_file(path,p)
+            t_parse=time.perf_counter()-t
+            # each shard owns its IPs; time them one after another, the slowest bounds a parallel run
+            shard_t=[]; hits=[]
+            for batches in per_shard:
+                eng=DetectionEngine(); t=time.perf_counter(); n=0
+                for b in batches: n+=eng.feed_hits(unpack_hits(b))
+                shard_t.append(time.perf_counter()-t); hits.append(n)
+            total=t_parse+max(shard_t)
+            r={"procs":p,"parse_s":round(t_parse,3),"count_s_max_shard":round(max(shard_t),4),
+               "hits_per_shard":hits,"lines_per_sec":round(lines/total)}
+            res["runs"].append(r)
+            print(f"{p} proc(s): {r['lines_per_sec']:>10,} lines/s  (parse {r['parse_s']}s, "
+                  f"slowest shard {r['count_s_max_shard']}s, hits/shard {hits})")
+        base=res["runs"][0]["lines_per_sec"]
+        for r in res["runs"]: r["speedup"]=round(r["lines_per_sec"]/base,2)
+        if (os.cpu_count() or 1)<max(args.procs): print(f"note: only {os.cpu_count()} CPU(s) here; expect no speedup past that")
+        if args.json: print(json.dumps(res,indent=2))
+    finally:
+        shutil.rmtree(d,ignore_errors=True)
+
+# ---- suite: end-to-end numbers on load-generator traffic, as one JSON document ----
+LOADGEN_BLOCK = 4096
+
+# ---- iplist: CIDR lookups vs. a plain set, reload under concurrent lookups (exit 1 on mismatch) ----
+def bench_iplist(args):
+    import ipaddress
+    rnd=random.Random(7); entries=[]
+    for _ in range(args.ranges):
+        p=rnd.choice((8,16,20,24,24,28,32,32,32))
+        if rnd.random()<args.v6:
+            entries.append(str(ipaddress.ip_network((rnd.getrandbits(128)>>(128-p-8)<<(120-p),p+8),strict=False)))
+        else:
+            entries.append(str(ipaddress.ip_network((rnd.getrandbits(32),p),strict=False)))
+    probes=rand_ips(args.lookups,seed=9)
+    res={"ranges":args.ranges,"lookups":len(probes)}
+    t=time.perf_counter(); lst=IPList(entries); res["build_ms"]=round((time.perf_counter()-t)*1e3,1)
+    plain=set(probes[::2])
+    t=time.perf_counter()
+    for ip in probes: ip in plain
+    res["set_ns"]=round((time.perf_counter()-t)*1e9/len(probes))
+    t=time.perf_counter()
+    for ip in probes: ip in lst
+    res["iplist_ns"]=round((time.perf_counter()-t)*1e9/len(probes))
+    nets=[ipaddress.ip_network(e) for e in entries if ":" not in e]
+    sample=probes[:args.check]; bad=0
+    for ip in sample:
+        a=ipaddress.ip_address(ip)
+        bad+=(ip in lst)!=any(a in n for n in nets)
+    res["checked"]=len(sample); res["mismatches"]=bad
+    # reload while another thread keeps looking up: the worst single lookup is the stall
+    stop=threading.Event(); worst=[0.0]; done=[0]
+    def reader():
+        pc=time.perf_counter
+        while not stop.is_set():
+            for ip in probes[:1000]:
+                t0=pc(); ip in lst; d=pc()-t0
+                if d>worst[0]: worst[0]=d
+            done[0]+=1000
+    th=threading.Thread(target=reader); th.start(); time.sleep(0.05)
+    t=time.perf_counter(); lst.reload(entries[::-1]); res["reload_ms"]=round((time.perf_counter()-t)*1e3,1)
+    stop.set(); th.join()
+    res["reader_lookups_during"]=done[0]; res["worst_lookup_ms"]=round(worst[0]*1e3,2)
+    res["ok"]=bad==0
+    print(f"{args.ranges:,} entries: build {res['build_ms']} ms, lookup {res['iplist_ns']} ns (set {res['set_ns']} ns), "
+          f"reload {res['reload_ms']} ms with worst concurrent lookup {res['worst_lookup_ms']} ms, "
+          f"{bad} mismatches in {len(sample)} checks")
+    if args.json: print(json.dumps(res,indent=2))
+    if not res["ok"]: sys.exit(1)
+
+# ---- memory: bytes per tracked event, old representations vs. packed keys ----
+def mem_tuples(ips, per, t0):
+    # the original tail_worker: one deque of (datetime, ip) for every event
+    from datetime import datetime
+    q=deque()
+    for k in range(per):
+        for ip in ips: q.append((datetime.fromtimestamp(t0+k),(ip+" ")[:-1]))
+    return q
+
+def mem_deques(ips, per, t0):
+    # WindowCounter before packing: ip string -> deque of float timestamps
+    from collections import OrderedDict
+    od=OrderedDict()
+    for k in range(per):
+        for ip in ips:
+            ip=(ip+" ")[:-1]; q=od.get(ip)
+            if q is None: q=od[ip]=deque()
+            q.append(t0+k)
+    return od
+
+def mem_packed(ips, per, t0):
+    wc=WindowCounter(WINDOW_SECONDS)
+    for k in range(per):
+        for ip in ips: wc.add(ip_key((ip+" ")[:-1]),t0+k)
+    return wc
+
+def bench_memory(args):
+    # (ip+" ")[:-1]: a fresh string per event, as the regex hands out
+    ips=rand_ips(args.ips); t0=time.time(); results=[]
+    for per in args.per_ip:
+        row={"ips":len(ips),"events_per_ip":per}
+        for name,fn in (("tuples",mem_tuples),("deques",mem_deques),("packed",mem_packed)):
+            tracemalloc.start(); base=tracemalloc.get_traced_memory()[0]
+            keep=fn(ips,per,t0)
+            row[name+"_bytes_per_event"]=round((tracemalloc.get_traced_memory()[0]-base)/(len(ips)*per),1)
+            tracemalloc.stop(); del keep
+        results.append(row)
+        print(f"{per:>3} events/IP  bytes/event: (datetime, str) tuples {row['tuples_bytes_per_event']:>7}  "
+              f"str -> deque {row['deques_bytes_per_event']:>7}  packed {row['packed_bytes_per_event']:>7}")
+    if args.json: print(json.dumps(results,indent=2))
+
+# ---- sketch: subnet detection accuracy vs. memory, against exact per-prefix sets ----
+def subnet_traffic(args, n_noise, seed=7):
+    """[(ip key, ts)] inside one window: one-off noise IPs, botnet /24s (every IP under the
+    per-IP threshold), /16-wide sprays, single loud IPs (must not take their /24 with them)
+    and small quiet /24s; shuffled in time."""
+    rnd=random.Random(seed); keys=[]
+    keys+=[rnd.getrandbits(32) for _ in range(n_noise)]
+    for _ in range(args.nets):
+        net=rnd.getrandbits(24)<<8
+        for h in rnd.sample(range(1,255),args.per_net): keys+=[net|h]*2
+        quiet=rnd.getrandbits(24)<<8
+        keys+=[quiet|h for h in rnd.sample(range(1,255),10)]
+    for _ in range(args.wide):
+        net=rnd.getrandbits(16)<<16
+        keys+=[net|rnd.getrandbits(16) for _ in range(150)]
+    for _ in range(args.decoys): keys+=[rnd.getrandbits(32)]*50
+    rnd.shuffle(keys); span=WINDOW_SECONDS*0.9
+    return [(k,1000.0+span*i/len(keys)) for i,k in enumerate(keys)]
+
+def exact_prefixes(traffic):
+    """plen -> {prefix: [hits, set of sources]}, what the sketches approximate."""
+    exact={24:{},16:{}}
+    for k,_ in traffic:
+        for plen,d in exact.items():
+            e=d.get(k>>(32-plen))
+            if e is None: e=d[k>>(32-plen)]=[0,set()]
+            e[0]+=1; e[1].add(k)
+    return exact
+
+def bench_sketch(args):
+    results=[]; levels=subnet_levels(args.hits,args.sources)
+    for n in args.ips:
+        traffic=subnet_traffic(args,n); t_end=traffic[-1][1]
+        tracemalloc.start(); exact=exact_prefixes(traffic); exact_bytes=tracemalloc.get_traced_memory()[0]; tracemalloc.stop()
+        need={p4:(h,s) for p4,_,h,s in levels}
+        truth={(plen,p) for plen,d in exact.items() for p,(h,src) in d.items() if h>=need[plen][0] and len(src)>=need[plen][1]}
+        heavy=[(plen,p,e[0]) for plen,d in exact.items() for p,e in d.items() if e[0]>=5]
+        print(f"{n:,} noise IPs + {args.nets} botnet /24s, {args.wide} /16 sprays, {args.decoys} loud IPs: "
+              f"{len(traffic):,} hits, {len(truth)} prefixes should alert; exact per-prefix sets {exact_bytes/1e6:.1f} MB")
+        for p in args.hll_p:
+            for w in args.widths:
+                d=SubnetDetector(WINDOW_SECONDS,levels,width=w,depth=args.depth,max_tracked=args.tracked,hll_p=p)
+                alerted=set(); t=time.perf_counter()
+                for k,ts in traffic:
+                    for net,_,_,_ in d.hit(k,ts): alerted.add(net)
+                secs=time.perf_counter()-t
+                found={(int(net.rsplit("/",1)[1]),ip_key(net.split("/")[0])>>(32-int(net.rsplit("/",1)[1]))) for net in alerted}
+                tp=len(found&truth)
+                over=[(d.counts.estimate(mix64((pre<<9)|(plen<<1)),t_end)-h)/h for plen,pre,h in heavy]   # same packing as hit()
+                src=[]
+                for plen,pre in truth:
+                    ent=d.tracked.get((pre<<9)|(plen<<1))
+                    if ent is not None: src.append(abs(ent.sources-len(exact[plen][pre][1]))/len(exact[plen][pre][1]))
+                row={"noise_ips":n,"hits":len(traffic),"width":w,"depth":args.depth,"hll_p":p,"tracked":args.tracked,
+                     "sketch_kb":round(d.nbytes/1024),"exact_kb":round(exact_bytes/1024),
+                     "should_alert":len(truth),"alerted":len(found),"recall":round(tp/max(1,len(truth)),3),
+                     "precision":round(tp/max(1,len(found)),3),
+                     "count_overestimate_mean":round(sum(over)/max(1,len(over)),3),"count_overestimate_max":round(max(over,default=0),2),
+                     "sources_err_mean":round(sum(src)/max(1,len(src)),3),"evicted":d.evicted,
+                     "us_per_hit":round(secs/len(traffic)*1e6,2)}
+                results.append(row)
+                print(f"  width {w:>6} x{args.depth}, HLL p={p:<2} {row['sketch_kb']:>6} KB: recall {row['recall']:.3f} "
+                      f"precision {row['precision']:.3f}; counts +{row['count_overestimate_mean']:.1%} mean "
+                      f"(+{row['count_overestimate_max']:.0%} max); sources ±{row['sources_err_mean']:.1%}; "
+                      f"{row['evicted']:,} evicted; {row['us_per_hit']} us/hit")
+    if args.json: print(json.dumps(results,indent=2))
+
+# ---- peer: block propagation between instances on localhost, one process each ----
+def peer_node(i, ports, args, cmds, out):
+    eng=DetectionEngine(threshold=args.threshold,block_seconds=3600)
+    r=Responder(eng,geo=lambda ip: ("Somewhere",None,None),firewall=RecordingBackend(),workers=1,state_path=None)
+    if args.multicast: peers=[]; group="239.255.73.1"; port=ports[0]
+    else: peers=[("127.0.0.1",p) for p in ports if p!=ports[i]]; group=None; port=ports[i]
+    ps=PeerSync(eng,r,port=port,peers=peers,group=group,key=b"bench",share_counts=args.counts,
+                node=f"node{i}",batch=args.batch_ms/1e3,bind="127.0.0.1" if not args.multicast else "0.0.0.0").start()
+    eng.subscribe(lambda ev: out.put(("blocked",i,ev[1],time.time())) if ev[0]=="blocked" else None)
+    out.put(("ready",i))
+    while True:
+        cmd=cmds.get()
+        if cmd is None: break
+        if cmd[0]=="hits": eng.feed_hits([(cmd[1],cmd[2],time.time())]*cmd[3])
+        elif cmd[0]=="stats": out.put(("stats",i,ps.stats()))
+    ps.close(); r.close(wait=False)
+
+def bench_peer(args):
+    import multiprocessing as mp
+    base=random.Random().randrange(20000,40000); ports=[base+i for i in range(args.nodes)]
+    out=mp.Queue(); cmds=[mp.Queue() for _ in ports]
+    procs=[mp.Process(target=peer_node,args=(i,ports,args,cmds[i],out),daemon=True) for i in range(args.nodes)]
+    for p in procs: p.start()
+    for _ in procs: out.get(timeout=30)
+    def wait_blocks(ip, want, timeout=5.0):
+        seen={}; end=time.time()+timeout
+        while len(seen)<want and time.time()<end:
+            try: ev=out.get(timeout=max(0.01,end-time.time()))
+            except Exception: break
+            if ev[0]=="blocked" and ev[2]==ip: seen.setdefault(ev[1],ev[3])
+        return seen
+    lat=[]; missed=0
+    for k in range(args.rounds):        # one node decides, every other node should follow
+        ip=f"198.51.{100+k//250}.{k%250+1}"; origin=k%args.nodes
+        cmds[origin].put(("hits","fail",ip,args.threshold))
+        seen=wait_blocks(ip,args.nodes)
+        if origin not in seen or len(seen)<args.nodes: missed+=1
+        if origin in seen: lat+=[t-seen[origin] for j,t in seen.items() if j!=origin]
+    spread=None
+    if args.counts:                     # one attempt per node in turn until anyone blocks
+        ip="203.0.113.77"; sent=0
+        while sent<args.nodes*args.threshold:
+            cmds[sent%args.nodes].put(("hits","fail",ip,1)); sent+=1
+            if wait_blocks(ip,1,timeout=3*args.batch_ms/1e3+0.2): break
+        spread=sent
+    for q in cmds: q.put(("stats",))
+    stats=[]
+    while len(stats)<args.nodes:
+        ev=out.get(timeout=30)
+        if ev[0]=="stats": stats.append(ev[2])
+    for q in cmds: q.put(None)
+    for p in procs: p.join(10)
+    res={"nodes":args.nodes,"transport":"multicast" if args.multicast else "unicast","batch_ms":args.batch_ms,
+         "rounds":args.rounds,"incomplete_rounds":missed,
+         "propagation_ms_p50":pct(lat,0.5),"propagation_ms_p95":pct(lat,0.95),
+         "propagation_ms_max":round(max(lat)*1e3,2) if lat else None,
+         "datagrams_sent":sum(s["sent"] for s in stats),"ops_sent":sum(s["sent_ops"] for s in stats),
+         "duplicates_dropped":sum(s["dups"]+s["deduped"] for s in stats),"adopted":sum(s["adopted"] for s in stats)}
+    if spread is not None: res.update({"spread_attempts_to_block":spread,"spread_attempts_without_sharing":args.nodes*(args.threshold-1)+1})
+    print(f"{args.nodes} nodes ({res['transport']}, {args.batch_ms} ms batches): {args.rounds} blocks, "
+          f"{res['adopted']} adopted by peers, {missed} incomplete; propagation p50 {res['propagation_ms_p50']} ms, "
+          f"p95 {res['propagation_ms_p95']} ms, max {res['propagation_ms_max']} ms; "
+          f"{res['datagrams_sent']} datagrams for {res['ops_sent']} ops, {res['duplicates_dropped']} duplicates dropped")
+    if spread is not None:
+        print(f"attacker spreading attempts over the nodes: blocked after {spread} attempts "
+              f"(without shared counts: {res['spread_attempts_without_sharing']})")
+    if args.json: print(json.dumps(res,indent=2))
+
+# ---- async: one loop for tail/geo/firewall, threads vs. attack size ----
+def bench_async(args):
+    import asyncio
+    results=[]
+    for n in args.ips:
+        d=tempfile.mkdtemp(prefix="idps_async_"); path=os.path.join(d,"auth.log"); open(path,"w").close()
+        rnd=random.Random(n)
+        async def slow_fetch(ip):     # online geo stand-in: up to 2x the timeout, so some lookups time out
+            await asyncio.sleep(rnd.uniform(0,2*args.geo_ms/1e3)); return ("Somewhere",1.0,2.0)
+        eng=DetectionEngine(threshold=1,block_seconds=3600)
+        geo=AsyncGeo(online=True,limit=args.geo_limit,timeout=args.geo_ms/1e3,fetch=slow_fetch)
+        fw=RecordingBackend(delay=args.call_ms/1e3)
+        rt=AsyncRuntime(eng,geo=geo,backend=fw,workers=args.workers,queue_size=args.queue,put_timeout=3600,
+                        batch_interval=args.batch_ms/1e3,state_path=None).start()
+        base=threading.active_count(); peak=base
+        t0=time.perf_counter(); rt.follow(path,from_end=False)
+        with open(path,"a") as fp:
+            fp.writelines(fail_line(ip) for ip in rand_ips(n,seed=n))
+        while rt.done<n and time.perf_counter()-t0<args.timeout:
+            peak=max(peak,threading.active_count()); time.sleep(0.02)
+        while len(fw.active)<rt.done and time.perf_counter()-t0<args.timeout: time.sleep(0.02)
+        secs=time.perf_counter()-t0; st=rt.stats(); rt.close()
+        shutil.rmtree(d,ignore_errors=True)
+        row={"attackers":n,"seconds":round(secs,2),"handled":st["done"],"blocked":len(fw.active),
+             "firewall_calls":fw.calls,"threads_before":base,"threads_peak":peak,"queue_size":args.queue,
+             "queue_max":st["queue_max"],"dropped":st["dropped"],"geo_limit":args.geo_limit,
+             "geo_in_flight_max":geo.active_max,"geo_timeouts":geo.timeouts,
+             "alert_to_block_ms_p50":st["latency_ms_p50"],"alert_to_block_ms_p95":st["latency_ms_p95"]}
+        results.append(row)
+        print(f"{n:>7} attackers: {row['blocked']:,} blocked in {row['seconds']}s with {row['firewall_calls']} firewall calls; "
+              f"threads {base} -> peak {peak}; queue max {row['queue_max']}/{args.queue}; "
+              f"geo in flight max {row['geo_in_flight_max']}/{args.geo_limit}, {row['geo_timeouts']} timeouts")
+    if args.json: print(json.dumps(results,indent=2))
+
+def bench_store(args):
+    d=tempfile.mkdtemp(prefix="idps_store_"); path=os.path.join(d,"events.db")
+    st=EventStore(path,keep_days=0).open()
+    ips=rand_ips(args.ips); rnd=random.Random(1); t0=time.time()-86400; chunk=50_000
+    t=time.perf_counter(); n=0
+    while n<args.rows:               # the writer's path: on_event appends, flush() inserts one batch
+        for i in range(n,min(n+chunk,args.rows)):
+            ip=ips[rnd.randrange(len(ips))]; ts=t0+i*86400/args.rows; r=i%100
+            if r<90: st.on_event(("fail",ip,ts,r%5+1))
+            elif r<97: st.on_event(("scan",ip,ts,r%7+1))
+            elif r<98: st.on_event(("alert",ip,ts,"FAILED_LOGIN",5))
+            elif r<99: st.on_event(("blocked",ip,ts,ts+1800,""))
+            else: st.on_event(("unblocked",ip,ts))
+        n=min(n+chunk,args.rows); st.flush()
+    ins=time.perf_counter()-t
+    for ip in ips[:1000]: st.on_event(("enrich",ip,"Somewhere",1.0,2.0,"FAILED_LOGIN"))
+    st.flush()
+    def timed(fn):
+        t=time.perf_counter(); r=fn(); return r,round((time.perf_counter()-t)*1e3,2)
+    first,ms_first=timed(lambda: st.page(None,args.page))
+    cur=first[-1]
+    for _ in range(args.deep//args.page-1): cur=st.page(cur,args.page)[-1]
+    _,ms_deep=timed(lambda: st.page(cur,args.page))
+    _,ms_ip=timed(lambda: st.page(None,args.page,ip=ips[0]))
+    _,ms_alert=timed(lambda: st.page(None,args.page,type="alert"))
+    _,ms_range=timed(lambda: st.count(since=t0+3600,until=t0+7200))
+    res={"rows":args.rows,"insert_seconds":round(ins,2),"inserts_per_sec":round(args.rows/ins),
+         "db_mb":round(os.path.getsize(path)/1e6,1),"page_rows":args.page,"first_page_ms":ms_first,
+         f"page_at_row_{args.deep}_ms":ms_deep,"ip_page_ms":ms_ip,"alert_page_ms":ms_alert,"hour_count_ms":ms_range}
+    for kind,fn in (("csv",st.export_csv),("html",st.export_html)):
+        out=os.path.join(d,"report."+kind)
+        t=time.perf_counter(); rows=fn(out); secs=time.perf_counter()-t
+        tracemalloc.start(); fn(out); peak=tracemalloc.get_traced_memory()[1]; tracemalloc.stop()   # untimed: tracemalloc is slow
+        res[kind]={"rows":rows,"seconds":round(secs,2),"rows_per_sec":round(rows/secs),
+                   "mb":round(os.path.getsize(out)/1e6,1),"peak_python_mb":round(peak/1e6,2)}
+    st.close(); shutil.rmtree(d,ignore_errors=True)
+    print(f"insert: {args.rows:,} events in {res['insert_seconds']}s ({res['inserts_per_sec']:,}/s), {res['db_mb']} MB on disk")
+    print(f"page of {args.page}: first {ms_first} ms, at row {args.deep:,} {ms_deep} ms, by IP {ms_ip} ms, "
+          f"alerts only {ms_alert} ms; count one hour {ms_range} ms")
+    for kind in ("csv","html"):
+        r=res[kind]
+        print(f"export {kind}: {r['rows']:,} rows in {r['seconds']}s ({r['rows_per_sec']:,}/s), {r['mb']} MB, "
+              f"peak Python memory {r['peak_python_mb']} MB")
+    if args.json: print(json.dumps(res,indent=2))
+
+def pct(xs, p):
+    xs=sorted(xs)
+    return round(xs[min(len(xs)-1,int(p*len(xs)))]*1e3,3) if xs else None
+
+def suite_parse(args):
+    gen=LoadGen(args.ips,noise=args.noise,seed=args.seed)
+    blocks=[gen.batch(LOADGEN_BLOCK) for _ in range(max(1,args.lines//LOADGEN_BLOCK))]
+    eng=DetectionEngine(threshold=10**9)      # count only: no alert fan-out
+    t=time.perf_counter(); hits=0
+    for b in blocks: hits+=eng.feed_text(b)
+    secs=time.perf_counter()-t; n=len(blocks)*LOADGEN_BLOCK
+    return {"lines":n,"hits":hits,"seconds":round(secs,3),"lines_per_sec":round(n/secs)}
+
+def suite_latency(args):
+    """line written -> alert emitted -> block applied, under background load."""
+    d=tempfile.mkdtemp(prefix="idps_suite_"); path=os.path.join(d,"auth.log")
+    open(path,"w").close()
+    written={}; alerted={}; blocked={}; applied={}; clk=time.perf_counter
+    eng=DetectionEngine(threshold=3)
+    def on_ev(ev):
+        if ev[0]=="alert" and ev[1] in written: alerted.setdefault(ev[1],clk())
+        elif ev[0]=="blocked" and ev[1] in written: blocked.setdefault(ev[1],clk())
+    eng.subscribe(on_ev)
+    def on_fw(op,ips,out,err):
+        if op=="block":
+            t=clk()
+            for ip in ips:
+                if ip in written: applied.setdefault(ip,t)
+    fw=BatchingFirewall(RecordingBackend(),interval=args.batch_ms/1e3,on_result=on_fw)
+    resp=Responder(eng,geo=lambda ip:("Unknown",None,None),firewall=fw,state_path=None)
+    stop=threading.Event()
+    th=threading.Thread(target=Tailer(path).run,args=(eng.feed_text,stop),daemon=True); th.start()
+    time.sleep(0.2)
+    gen=LoadGen(args.ips,noise=args.noise,seed=args.seed); fd=os.open(path,os.O_WRONLY|os.O_APPEND)
+    tick=0.01; per_tick=max(1,int(args.rate*tick)); t0=clk(); i=0
+    while clk()-t0<args.duration:
+        data=gen.batch(per_tick); probe=None
+        if i%args.probe_every==0:              # a fresh IP crossing the threshold in one write
+            probe=f"198.18.{(i//args.probe_every)//250}.{(i//args.probe_every)%250+1}"
+            data+="".join(fail_line(probe) for _ in range(3))
+        data=data.encode()
+        if probe: written[probe]=clk()
+        os.write(fd,data); i+=1
+        ahead=t0+i*tick-clk()
+        if ahead>0: time.sleep(ahead)
+    sent=clk()-t0; deadline=clk()+5
+    while len(applied)<len(written) and clk()<deadline: time.sleep(0.01)
+    stop.set(); os.close(fd); th.join(2); resp.close()
+    shutil.rmtree(d,ignore_errors=True)
+    lat=lambda a,b: [b[ip]-a[ip] for ip in b if ip in a]
+    w2a=lat(written,alerted); w2b=lat(written,applied); a2b=lat(alerted,applied)
+    return {"rate":args.rate,"seconds":round(sent,2),"probes":len(written),"alerted":len(alerted),
+            "blocks_applied":len(applied),"batch_ms":args.batch_ms,
+            "write_to_alert_ms":{"p50":pct(w2a,.5),"p95":pct(w2a,.95),"p99":pct(w2a,.99),"max":pct(w2a,1)},
+            "alert_to_block_ms":{"p50":pct(a2b,.5),"p95":pct(a2b,.95),"p99":pct(a2b,.99),"max":pct(a2b,1)},
+            "write_to_block_ms":{"p50":pct(w2b,.5),"p95":pct(w2b,.95),"p99":pct(w2b,.99),"max":pct(w2b,1)}}
+
+def suite_memory(args):
+    """Bytes per tracked IP in the engine, and whether sweep() gives them back."""
+    ips=rand_ips(args.mem_ips,args.seed); eng=DetectionEngine(threshold=10**9)
+    tracemalloc.start(); base=tracemalloc.get_traced_memory()[0]; ts=time.time()
+    for ip in ips: eng.feed(f"Failed password for root from {ip} port 22",ts)
+    grown=tracemalloc.get_traced_memory()[0]-base
+    eng.tick(ts+eng.fail_events.window+1)
+    left=tracemalloc.get_traced_memory()[0]-base
+    tracemalloc.stop()
+    return {"ips":len(ips),"bytes_per_ip":round(grown/len(ips),1),"mb":round(grown/1e6,2),
+            "mb_after_sweep":round(left/1e6,2),"tracked_after_sweep":len(eng.fail_events)}
+
+def bench_suite(args):
+    import platform, subprocess
+    try: rev=subprocess.run(["git","rev-parse","--short","HEAD"],stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,text=True).stdout.strip()
+    except OSError: rev=""
+    res={"meta":{"when":time.strftime("%Y-%m-%dT%H:%M:%S"),"git":rev,"python":platform.python_version(),
+                 "platform":platform.platform(),"cpus":os.cpu_count(),"seed":args.seed}}
+    res["parse"]=suite_parse(args)
+    print(f"parse:   {res['parse']['lines_per_sec']:,} lines/s", file=sys.stderr)
+    res["latency"]=suite_latency(args); L=res["latency"]
+    print(f"latency: {L['probes']} probes at {args.rate:,} lines/s; write->alert p50 {L['write_to_alert_ms']['p50']} ms "
+          f"p99 {L['write_to_alert_ms']['p99']} ms; write->block p50 {L['write_to_block_ms']['p50']} ms "
+          f"p99 {L['write_to_block_ms']['p99']} ms", file=sys.stderr)
+    res["memory"]=suite_memory(args)
+    print(f"memory:  {res['memory']['bytes_per_ip']} bytes/IP, {res['memory']['mb']} MB -> "
+          f"{res['memory']['mb_after_sweep']} MB after sweep", file=sys.stderr)
+    doc=json.dumps(res,indent=2)
+    if args.out:
+        with open(args.out,"w") as fp: fp.write(doc+"\n")
+    else:
+        print(doc)
+
+def main(argv=None):
+    ap=argparse.ArgumentParser(description="IDPS hot-path benchmarks")
+    sub=ap.add_subparsers(dest="cmd",required=True)
+    w=sub.add_parser("window",help="sliding-window counting vs. distinct IPs")
+    w.add_argument("--ips",type=int,nargs="+",default=[10_000,100_000,1_000_000])
+    w.add_argument("--lines",type=int,default=500_000)
+    w.add_argument("--legacy-lines",type=int,default=50,help="lines to time on the old linear scan (0 = skip)")
+    w.add_argument("--json",action="store_true")
+    w.set_defaults(fn=bench_window)
+    c=sub.add_parser("classify",help="line classification cost on a mixed log")
+    c.add_argument("--lines",type=int,default=1_000_000)
+    c.add_argument("--hit-ratio",type=float,default=0.02)
+    c.add_argument("--extra",action="store_true",help="also load EXTRA_SIGNATURES")
+    c.add_argument("--repeat",type=int,default=3)
+    c.add_argument("--json",action="store_true")
+    c.set_defaults(fn=bench_classify)
+    t=sub.add_parser("tail",help="tailer throughput + rotation correctness under load")
+    t.add_argument("--lines",type=int,default=500_000)
+    t.add_argument("--rotate-every",type=int,default=50_000)
+    t.add_argument("--batch",type=int,default=500,help="lines per write()")
+    t.add_argument("--modes",nargs="+",default=["rename","copytruncate","truncate"],
+                   choices=["rename","copytruncate","truncate"])
+    t.add_argument("--poll",action="store_true",help="disable inotify, use the polling fallback")
+    t.add_argument("--json",action="store_true")
+    t.set_defaults(fn=bench_tail)
+    g=sub.add_parser("geo",help="offline geo DB load and lookup cost")
+    g.add_argument("--ranges",type=int,default=1_000_000)
+    g.add_argument("--lookups",type=int,default=200_000)
+    g.add_argument("--json",action="store_true")
+    g.set_defaults(fn=bench_geo)
+    b=sub.add_parser("blocks",help="block-expiry scheduler: threads, memory, expiry")
+    b.add_argument("--ips",type=int,default=100_000)
+    b.add_argument("--json",action="store_true")
+    b.set_defaults(fn=bench_blocks)
+    f=sub.add_parser("firewall",help="block/unblock throughput of a firewall backend")
+    f.add_argument("--ips",type=int,default=5000)
+    f.add_argument("--backend",default="dry-run",choices=["dry-run","nft","netsh"],help="real backends need admin/root")
+    f.add_argument("--call-ms",type=float,default=50.0,help="dry-run: simulated cost of one firewall tool call")
+    f.add_argument("--batch-ms",type=float,default=100.0)
+    f.add_argument("--unbatched",type=int,default=40,help="IPs to time one call at a time")
+    f.add_argument("--json",action="store_true")
+    f.set_defaults(fn=bench_firewall)
+    u=sub.add_parser("ui",help="events-table model cost per UI tick under a burst")
+    u.add_argument("--rate",type=int,default=50000,help="engine events per second")
+    u.add_argument("--ips",type=int,default=2000)
+    u.add_argument("--rows",type=int,default=500)
+    u.add_argument("--tick-ms",type=float,default=100.0)
+    u.add_argument("--ticks",type=int,default=50)
+    u.add_argument("--json",action="store_true")
+    u.set_defaults(fn=bench_ui)
+    p=sub.add_parser("map",help="attack-map clustering: canvas items and per-frame cost vs. attackers")
+    p.add_argument("--ips",type=int,nargs="+",default=[500,5000,20000])
+    p.add_argument("--modes",nargs="+",default=["cell","city","country"],choices=["cell","city","country"])
+    p.add_argument("--cities",type=int,default=2000)
+    p.add_argument("--rate",type=int,default=2000,help="geolocated alerts per second")
+    p.add_argument("--frame-ms",type=float,default=33.0)
+    p.add_argument("--max-clusters",type=int,default=200)
+    p.add_argument("--json",action="store_true")
+    p.set_defaults(fn=bench_map)
+    o=sub.add_parser("startup",help="time to first detection from a cold start; siren asset cost")
+    o.add_argument("--runs",type=int,default=5)
+    o.add_argument("--gui",action="store_true",help="also time the Tk console (needs a display)")
+    o.add_argument("--json",action="store_true")
+    o.set_defaults(fn=bench_startup)
+    q=sub.add_parser("idle",help="GUI CPU while idle, per GUI file and mode (needs a display)")
+    q.add_argument("--gui",nargs="+",default=["IDPS.py"],help="GUI files to compare, e.g. an older revision's IDPS.py")
+    q.add_argument("--modes",nargs="+",default=["normal","low-power"],choices=["normal","low-power"])
+    q.add_argument("--seconds",type=float,default=30.0)
+    q.add_argument("--warmup",type=float,default=3.0)
+    q.add_argument("--json",action="store_true")
+    q.set_defaults(fn=bench_idle)
+    h=sub.add_parser("shard",help="multi-process parse + per-shard counting, 1..N processes")
+    h.add_argument("--lines",type=int,default=2_000_000)
+    h.add_argument("--hit-ratio",type=float,default=0.02)
+    h.add_argument("--procs",type=int,nargs="+",default=sorted({1,2,4,os.cpu_count() or 1}))
+    h.add_argument("--json",action="store_true")
+    h.set_defaults(fn=bench_shard)
+    i=sub.add_parser("iplist",help="CIDR whitelist/blocklist lookups, build and reload")
+    i.add_argument("--ranges",type=int,default=50_000)
+    i.add_argument("--v6",type=float,default=0.1,help="share of IPv6 entries")
+    i.add_argument("--lookups",type=int,default=200_000)
+    i.add_argument("--check",type=int,default=300,help="lookups cross-checked against ipaddress")
+    i.add_argument("--json",action="store_true")
+    i.set_defaults(fn=bench_iplist)
+    m=sub.add_parser("memory",help="bytes per tracked event: old tuples/deques vs. packed counters")
+    m.add_argument("--ips",type=int,default=200_000)
+    m.add_argument("--per-ip",type=int,nargs="+",default=[1,3,10])
+    m.add_argument("--json",action="store_true")
+    m.set_defaults(fn=bench_memory)
+    k=sub.add_parser("sketch",help="subnet detection: alert recall/precision and count errors vs. sketch memory")
+    k.add_argument("--ips",type=int,nargs="+",default=[20_000,100_000],help="one-off noise IPs in the window")
+    k.add_argument("--nets",type=int,default=50,help="botnet /24s (and as many quiet /24s)")
+    k.add_argument("--per-net",type=int,default=15,help="IPs per botnet /24, two hits each")
+    k.add_argument("--wide",type=int,default=5,help="/16s sprayed with 150 one-hit IPs")
+    k.add_argument("--decoys",type=int,default=50,help="single IPs with 50 hits")
+    k.add_argument("--widths",type=int,nargs="+",default=[1024,4096,16384,65536])
+    k.add_argument("--depth",type=int,default=4)
+    k.add_argument("--hll-p",type=int,nargs="+",default=[6,8])
+    k.add_argument("--tracked",type=int,default=1024)
+    k.add_argument("--hits",type=int,default=20,help="/24 alert level (/16: 4x)")
+    k.add_argument("--sources",type=int,default=4)
+    k.add_argument("--json",action="store_true")
+    k.set_defaults(fn=bench_sketch)
+    r=sub.add_parser("peer",help="peer sync: block propagation latency across instances on localhost")
+    r.add_argument("--nodes",type=int,default=4)
+    r.add_argument("--rounds",type=int,default=100)
+    r.add_argument("--threshold",type=int,default=3)
+    r.add_argument("--batch-ms",type=float,default=50.0)
+    r.add_argument("--counts",action="store_true",help="share hit counts too; also time a spread-out attacker")
+    r.add_argument("--multicast",action="store_true",help="one multicast group instead of unicast to each peer")
+    r.add_argument("--json",action="store_true")
+    r.set_defaults(fn=bench_peer)
+    a=sub.add_parser("async",help="asyncio runtime: thread count, backpressure and geo limits vs. attackers")
+    a.add_argument("--ips",type=int,nargs="+",default=[100,1000,5000])
+    a.add_argument("--workers",type=int,default=64,help="enrich tasks")
+    a.add_argument("--queue",type=int,default=256,help="alert queue size")
+    a.add_argument("--geo-limit",type=int,default=32,help="online lookups in flight")
+    a.add_argument("--geo-ms",type=float,default=200.0,help="geo timeout; fake lookups take 0..2x this")
+    a.add_argument("--call-ms",type=float,default=50.0,help="simulated firewall call cost")
+    a.add_argument("--batch-ms",type=float,default=100.0)
+    a.add_argument("--timeout",type=float,default=300.0)
+    a.add_argument("--json",action="store_true")
+    a.set_defaults(fn=bench_async)
+    s=sub.add_parser("store",help="event store: insert rate, paging latency, streaming export")
+    s.add_argument("--rows",type=int,default=2_000_000)
+    s.add_argument("--ips",type=int,default=50_000)
+    s.add_argument("--page",type=int,default=500)
+    s.add_argument("--deep",type=int,default=100_000,help="time a page this many rows back")
+    s.add_argument("--json",action="store_true")
+    s.set_defaults(fn=bench_store)
+    x=sub.add_parser("suite",help="parse throughput, detection latency, memory -> JSON")
+    x.add_argument("--lines",type=int,default=1_000_000,help="parse: lines through feed_text")
+    x.add_argument("--ips",type=int,default=5000,help="distinct attacker IPs in generated traffic")
+    x.add_argument("--noise",type=float,default=0.98)
+    x.add_argument("--rate",type=int,default=50_000,help="latency: background lines per second")
+    x.add_argument("--duration",type=float,default=5.0)
+    x.add_argument("--probe-every",type=int,default=5,help="latency: one probe IP per this many 10 ms ticks")
+    x.add_argument("--batch-ms",type=float,default=100.0,help="firewall coalescing window")
+    x.add_argument("--mem-ips",type=int,default=200_000)
+    x.add_argument("--seed",type=int,default=1)
+    x.add_argument("--out",help="write the JSON here instead of stdout")
+    x.set_defaults(fn=bench_suite)
+    args=ap.parse_args(argv); args.fn(args)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,450 @@
+# idps_engine.py — detection core (no GUI imports)
+import re, time, threading
+from array import array
+from collections import OrderedDict
+from socket import inet_pton, inet_ntop, AF_INET, AF_INET6
+from datetime import datetime, timezone
+from idps_metrics import HITS, ALERTS, CLASSIFY_SECONDS, COUNT_SECONDS
+from idps_iplist import IPList
+
+# =============== CONFIG ===============
+THRESHOLD_DEFAULT = 3
+BLOCK_SECONDS_DEFAULT = 1800       # 30 min
+WINDOW_SECONDS = 180               # Count within last 3 min
+RATE_RESOLUTIONS = ((5,12), (60,60), (900,96))   # (slot seconds, slots): 1 min, 1 h, 24 h of alert counts
+
+# Patterns
+IP_PATTERN = r"\d+\.\d+\.\d+\.\d+|[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7}"   # IPv4 or IPv6
+FAIL_RE = re.compile(r"Failed password.*from (\d+\.\d+\.\d+\.\d+)")
+SCAN_RE = re.compile(r"Port scan .* from (\d+\.\d+\.\d+\.\d+)")
+
+# Signatures: (kind, literal that must appear in the line, pattern with {ip}).
+# kind is what gets counted: "fail" (auth failures) or "scan".
+DEFAULT_SIGNATURES = [
+    ("fail", "Failed password", r"Failed password.*from {ip}"),
+    ("scan", "Port scan", r"Port scan .* from {ip}"),
+]
+EXTRA_SIGNATURES = {
+    "sshd-invalid-user": ("fail", "Invalid user", r"Invalid user .*from {ip}"),
+    "nginx-401": ("fail", '" 401 ', r'^{ip} \S+ \S+ \[[^\]]*\] "[^"\n]*" 401 '),
+}
+
+def utc(ts):
+    """Epoch seconds -> naive UTC datetime (what the logs have always shown)."""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+# ---- Line classifier ----
+class Classifier:
+    """Turns log lines into (kind, ip) with one regex pass.
+
+    A line is first checked for any signature literal with `in` (most auth.log
+    lines have none and stop here). Survivors go through a single alternation
+    of all signatures; the outer group that matched tells us which one.
+    """
+    KINDS=("fail","scan")
+
+    def __init__(self, signatures=DEFAULT_SIGNATURES):
+        self.signatures=[]
+        for sig in signatures: self.add(*sig, compile=False)
+        self.compile()
+
+    def add(self, kind, literal, pattern, compile=True):
+        if kind not in self.KINDS: raise ValueError(f"unknown signature kind: {kind!r}")
+        if "{ip}" not in pattern: raise ValueError("signature pattern needs an {ip} placeholder")
+        if not literal: raise ValueError("signature needs a non-empty literal")
+        self.signatures.append((kind,literal,pattern))
+        if compile: self.compile()
+
+    def compile(self):
+        alts=[]; kinds={}
+        for i,(kind,lit,pat) in enumerate(self.signatures):
+            alts.append(f"(?P<s{i}>{pat.replace('{ip}',f'(?P<ip{i}>{IP_PATTERN})')})")
+            kinds[f"s{i}"]=(kind,f"ip{i}")
+        # swap in one go so readers on other threads never see a half-built state
+        self._state=(tuple(dict.fromkeys(lit for _,lit,_ in self.signatures)),
+                     re.compile("|".join(alts),re.M), kinds)
+
+    def classify(self, line):
+        lits,rx,kinds=self._state
+        for lit in lits:
+            if lit in line: break
+        else:
+            return None
+        m=rx.search(line)
+        if m is None: return None
+        kind,g=kinds[m.lastgroup]
+        return (kind,m.group(g))
+
+    def scan(self, text, pos=False):
+        """All (kind, ip) hits in a block of newline-separated lines.
+
+        Literals are located with str.find over the whole block, so only the
+        lines that contain one are ever handed to the regex. With pos=True
+        the hits are (kind, ip, line_start) instead.
+        """
+        lits,rx,kinds=self._state
+        find=text.find; rfind=text.rfind; starts=set()
+        for lit in lits:
+            i=find(lit)
+            while i!=-1:
+                starts.add(rfind("\n",0,i)+1)
+                i=find(lit,i+len(lit))
+        if not starts: return []
+        out=[]; search=rx.search; end=len(text)
+        for s in sorted(starts):
+            e=find("\n",s)
+            m=search(text,s,end if e==-1 else e)
+            if m is not None:
+                kind,g=kinds[m.lastgroup]; out.append((kind,m.group(g),s) if pos else (kind,m.group(g)))
+        return out
+
+# ---- Packed IP keys ----
+V6_TAG = 1 << 128                  # set on IPv6 keys so they never collide with IPv4 ones
+
+def ip_key(ip):
+    """IP string -> int (IPv4 as-is, IPv6 | V6_TAG); None if it is not an address."""
+    try: return int.from_bytes(inet_pton(AF_INET,ip),"big")
+    except OSError:
+        try: return int.from_bytes(inet_pton(AF_INET6,ip),"big")|V6_TAG
+        except OSError: return None
+
+def ip_str(key):
+    if key<V6_TAG: return inet_ntop(AF_INET,key.to_bytes(4,"big"))
+    return inet_ntop(AF_INET6,(key^V6_TAG).to_bytes(16,"big"))
+
+# ---- Sliding-window counters ----
+class WindowCounter:
+    """Per-key event counts over the last `window` seconds.
+
+    The engine keys by packed IP (ip_key). An IP with one event in the
+    window holds just its timestamp as a float; a second event turns that
+    into an array("d"), which is 8 bytes per further event. Keys are kept in
+    last-hit order, which lets sweep() drop idle ones from the front without
+    scanning everything.
+
+    State restored from a snapshot starts "cold" in a plain dict and moves
+    into the ordered one the first time the key is hit again, so restoring
+    a million IPs is one dict build.
+    """
+    __slots__=("window","_q","_cold","_cold_ips","_cold_last","_cold_pos")
+
+    def __init__(self, window):
+        self.window=window
+        self._q=OrderedDict()          # key -> ts float or array("d"), oldest last-hit first
+        self._cold={}; self._cold_ips=[]; self._cold_last=[]; self._cold_pos=0
+
+    def add(self, key, ts):
+        od=self._q; v=od.get(key)
+        if v is None:
+            if self._cold: v=self._cold.pop(key,None)
+        else:
+            od.move_to_end(key)
+        if v is None:
+            od[key]=ts; return 1
+        cutoff=ts-self.window
+        if v.__class__ is array:
+            v.append(ts)
+            if v[0]<cutoff:
+                i=1
+                while v[i]<cutoff: i+=1
+                del v[:i]
+            od[key]=v; return len(v)
+        if v<cutoff:
+            od[key]=ts; return 1
+        od[key]=array("d",(v,ts)); return 2
+
+    def count(self, key, ts):
+        v=self._q.get(key)
+        if v is None:
+            v=self._cold.get(key) if self._cold else None
+            if v is None: return 0
+        cutoff=ts-self.window
+        if v.__class__ is array: return sum(1 for t in v if t>=cutoff)
+        return 1 if v>=cutoff else 0
+
+    def sweep(self, ts):
+        """Forget keys whose newest event fell out of the window."""
+        cutoff=ts-self.window; od=self._q; n=0
+        while od:
+            key=next(iter(od)); v=od[key]
+            if (v[-1] if v.__class__ is array else v)>=cutoff: break
+            del od[key]; n+=1
+        if n and not od: self._q=OrderedDict()      # hand back the table after a burst
+        if self._cold_ips:
+            cold=self._cold; ips=self._cold_ips; last=self._cold_last; i=self._cold_pos
+            while i<len(ips) and last[i]<cutoff:
+                if cold.pop(ips[i],None) is not None: n+=1
+                i+=1
+            self._cold_pos=i
+            if i==len(ips) or not cold: self._drop_cold()
+        return n
+
+    def _drop_cold(self):
+        self._cold={}; self._cold_ips=[]; self._cold_last=[]; self._cold_pos=0
+
+    def export(self):
+        """(keys, per-key counts, all timestamps), keys in last-hit order."""
+        cold=self._cold
+        items=[(k,cold[k]) for k in self._cold_ips[self._cold_pos:] if k in cold]
+        items+=self._q.items()
+        keys=[k for k,_ in items]; vals=[v for _,v in items]
+        if not any(v.__class__ is array for v in vals):
+            return keys,array("I",[1])*len(vals),array("d",vals)    # one event per key: the common case
+        counts=array("I"); ts=array("d")
+        for v in vals:
+            if v.__class__ is array: ts.extend(v); counts.append(len(v))
+            else: ts.append(v); counts.append(1)
+        return keys,counts,ts
+
+    def restore(self, keys, counts, ts):
+        """Load export() output into an empty counter (as cold entries)."""
+        keys=list(keys)
+        if len(ts)==len(keys):
+            vals=last=ts.tolist() if isinstance(ts,array) else list(ts)
+        else:
+            ts=ts if isinstance(ts,array) else array("d",ts)
+            vals=[]; last=[]; i=0
+            for n in counts:
+                vals.append(ts[i] if n==1 else ts[i:i+n]); i+=n; last.append(ts[i-1])
+        self._cold=dict(zip(keys,vals)); self._cold_ips=keys; self._cold_last=last; self._cold_pos=0
+
+    def discard(self, key):
+        self._q.pop(key,None)
+        if self._cold: self._cold.pop(key,None)
+
+    def clear(self): self._q.clear(); self._drop_cold()
+    def __len__(self): return len(self._q)+len(self._cold)
+    def __contains__(self, key): return key in self._q or key in self._cold
+
+# ---- Engine ----
+class DetectionEngine:
+    """Owns all detection state; reports through subscribed callbacks.
+
+    Events are plain tuples (same shapes the GUI queue has always used):
+      ("fail", ip, ts, cnt)  ("scan", ip, ts, cnt)  ("ignored", ip, ts)
+      ("alert", ip, ts, type, cnt)  ("enrich", ip, label, lat, lon, type)
+        type is FAILED_LOGIN, PORT_SCAN or BLOCKLIST (first hit from a listed IP),
+        or SUBNET with ip a network ("203.0.113.0/24") when `subnets` is set
+      ("blocked", ip, ts, until, resp)  ("unblocked", ip, ts)
+      ("log", msg)  ("error", msg)
+    Timestamps are epoch seconds.
+    """
+    def __init__(self, threshold=THRESHOLD_DEFAULT, block_seconds=BLOCK_SECONDS_DEFAULT,
+                 window=WINDOW_SECONDS, protect_mode=True, clock=time.time, classifier=None):
+        self.threshold=threshold
+        self.block_seconds=block_seconds
+        self.protect_mode=protect_mode
+        self.clock=clock
+        self.classifier=classifier or Classifier()
+        self.fail_events=WindowCounter(window)
+        self.scan_events=WindowCounter(window)
+        self.alert_rate=RateHistory()  # alerts per time slot, for charts
+        self.blocked_until={}          # ip -> epoch deadline
+        self.whitelist=IPList()        # IPs/CIDRs never counted or blocked
+        self.blocklist=IPList()        # IPs/CIDRs blocked on their first hit
+        self.blocked_nets=IPList()     # the CIDR keys of blocked_until, for matching member IPs
+        self.subnets=None              # idps_sketch.SubnetDetector: per-prefix alerts on top of per-IP ones
+        self.lock=threading.RLock()
+        self.journal=None              # list while a StateJournal is attached: state changes, appended under lock
+        self._subs=[]
+
+    # ---- subscribers ----
+    def subscribe(self, fn):
+        self._subs.append(fn); return fn
+
+    def unsubscribe(self, fn):
+        try: self._subs.remove(fn)
+        except ValueError: pass
+
+    def emit(self, *ev):
+        for fn in list(self._subs):
+            try: fn(ev)
+            except Exception as e:
+                if ev[0]!="error": self.emit("error",f"subscriber {fn!r}: {e}")
+
+    def emit_all(self, evs):
+        for ev in evs: self.emit(*ev)
+
+    # ---- ingest ----
+    # Events are collected under the lock and emitted after it is released,
+    # so subscribers may block (backpressure) or call back into the engine.
+    def feed(self, line, ts=None):
+        hit=self.classifier.classify(line)
+        if hit is None: return False
+        ts=self.clock() if ts is None else ts; out=[]
+        with self.lock:
+            self._hit(hit[0],hit[1],ts,out); self._gc(ts)
+        self.emit_all(out)
+        return True
+
+    def feed_batch(self, lines, ts=None):
+        ts=self.clock() if ts is None else ts
+        classify=self.classifier.classify; n=0; out=[]
+        with self.lock:
+            for line in lines:
+                hit=classify(line)
+                if hit is None: continue
+                self._hit(hit[0],hit[1],ts,out); n+=1
+            if n: self._gc(ts)
+        self.emit_all(out)
+        return n
+
+    def feed_text(self, text, ts=None):
+        """Like feed_batch for a raw block of lines (one regex pass over the block)."""
+        t=time.perf_counter()
+        hits=self.classifier.scan(text)
+        t=CLASSIFY_SECONDS.since(t)
+        if not hits: return 0
+        ts=self.clock() if ts is None else ts; out=[]
+        with self.lock:
+            for kind,ip in hits: self._hit(kind,ip,ts,out)
+            self._gc(ts)
+        COUNT_SECONDS.since(t); HITS.inc(len(hits))
+        self.emit_all(out)
+        return len(hits)
+
+    def feed_hits(self, hits):
+        """Already-classified (kind, ip, ts) hits, each at its own (event) time."""
+        if not hits: return 0
+        out=[]; t=time.perf_counter()
+        with self.lock:
+            for kind,ip,ts in hits: self._hit(kind,ip,ts,out)
+            self._gc(hits[-1][2])
+        COUNT_SECONDS.since(t); HITS.inc(len(hits))
+        self.emit_all(out)
+        return len(hits)
+
+    def _gc(self, ts):
+        return self.fail_events.sweep(ts)+self.scan_events.sweep(ts)
+
+    def _hit(self, kind, ip, ts, out):
+        if ip in self.whitelist:
+            out.append(("ignored",ip,ts)); return
+        until=self.blocked_until.get(ip)
+        if until is not None and ts<until: return
+        if self.blocked_nets and ip in self.blocked_nets: return
+        if ip in self.blocklist:
+            out.append((kind,ip,ts,1)); out.append(("alert",ip,ts,"BLOCKLIST",1))
+            self.alert_rate.add(ts); ALERTS.inc(); return
+        key=ip_key(ip)
+        if key is None: return         # e.g. 999.1.1.1: nothing to count or block
+        if kind=="fail":
+            cnt=self.fail_events.add(key,ts)
+            out.append(("fail",ip,ts,cnt))
+            alert=cnt>=self.threshold
+            if alert: out.append(("alert",ip,ts,"FAILED_LOGIN",cnt))
+        else:
+            cnt=self.scan_events.add(key,ts)
+            out.append(("scan",ip,ts,cnt))
+            alert=cnt>=max(5,self.threshold-1)
+            if alert: out.append(("alert",ip,ts,"PORT_SCAN",cnt))
+        if alert: self.alert_rate.add(ts); ALERTS.inc()
+        if self.subnets is not None:
+            for net,n,src,rate in self.subnets.hit(key,ts):
+                if net in self.blocked_until: continue
+                out.append(("log",f"Subnet {net}: {n} hits from ~{src} IPs in the window ({rate*60:.1f}/min)"))
+                out.append(("alert",net,ts,"SUBNET",n)); self.alert_rate.add(ts); ALERTS.inc()
+        if self.journal is not None: self.journal.append((kind,ip,ts,alert))
+
+    def tick(self, now=None):
+        """Housekeeping: drop IPs that went quiet for a whole window."""
+        now=self.clock() if now is None else now
+        with self.lock:
+            return self._gc(now)
+
+    # ---- block bookkeeping (firewall work is the responder's job) ----
+    def may_block(self, ip):
+        if (self.whitelist.overlaps(ip) if "/" in ip else ip in self.whitelist): return "whitelisted"
+        if not self.protect_mode: return "protect mode off"
+        return None
+
+    def mark_blocked(self, ip, until):
+        with self.lock:
+            self.blocked_until[ip]=until
+            if "/" in ip: self.blocked_nets.add(ip)
+            if self.journal is not None: self.journal.append(("block",ip,until))
+
+    def mark_unblocked(self, ip, until=None):
+        """Forget a block; with `until`, only if that deadline is still current."""
+        with self.lock:
+            if until is not None and self.blocked_until.get(ip)!=until: return False
+            if self.blocked_until.pop(ip,None) is None: return False
+            if "/" in ip: self.blocked_nets.discard(ip)
+            if self.journal is not None: self.journal.append(("unblock",ip))
+            return True
+
+    def unblock_all(self):
+        """Forget every block (the firewall rules were wiped); journaled one by one."""
+        with self.lock:
+            for ip in list(self.blocked_until): self.mark_unblocked(ip)
+
+    # ---- state export (journal snapshots) ----
+    def export_state(self):
+        """Everything a restart needs, copied under the lock (counter keys are packed IPs)."""
+        with self.lock:
+            return {"window":self.fail_events.window,
+                    "fail":self.fail_events.export(),"scan":self.scan_events.export(),
+                    "blocked":dict(self.blocked_until),"whitelist":sorted(self.whitelist),
+                    "rate":{span:r.export() for span,r in self.alert_rate.rings.items()}}
+
+    def load_state(self, st):
+        with self.lock:
+            self.fail_events.restore(*st["fail"]); self.scan_events.restore(*st["scan"])
+            self.blocked_until.update(st["blocked"]); self.whitelist.update(st["whitelist"])
+            for span,(ids,counts) in st["rate"].items():
+                if span in self.alert_rate.rings: self.alert_rate.rings[span].restore(ids,counts)
+            self.reindex_blocks()
+
+    def reindex_blocks(self):
+        """Rebuild blocked_nets after blocked_until was changed directly (state restore)."""
+        with self.lock: self.blocked_nets.reload(ip for ip in self.blocked_until if "/" in ip)
+
+    def replay(self, kind, ip, ts, alert):
+        """Re-apply a journaled hit: counts only, no events."""
+        key=ip_key(ip)
+        if key is not None:
+            (self.fail_events if kind=="fail" else self.scan_events).add(key,ts)
+            if self.subnets is not None: self.subnets.hit(key,ts)     # alerts already went out the first time
+        if alert: self.alert_rate.add(ts)
+
+# ---- Rate history ----
+class RingCounter:
+    """Event counts in `slots` fixed slots of `slot` seconds; add() is O(1).
+
+    Each cell remembers which slot number it holds, so a cell left over from
+    a previous lap reads as 0 and is reset by the next add that lands on it.
+    """
+    __slots__=("slot","slots","_counts","_ids")
+
+    def __init__(self, slot, slots):
+        self.slot=slot; self.slots=slots
+        self._counts=[0]*slots; self._ids=[-1]*slots
+
+    def add(self, ts, n=1):
+        sid=int(ts//self.slot); i=sid%self.slots
+        if self._ids[i]!=sid:
+            if self._ids[i]>sid: return    # older than anything we still keep
+            self._ids[i]=sid; self._counts[i]=0
+        self._counts[i]+=n
+
+    def series(self, now):
+        """Counts oldest first; the last entry is the slot holding `now`."""
+        cur=int(now//self.slot); k=self.slots; c=self._counts; ids=self._ids
+        return [c[s%k] if ids[s%k]==s else 0 for s in range(cur-k+1,cur+1)]
+
+    def total(self, now): return sum(self.series(now))
+    def export(self): return (list(self._ids),list(self._counts))
+    def restore(self, ids, counts):
+        if len(ids)==self.slots: self._ids=list(ids); self._counts=list(counts)
+    def span(self): return self.slot*self.slots
+
+class RateHistory:
+    """The same counts at several resolutions, keyed by span in seconds."""
+    def __init__(self, resolutions=RATE_RESOLUTIONS):
+        self.rings={slot*slots:RingCounter(slot,slots) for slot,slots in resolutions}
+
+    def add(self, ts, n=1):
+        for r in self.rings.values(): r.add(ts,n)
+
+    def ring(self, span): return self.rings[span]
+    def series(self, span, now): return self.rings[span].series(now)
@@ -0,0 +1,351 @@
+# idps_firewall.py — firewall backends
+#
+#   NetshBackend      Windows Firewall, one IN + OUT rule per IP, batched via `netsh -f`
+#   NftBackend        Linux nftables, blocked IPs live in one set per address family (subnets in interval sets)
+#   RecordingBackend  dry run: records what would have happened (tests, benchmarks, no root)
+#   BatchingFirewall  coalesces block/unblock requests and applies them every `interval`
+#
+# Backends that shell out describe the call with command(), so the
+# same batch can run through subprocess.run or be awaited by idps_async.
+import ipaddress, os, re, sys, shutil, subprocess, tempfile, threading, time
+from idps_iplist import canonical
+from idps_metrics import FIREWALL_SECONDS
+
+RULE_PREFIX = "IDPS_BLOCK_"
+NFT_TABLE = "idps"
+FIREWALL_BATCH_SECONDS = 0.1
+
+_admin = None
+
+def admin_check():
+    """Can this process change firewall rules? Probed once (`net session` costs a process)."""
+    global _admin
+    if _admin is None:
+        if hasattr(os,"geteuid"): _admin=os.geteuid()==0
+        else:
+            try:
+                out = subprocess.run(["net","session"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                _admin = "Access is denied" not in out.stdout
+            except OSError:
+                _admin = False
+    return _admin
+
+def run_netsh(args):
+    proc = subprocess.run(["netsh","advfirewall","firewall"]+args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return proc.stdout.strip()
+
+class FirewallBackend:
+    """block_many/unblock_many get a list of IPs and return the tool's output."""
+    name = "base"
+    volatile = False               # rules vanish on reboot/restart -> re-apply saved blocks
+    ready = True                   # False until setup() has run
+
+    def setup(self): pass
+    def block_many(self, ips): raise NotImplementedError
+    def unblock_many(self, ips): raise NotImplementedError
+
+    # ---- external tool calls ----
+    def command(self, op, ips):
+        """(argv, stdin text or None, done) applying op ("block"/"unblock") to ips; None if nothing to do.
+
+        done(rc, output) is called once the tool exited (rc None: it never
+        started), does the bookkeeping and returns the result text.
+        """
+        return NotImplemented
+
+    def _apply(self, op, ips):
+        cmd=self.command(op,ips)
+        if cmd is None: return ""
+        argv,stdin,done=cmd; rc=None; out=""
+        try:
+            proc=subprocess.run(argv,input=stdin,stdout=subprocess.PIPE,stderr=subprocess.STDOUT,text=True)
+            rc=proc.returncode; out=proc.stdout
+        finally:
+            res=done(rc,out)
+        return res
+
+    async def apply_async(self, op, ips):
+        """block_many/unblock_many for an event loop: the tool runs as an awaited subprocess."""
+        import asyncio                 # only the event-loop runtime gets here: keep it off the cold start
+        if not self.ready: await asyncio.get_running_loop().run_in_executor(None,self.setup)   # blocking tool calls
+        cmd=self.command(op,ips)
+        if cmd is NotImplemented: return (self.block_many if op=="block" else self.unblock_many)(ips)
+        if cmd is None: return ""
+        argv,stdin,done=cmd; rc=None; out=""
+        try:
+            proc=await asyncio.create_subprocess_exec(*argv,stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+                                                      stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
+            data,_=await proc.communicate(stdin.encode() if stdin is not None else None)
+            rc=proc.returncode; out=data.decode(errors="replace")
+        finally:
+            res=done(rc,out)
+        return res
+    def list_rules(self): return "(not supported)"
+    def cleanup(self): return 0
+    def block(self, ip): return self.block_many([ip])
+    def unblock(self, ip): return self.unblock_many([ip])
+    def close(self): pass
+
+# ---- Windows ----
+class NetshBackend(FirewallBackend):
+    name = "netsh"
+
+    def _script(self, lines):
+        # one netsh process for the whole batch instead of two per IP
+        if len(lines)<=2:
+            return "\n".join(run_netsh(ln.split(" ")[2:]) for ln in lines)
+        fd,path=tempfile.mkstemp(suffix=".netsh",text=True)
+        try:
+            with os.fdopen(fd,"w") as fp: fp.write("\n".join(lines)+"\n")
+            proc=subprocess.run(["netsh","-f",path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            return proc.stdout.strip()
+        finally:
+            try: os.remove(path)
+            except OSError: pass
+
+    def _lines(self, op, ips):
+        ips=[canonical(ip) for ip in ips]         # ValueError before anything reaches the script
+        if op=="block":
+            return [f"advfirewall firewall add rule name={RULE_PREFIX}{ip}_{d.upper()} dir={d} action=block enable=yes profile=any remoteip={ip}"
+                    for ip in ips for d in ("in","out")]
+        return [f"advfirewall firewall delete rule name={RULE_PREFIX}{ip}_{d}" for ip in ips for d in ("IN","OUT")]
+
+    def block_many(self, ips): return self._script(self._lines("block",ips))
+    def unblock_many(self, ips): return self._script(self._lines("unblock",ips))
+
+    def command(self, op, ips):
+        if not ips: return None
+        fd,path=tempfile.mkstemp(suffix=".netsh",text=True)
+        with os.fdopen(fd,"w") as fp: fp.write("\n".join(self._lines(op,ips))+"\n")
+        def done(rc, out):
+            try: os.remove(path)
+            except OSError: pass
+            return out.strip()
+        return ["netsh","-f",path],None,done
+
+    def list_rules(self):
+        out=run_netsh(["show","rule","name=all"])
+        lines=[ln for ln in out.splitlines() if RULE_PREFIX in ln]
+        return "\n".join(lines) if lines else "(No IDPS rules found)"
+
+    def cleanup(self):
+        """Delete every IDPS_* rule; returns how many were removed."""
+        out=run_netsh(["show","rule","name=all"]); names=[]
+        for ln in out.splitlines():
+            if RULE_PREFIX in ln and "Rule Name:" in ln:
+                nm=ln.split("Rule Name:",1)[1].strip(); names.append(nm)
+        self._script([f"advfirewall firewall delete rule name={nm}" for nm in dict.fromkeys(names)])
+        return len(names)
+
+# ---- Linux ----
+def _outermost(nets):
+    """The networks in `nets` not inside another one of them."""
+    keep=[]
+    for n in sorted((ipaddress.ip_network(x) for x in nets),key=lambda n: (n.version,n.prefixlen)):
+        if not any(n.version==k.version and n.subnet_of(k) for k in keep): keep.append(n)
+    return {str(n) for n in keep}
+
+class NftBackend(FirewallBackend):
+    """inet table `idps` with sets blocked4/blocked6 matched in input and output.
+
+    Subnet blocks (CIDR elements) go to the interval sets blocked4n/blocked6n.
+
+    Every batch is one `nft -f -` transaction, however many IPs it holds.
+    """
+    name = "nft"
+    volatile = True
+
+    def __init__(self, table=NFT_TABLE, nft="nft"):
+        self.table=table; self.nft=nft
+        self.active=set(); self.ready=False
+
+    def _run(self, script):
+        proc=subprocess.run([self.nft,"-f","-"], input=script, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if proc.returncode!=0: raise RuntimeError(f"nft failed: {proc.stdout.strip()}")
+        return proc.stdout.strip()
+
+    def command(self, op, ips):
+        self.setup()
+        ips=[ip for ip in ips if (ip in self.active)==(op=="unblock")]   # deleting a missing element aborts the batch
+        if not ips: return None
+        apply=self.active.update if op=="block" else self.active.difference_update
+        single=[ip for ip in ips if "/" not in ip]; add,delete=self._intervals(op,[ip for ip in ips if "/" in ip])
+        (add if op=="block" else delete).extend(single)
+        if not (add or delete): apply(ips); return None     # only networks inside one already blocked
+        def done(rc, out):
+            if rc!=0: raise RuntimeError(f"nft failed: {out.strip()}")
+            apply(ips)
+            return out.strip() or f"nft: {'+' if op=='block' else '-'}{len(ips)}"
+        return [self.nft,"-f","-"],self._elements("delete",delete)+self._elements("add",add),done
+
+    def _intervals(self, op, nets):
+        """(add, delete) keeping only the outermost active networks in the interval sets.
+
+        Overlapping elements make nft refuse the whole transaction; auto-merge
+        would fuse neighbours into ranges a later delete no longer matches. A
+        network inside a blocked one is only remembered until the outer one goes.
+        """
+        if not nets: return [],[]
+        held={n for n in self.active if "/" in n}
+        before=_outermost(held)
+        after=_outermost(held|set(nets) if op=="block" else held-set(nets))
+        return sorted(after-before),sorted(before-after)
+
+    def setup(self):
+        if self.ready: return
+        t=self.table
+        self._run(f"""add table inet {t}
+add set inet {t} blocked4 {{ type ipv4_addr; }}
+add set inet {t} blocked6 {{ type ipv6_addr; }}
+add set inet {t} blocked4n {{ type ipv4_addr; flags interval; }}
+add set inet {t} blocked6n {{ type ipv6_addr; flags interval; }}
+add chain inet {t} input {{ type filter hook input priority -10; policy accept; }}
+add chain inet {t} output {{ type filter hook output priority -10; policy accept; }}
+flush chain inet {t} input
+flush chain inet {t} output
+add rule inet {t} input ip saddr @blocked4 drop
+add rule inet {t} input ip6 saddr @blocked6 drop
+add rule inet {t} output ip daddr @blocked4 drop
+add rule inet {t} output ip6 daddr @blocked6 drop
+add rule inet {t} input ip saddr @blocked4n drop
+add rule inet {t} input ip6 saddr @blocked6n drop
+add rule inet {t} output ip daddr @blocked4n drop
+add rule inet {t} output ip6 daddr @blocked6n drop
+""")
+        # pick up what a previous run left in the sets
+        for name in ("blocked4","blocked6","blocked4n","blocked6n"):
+            out=subprocess.run([self.nft,"list","set","inet",t,name], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout
+            m=re.search(r"elements\s*=\s*\{([^}]*)\}",out,re.S)
+            if m: self.active.update(x.strip() for x in m.group(1).split(",") if x.strip())
+        self.ready=True
+
+    def _elements(self, verb, ips):
+        sets={}
+        for ip in map(canonical,ips): sets.setdefault(("blocked6" if ":" in ip else "blocked4")+("n" if "/" in ip else ""),[]).append(ip)
+        return "".join(f"{verb} element inet {self.table} {name} {{ {', '.join(v)} }}\n" for name,v in sets.items())
+
+    def block_many(self, ips): return self._apply("block",ips)
+    def unblock_many(self, ips): return self._apply("unblock",ips)
+
+    def list_rules(self):
+        try:
+            return subprocess.run([self.nft,"list","table","inet",self.table], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout.strip() or "(No IDPS rules found)"
+        except OSError as e:
+            return str(e)
+
+    def cleanup(self):
+        n=len(self.active)
+        try: self._run(f"delete table inet {self.table}\n")
+        except RuntimeError: pass
+        self.active.clear(); self.ready=False
+        return n
+
+# ---- Dry run ----
+class RecordingBackend(FirewallBackend):
+    """Touches nothing. `delay` simulates the per-call cost of a real tool."""
+    name = "dry-run"
+
+    def __init__(self, delay=0.0):
+        self.delay=delay; self.active=set(); self.calls=0; self.ops=0; self._lock=threading.Lock()
+
+    def _call(self, op, ips):
+        if self.delay: time.sleep(self.delay)
+        return self._record(op,ips)
+
+    def _record(self, op, ips):
+        with self._lock:
+            self.calls+=1; self.ops+=len(ips)
+            (self.active.update if op=="block" else self.active.difference_update)(ips)
+        return f"[dry-run] {op} {len(ips)} IP(s)"
+
+    def block_many(self, ips): return self._call("block",list(ips))
+    def unblock_many(self, ips): return self._call("unblock",list(ips))
+
+    async def apply_async(self, op, ips):
+        if self.delay:
+            import asyncio
+            await asyncio.sleep(self.delay)
+        return self._record(op,list(ips))
+    def list_rules(self): return "\n".join(sorted(self.active)) or "(No IDPS rules found)"
+    def cleanup(self):
+        with self._lock:
+            n=len(self.active); self.active.clear()
+        return n
+
+# ---- Batching ----
+class BatchingFirewall(FirewallBackend):
+    """Queues block/unblock and applies them together every `interval` seconds.
+
+    Requests for the same IP inside one window collapse to the last one, so
+    block-then-unblock before a flush never reaches the firewall. Results
+    come back through on_result(op, ips, output, error).
+    """
+    def __init__(self, backend, interval=FIREWALL_BATCH_SECONDS, on_result=None):
+        self.backend=backend; self.interval=interval; self.on_result=on_result
+        self.name=backend.name; self.volatile=backend.volatile
+        self.pending={}                # ip -> "block" | "unblock"
+        self._cv=threading.Condition(); self._stop=False
+        self.batches=0; self.applied=0
+        self._thread=threading.Thread(target=self._run,name="idps-firewall",daemon=True)
+        self._thread.start()
+
+    def block(self, ip): return self._queue(ip,"block")
+    def unblock(self, ip): return self._queue(ip,"unblock")
+    def block_many(self, ips):
+        for ip in ips: self._queue(ip,"block")
+        return ""
+    def unblock_many(self, ips):
+        for ip in ips: self._queue(ip,"unblock")
+        return ""
+
+    def _queue(self, ip, op):
+        with self._cv:
+            self.pending[ip]=op; self._cv.notify()
+        return f"{op} queued ({self.name})"
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self.pending and not self._stop: self._cv.wait()
+                if self._stop and not self.pending: return
+            time.sleep(self.interval)          # let the window fill up
+            self.flush()
+
+    def flush(self):
+        with self._cv:
+            batch=self.pending; self.pending={}
+        if not batch: return
+        for op in ("unblock","block"):
+            ips=[ip for ip,o in batch.items() if o==op]
+            if not ips: continue
+            t=time.perf_counter()
+            try:
+                out=(self.backend.block_many if op=="block" else self.backend.unblock_many)(ips); err=None
+            except Exception as e:
+                out=""; err=str(e)
+            FIREWALL_SECONDS.since(t)
+            self.batches+=1; self.applied+=len(ips)
+            if self.on_result:
+                try: self.on_result(op,ips,out,err)
+                except Exception: pass
+
+    def list_rules(self):
+        self.flush(); return self.backend.list_rules()
+
+    def cleanup(self):
+        with self._cv: self.pending.clear()
+        return self.backend.cleanup()
+
+    def close(self):
+        with self._cv:
+            self._stop=True; self._cv.notify()
+        self._thread.join(5); self.flush(); self.backend.close()
+
+BACKENDS = {"netsh": NetshBackend, "nft": NftBackend, "dry-run": RecordingBackend}
+
+def default_backend(name="auto"):
+    if name=="auto":
+        if sys.platform.startswith("win"): name="netsh"
+        elif shutil.which("nft"): name="nft"
+        else: name="dry-run"
+    return BACKENDS[name]()
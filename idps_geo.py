@@ -0,0 +1,217 @@
+# idps_geo.py — attacker geolocation
+#
+# Providers are callables ip -> (label, lat, lon):
+#   HttpGeo   ip-api.com, with a timeout
+#   RangeDB   local IPv4 range table (CSV compiled to a mmap-able .bin), bisect lookup
+#   GeoChain  first provider that knows the IP wins
+#   GeoCache  bounded LRU + TTL in front of any provider, caches misses too
+import os, sys, json, time, socket, mmap, bisect, threading
+from array import array
+from collections import OrderedDict
+
+GEOLOOKUP = True
+GEO_DB = "geoip.csv"               # optional local range DB (used if present)
+GEO_TIMEOUT = 2.0                  # seconds for the online lookup
+GEO_CACHE_SIZE = 4096
+GEO_TTL = 6*3600                   # positive answers
+GEO_NEG_TTL = 300                  # "Unknown" answers
+UNKNOWN = ("Unknown", None, None)
+
+def ip4_int(ip):
+    return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+
+# ---- Online ----
+IP_API_HOST = "ip-api.com"
+IP_API_PATH = "/json/{ip}?fields=status,country,city,lat,lon,query"
+
+def parse_ip_api(body):
+    d=json.loads(body)
+    if d.get("status")!="success": return UNKNOWN
+    city=d.get("city") or ""; country=d.get("country") or ""
+    label=f"{city}, {country}".strip(", ")
+    return (label or "Unknown", d.get("lat"), d.get("lon"))
+
+class HttpGeo:
+    def __init__(self, timeout=GEO_TIMEOUT):
+        self.timeout=timeout
+
+    def __call__(self, ip):
+        try:
+            import urllib.request      # first online lookup only: http.client + ssl are slow to import
+            with urllib.request.urlopen(f"http://{IP_API_HOST}{IP_API_PATH.format(ip=ip)}", timeout=self.timeout) as r:
+                return parse_ip_api(r.read().decode())
+        except: pass
+        return UNKNOWN
+
+# ---- Offline range DB ----
+class RangeDB:
+    """Sorted, non-overlapping IPv4 ranges -> place; lookup is one bisect.
+
+    CSV rows are either `start_ip,end_ip,country,city,lat,lon` or
+    `cidr,country,city,lat,lon` (header lines and #comments are skipped).
+    The compiled .bin holds five 4-byte columns (start, end, label index,
+    lat, lon) plus a JSON label table, and is memory-mapped on load.
+    """
+    MAGIC = b"IDPSGEO2"
+    COLS = "IIIff"
+
+    def __init__(self, starts, ends, labels_idx, lats, lons, labels, _mm=None):
+        self.starts=starts; self.ends=ends; self.labels_idx=labels_idx
+        self.lats=lats; self.lons=lons; self.labels=labels
+        self._mm=_mm
+
+    def __len__(self): return len(self.starts)
+
+    def __call__(self, ip):
+        try: n=ip4_int(ip)
+        except OSError: return UNKNOWN
+        i=bisect.bisect_right(self.starts,n)-1
+        if i<0 or n>self.ends[i]: return UNKNOWN
+        lat=self.lats[i]; lon=self.lons[i]
+        if lat!=lat or lon!=lon: return (self.labels[self.labels_idx[i]],None,None)   # NaN = no coordinates
+        lat=round(lat,4); lon=round(lon,4)
+        return (self.labels[self.labels_idx[i]],lat,lon)
+
+    # ---- building ----
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: (start_int, end_int, label, lat, lon)"""
+        cols=[array(t) for t in cls.COLS]; labels=[]; index={}
+        starts,ends,lidx,lats,lons=cols
+        last_end=-1; nan=float("nan")
+        for s,e,label,lat,lon in sorted(rows):
+            if s<=last_end: s=last_end+1          # overlap: first range wins
+            if s>e: continue
+            if label not in index: index[label]=len(labels); labels.append(label)
+            starts.append(s); ends.append(e); lidx.append(index[label])
+            lats.append(nan if lat is None else lat); lons.append(nan if lon is None else lon)
+            last_end=e
+        return cls(*cols,labels)
+
+    @classmethod
+    def load_csv(cls, path):
+        import csv, ipaddress
+        rows=[]
+        with open(path,newline="",encoding="utf-8") as fp:
+            for rec in csv.reader(fp):
+                if not rec or rec[0].startswith("#"): continue
+                try:
+                    if "/" in rec[0]:
+                        net=ipaddress.IPv4Network(rec[0].strip(),strict=False)
+                        s,e=int(net.network_address),int(net.broadcast_address); rest=rec[1:]
+                    else:
+                        s,e=(int(x) if x.strip().isdigit() else ip4_int(x.strip()) for x in rec[:2]); rest=rec[2:]
+                    country,city=rest[0].strip(),rest[1].strip()
+                    lat=float(rest[2]) if len(rest)>2 and rest[2].strip() else None
+                    lon=float(rest[3]) if len(rest)>3 and rest[3].strip() else None
+                except (ValueError,OSError,IndexError):
+                    continue                      # header or junk line
+                label=f"{city}, {country}".strip(", ") or "Unknown"
+                rows.append((s,e,label,lat,lon))
+        return cls.from_rows(rows)
+
+    def save(self, path):
+        blob=json.dumps(self.labels).encode()
+        hdr=self.MAGIC+(b"L" if sys.byteorder=="little" else b"B")+b"\0\0\0"
+        tmp=path+".tmp"
+        with open(tmp,"wb") as fp:
+            fp.write(hdr); fp.write(array("I",[len(self.starts),len(blob)]).tobytes())
+            for col in (self.starts,self.ends,self.labels_idx,self.lats,self.lons):
+                fp.write(bytes(col) if isinstance(col,memoryview) else col.tobytes())
+            fp.write(blob)
+        os.replace(tmp,path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path,"rb") as fp:
+            mm=mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ)
+        order=b"L" if sys.byteorder=="little" else b"B"
+        if mm[:8]!=cls.MAGIC or mm[8:9]!=order:
+            mm.close(); raise ValueError(f"{path}: not a compiled geo DB for this platform")
+        n,blob_len=array("I",mm[12:20])
+        view=memoryview(mm); off=20; cols=[]
+        for t in cls.COLS:
+            cols.append(view[off:off+4*n].cast(t)); off+=4*n
+        labels=json.loads(bytes(view[off:off+blob_len]))
+        return cls(*cols,labels,_mm=mm)
+
+    @classmethod
+    def open(cls, path):
+        """Load a .bin, or a CSV via its compiled `<csv>.bin` (rebuilt when stale)."""
+        if not path.endswith(".csv"): return cls.load(path)
+        bin_path=path+".bin"
+        try:
+            if os.path.getmtime(bin_path)>=os.path.getmtime(path): return cls.load(bin_path)
+        except (OSError,ValueError): pass
+        db=cls.load_csv(path)
+        try:
+            db.save(bin_path); return cls.load(bin_path)
+        except OSError:
+            return db                             # read-only dir: keep the in-memory copy
+
+# ---- Composition ----
+class GeoChain:
+    def __init__(self, *providers):
+        self.providers=providers
+
+    def __call__(self, ip):
+        for p in self.providers:
+            r=p(ip)
+            if r[1] is not None or r[0]!="Unknown": return r
+        return UNKNOWN
+
+class GeoCache:
+    """LRU with per-entry expiry; misses are cached for negative_ttl."""
+    def __init__(self, provider, size=GEO_CACHE_SIZE, ttl=GEO_TTL, negative_ttl=GEO_NEG_TTL, clock=time.monotonic):
+        self.provider=provider; self.size=size; self.ttl=ttl; self.negative_ttl=negative_ttl
+        self.clock=clock; self._d=OrderedDict(); self._lock=threading.Lock()
+        self.hits=0; self.misses=0
+
+    def __call__(self, ip):
+        r=self.get(ip)
+        if r is None:
+            r=self.provider(ip); self.put(ip,r)
+        return r
+
+    def get(self, ip):
+        """Cached answer, or None (counted as a miss)."""
+        now=self.clock()
+        with self._lock:
+            ent=self._d.get(ip)
+            if ent is not None and ent[0]>now:
+                self._d.move_to_end(ip); self.hits+=1
+                return ent[1]
+            self.misses+=1
+        return None
+
+    def put(self, ip, r):
+        ttl=self.ttl if r!=UNKNOWN else self.negative_ttl
+        with self._lock:
+            self._d[ip]=(self.clock()+ttl,r); self._d.move_to_end(ip)
+            while len(self._d)>self.size: self._d.popitem(last=False)
+
+    def __len__(self): return len(self._d)
+    def clear(self):
+        with self._lock: self._d.clear()
+
+def make_provider(db_path=GEO_DB, online=True):
+    parts=[]
+    if db_path and os.path.exists(db_path): parts.append(RangeDB.open(db_path))
+    if online: parts.append(HttpGeo())
+    if not parts: return lambda ip: UNKNOWN
+    return GeoCache(parts[0] if len(parts)==1 else GeoChain(*parts))
+
+_provider=None
+_provider_lock=threading.Lock()
+
+def set_provider(p):
+    global _provider
+    _provider=p
+
+def get_geo(ip):
+    global _provider
+    if not GEOLOOKUP: return UNKNOWN
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None: _provider=make_provider()
+    return _provider(ip)
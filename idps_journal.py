@@ -0,0 +1,194 @@
+# idps_journal.py — engine state that survives restarts
+#
+#   <path>.snap     compact snapshot: window counters, blocks, whitelist, alert-rate rings
+#   <path>.journal  append-only changes since that snapshot
+#
+# The engine appends each state change to `engine.journal` (a plain list)
+# under its lock; a writer thread swaps the list out every `flush_every`
+# seconds and writes it in one go, so the hot path never touches the disk.
+# A snapshot copies the state and swaps the list under the same lock, which
+# makes snapshot + journal exactly the engine's history. Both files carry a
+# generation number; a journal from an older generation (crash between the
+# two writes) is already inside the snapshot and is skipped.
+import os, sys, json, time, threading
+from array import array
+from idps_engine import ip_key, V6_TAG
+
+JOURNAL_PATH = "idps_state"        # -> idps_state.snap / idps_state.journal
+JOURNAL_FLUSH = 0.2                # seconds between journal writes
+SNAPSHOT_EVERY = 300.0             # seconds between snapshots...
+SNAPSHOT_JOURNAL_BYTES = 32 << 20  # ...or sooner once the journal is this big
+
+MAGIC = b"IDPSSNAP2\n"
+MAGIC_V1 = b"IDPSSNAP1\n"           # IP strings instead of packed keys; still readable
+
+def _blob(strings): return "\n".join(strings).encode()
+def _strings(b): return b.decode().split("\n") if b else []
+
+def _pack_keys(keys):
+    """Packed IP keys -> (width, bytes): 4-byte words while there is no IPv6 key, else 17 bytes each."""
+    if not keys or max(keys)<V6_TAG: return 4,array("I",keys).tobytes()
+    return 17,b"".join(k.to_bytes(17,"big") for k in keys)
+
+def _unpack_keys(width, b):
+    if width==4:
+        a=array("I"); a.frombytes(b); return a.tolist()
+    return [int.from_bytes(b[i:i+width],"big") for i in range(0,len(b),width)]
+
+class StateJournal:
+    def __init__(self, engine, path=JOURNAL_PATH, flush_every=JOURNAL_FLUSH, snapshot_every=SNAPSHOT_EVERY,
+                 max_journal=SNAPSHOT_JOURNAL_BYTES, fsync=False):
+        self.engine=engine; self.path=path
+        self.snap_path=path+".snap"; self.journal_path=path+".journal"
+        self.flush_every=flush_every; self.snapshot_every=snapshot_every
+        self.max_journal=max_journal; self.fsync=fsync
+        self.gen=0; self._fp=None; self._whitelist=set()
+        self._thread=None; self._stop=threading.Event(); self._io=threading.Lock()
+        self.records=0; self.snapshots=0; self.last_snapshot=time.monotonic()
+
+    # ---- startup ----
+    def load(self):
+        """Snapshot, then the journal tail, into a fresh engine. Returns what was restored."""
+        t=time.perf_counter(); eng=self.engine; res={"snapshot_ips":0,"journal_records":0}
+        try:
+            with open(self.snap_path,"rb") as fp: data=fp.read()
+            st,self.gen=self._decode(data)
+            eng.load_state(st); res["snapshot_ips"]=len(st["fail"][0])+len(st["scan"][0])
+        except FileNotFoundError: pass
+        except (ValueError,KeyError) as e:
+            eng.emit("error",f"state snapshot unreadable, starting empty: {e}")
+        res["journal_records"]=self._replay_journal()
+        with eng.lock:
+            eng._gc(eng.clock()); eng.reindex_blocks(); self._whitelist=set(eng.whitelist)
+        res["seconds"]=round(time.perf_counter()-t,3)
+        return res
+
+    def _replay_journal(self):
+        eng=self.engine; n=0; wl=None
+        try: fp=open(self.journal_path,encoding="utf-8")
+        except FileNotFoundError: return 0
+        with fp, eng.lock:
+            head=fp.readline()
+            if head!=f"#gen {self.gen}\n": return 0    # another generation, or a garbled header: same test as start()
+            for line in fp:
+                if not line.endswith("\n"): break          # torn last write
+                rec=line[:-1].split("\t"); op=rec[0]
+                try:
+                    if op in ("fail","scan"): eng.replay(op,rec[1],float(rec[2]),rec[3]=="1")
+                    elif op=="block": eng.blocked_until[rec[1]]=float(rec[2])
+                    elif op=="unblock": eng.blocked_until.pop(rec[1],None)
+                    elif op in ("allow","disallow"):
+                        if wl is None: wl=set(eng.whitelist)
+                        (wl.add if op=="allow" else wl.discard)(rec[1])
+                except (IndexError,ValueError): break
+                n+=1
+            if wl is not None: eng.whitelist.reload(wl)     # one index build, not one per record
+        return n
+
+    # ---- running ----
+    def start(self):
+        with self.engine.lock:
+            if self.engine.journal is None: self.engine.journal=[]
+        try:
+            with open(self.journal_path,encoding="utf-8") as fp: head=fp.readline()
+        except FileNotFoundError: head=""
+        if head==f"#gen {self.gen}\n": self._fp=open(self.journal_path,"a",encoding="utf-8")
+        else: self._open_journal()     # missing, or from another generation: load() skipped it, so would the next
+        self._thread=threading.Thread(target=self._run,name="idps-journal",daemon=True)
+        self._thread.start()
+        return self
+
+    def _open_journal(self):
+        if self._fp is not None: self._fp.close()
+        self._fp=open(self.journal_path,"w",encoding="utf-8")
+        self._fp.write(f"#gen {self.gen}\n"); self._fp.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_every):
+            try:
+                if (time.monotonic()-self.last_snapshot>=self.snapshot_every
+                        or (self._fp is not None and self._fp.tell()>=self.max_journal)):
+                    self.snapshot()
+                else:
+                    self.flush()
+            except OSError as e:
+                self.engine.emit("error",f"state journal: {e}")
+
+    def _take(self):
+        eng=self.engine
+        with eng.lock:
+            recs=eng.journal; eng.journal=[]
+            wl=set(eng.whitelist)
+        # whitelist is edited in place by the GUI/CLI: journal the difference
+        recs+=[("allow",ip) for ip in wl-self._whitelist]+[("disallow",ip) for ip in self._whitelist-wl]
+        self._whitelist=wl
+        return recs
+
+    def flush(self):
+        with self._io:
+            recs=self._take()
+            if not recs or self._fp is None: return 0
+            out=[]
+            for r in recs:
+                if r[0] in ("fail","scan"): out.append(f"{r[0]}\t{r[1]}\t{r[2]!r}\t{1 if r[3] else 0}\n")
+                elif r[0]=="block": out.append(f"block\t{r[1]}\t{r[2]!r}\n")
+                else: out.append(f"{r[0]}\t{r[1]}\n")
+            self._fp.write("".join(out)); self._fp.flush()
+            if self.fsync: os.fsync(self._fp.fileno())
+            self.records+=len(recs)
+            return len(recs)
+
+    def snapshot(self):
+        """Write a full snapshot and start an empty journal."""
+        eng=self.engine
+        with self._io:
+            with eng.lock:
+                st=eng.export_state()
+                if eng.journal is not None: eng.journal=[]     # all of it is in `st`
+            self._whitelist=set(st["whitelist"])
+            self.gen+=1
+            tmp=self.snap_path+".tmp"
+            with open(tmp,"wb") as fp:
+                fp.write(self._encode(st))
+                fp.flush(); os.fsync(fp.fileno())
+            os.replace(tmp,self.snap_path)
+            if self._fp is not None or self._thread is not None: self._open_journal()
+            self.snapshots+=1; self.last_snapshot=time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None: self._thread.join(5)
+        try: self.snapshot()
+        except OSError as e: self.engine.emit("error",f"state snapshot: {e}")
+        with self.engine.lock: self.engine.journal=None
+        if self._fp is not None: self._fp.close(); self._fp=None
+
+    # ---- snapshot format: magic, one JSON header line, then raw blobs ----
+    def _encode(self, st):
+        blobs=[]; sec={}; width={}
+        def put(name, b): sec[name]=len(b); blobs.append(b)
+        for kind in ("fail","scan"):
+            keys,counts,ts=st[kind]; width[kind],b=_pack_keys(keys)
+            put(kind+".keys",b); put(kind+".counts",counts.tobytes()); put(kind+".ts",ts.tobytes())
+        put("blocked.ips",_blob(st["blocked"])); put("blocked.until",array("d",st["blocked"].values()).tobytes())
+        put("whitelist",_blob(st["whitelist"]))
+        hdr={"gen":self.gen,"saved":time.time(),"byteorder":sys.byteorder,"window":st["window"],"key_width":width,
+             "sections":list(sec.items()),"rate":{str(k):v for k,v in st["rate"].items()}}
+        return MAGIC+json.dumps(hdr).encode()+b"\n"+b"".join(blobs)
+
+    @staticmethod
+    def _decode(data):
+        v1=data.startswith(MAGIC_V1)
+        if not v1 and not data.startswith(MAGIC): raise ValueError("not an IDPS snapshot")
+        nl=data.index(b"\n",len(MAGIC)); hdr=json.loads(data[len(MAGIC):nl])
+        if hdr["byteorder"]!=sys.byteorder: raise ValueError("snapshot written on a different byte order")
+        sec={}; off=nl+1
+        for name,n in hdr["sections"]: sec[name]=data[off:off+n]; off+=n
+        def arr(t, b): a=array(t); a.frombytes(b); return a
+        st={"window":hdr["window"],"whitelist":_strings(sec["whitelist"]),
+            "rate":{int(k):v for k,v in hdr["rate"].items()}}
+        for kind in ("fail","scan"):
+            keys=[ip_key(ip) for ip in _strings(sec[kind+".ips"])] if v1 else _unpack_keys(hdr["key_width"][kind],sec[kind+".keys"])
+            st[kind]=(keys,arr("I",sec[kind+".counts"]),arr("d",sec[kind+".ts"]))
+        st["blocked"]=dict(zip(_strings(sec["blocked.ips"]),arr("d",sec["blocked.until"])))
+        return st,hdr["gen"]
@@ -0,0 +1,105 @@
+# idps_loadgen.py — synthetic auth.log traffic, same line formats as the Simulator tab
+#   python idps_loadgen.py --out fake_auth.log --rate 200000 --duration 10 --ips 5000
+#   python idps_loadgen.py --out - --count 1000000 --noise 0.98 | python idps_replay.py -
+import argparse, os, random, sys, time
+from datetime import datetime
+
+LOADGEN_BATCH = 2000               # lines rendered and written per write()
+
+def fail_line(ip, user="invalid user test", ts=None):
+    return f"{ts or datetime.now()} Failed password for {user} from {ip}\n"
+
+def scan_line(ip, ts=None):
+    return f"{ts or datetime.now()} Port scan (SYN burst) from {ip}\n"
+
+NOISE = (
+    " sshd[{p}]: Accepted publickey for deploy from 10.0.{a}.{b} port {port} ssh2\n",
+    " sshd[{p}]: pam_unix(sshd:session): session opened for user deploy(uid=1000) by (uid=0)\n",
+    " sshd[{p}]: Received disconnect from 10.0.{a}.{b} port {port}:11: disconnected by user\n",
+    " CRON[{p}]: pam_unix(cron:session): session closed for user root\n",
+    " sudo: deploy : TTY=pts/0 ; PWD=/home/deploy ; USER=root ; COMMAND=/usr/bin/systemctl status\n",
+    " systemd[1]: Started Session {p} of user deploy.\n",
+)
+
+class LoadGen:
+    """Renders batches of log lines.
+
+    Every attacker IP gets one pre-rendered fail line and one scan line, and
+    there is a fixed pool of noise lines, so a batch is a timestamp string
+    glued to suffixes picked with random.choices. `mix` is the share of
+    attack lines that are failed logins (the rest are port scans); `noise`
+    is the share of all lines that are benign.
+    """
+    def __init__(self, ips=1000, mix=0.7, noise=0.9, subnet=None, seed=1, noise_pool=512):
+        rnd=self.rnd=random.Random(seed)
+        if subnet:                     # e.g. "203.0.113." -> a botnet spraying one /24
+            addrs=[f"{subnet}{i}" for i in range(1,255)][:ips]
+        else:
+            seen=set()
+            while len(seen)<ips:
+                seen.add(f"{rnd.randint(1,223)}.{rnd.randint(0,255)}.{rnd.randint(0,255)}.{rnd.randint(1,254)}")
+            addrs=list(seen)
+        self.ips=addrs
+        fails=[f" Failed password for invalid user test from {ip}\n" for ip in addrs]
+        scans=[f" Port scan (SYN burst) from {ip}\n" for ip in addrs]
+        noise_lines=[rnd.choice(NOISE).format(p=rnd.randint(100,65000),a=rnd.randint(0,255),b=rnd.randint(1,254),
+                                               port=rnd.randint(1024,65535)) for _ in range(noise_pool)]
+        attack=1.0-noise
+        self.pool=fails+scans+noise_lines
+        self.weights=([attack*mix/len(fails)]*len(fails)+[attack*(1-mix)/len(scans)]*len(scans)
+                      +[noise/len(noise_lines)]*len(noise_lines))
+        self._cum=None
+
+    def batch(self, n, ts=None):
+        """n lines as one str, all stamped `ts` (default: now, local time like the simulator)."""
+        if self._cum is None:
+            self._cum=[]; acc=0.0
+            for w in self.weights: acc+=w; self._cum.append(acc)
+        ts=str(ts or datetime.now())
+        picks=self.rnd.choices(self.pool,cum_weights=self._cum,k=n)
+        return ts+ts.join(picks)
+
+    def run(self, fd, rate=0, duration=None, count=None, batch=LOADGEN_BATCH, on_write=None):
+        """Write to file descriptor `fd` at `rate` lines/s (0 = flat out) until duration/count."""
+        t0=time.perf_counter(); written=0
+        while True:
+            n=batch if count is None else min(batch,count-written)
+            if n<=0: break
+            if duration is not None and time.perf_counter()-t0>=duration: break
+            data=self.batch(n).encode()
+            try:
+                while data: data=data[os.write(fd,data):]
+            except BrokenPipeError:
+                break
+            written+=n
+            if on_write: on_write(written)
+            if rate:
+                ahead=written/rate-(time.perf_counter()-t0)
+                if ahead>0: time.sleep(ahead)
+        secs=time.perf_counter()-t0
+        return {"lines":written,"seconds":round(secs,3),"lines_per_sec":round(written/secs) if secs else None}
+
+def main(argv=None):
+    ap=argparse.ArgumentParser(description="Write synthetic attack + noise log lines.")
+    ap.add_argument("--out",default="fake_auth.log",help="file to append to, or - for stdout")
+    ap.add_argument("--rate",type=float,default=0,help="lines per second (0 = as fast as possible)")
+    ap.add_argument("--duration",type=float,help="seconds to run")
+    ap.add_argument("--count",type=int,help="lines to write")
+    ap.add_argument("--ips",type=int,default=1000,help="distinct attacker IPs")
+    ap.add_argument("--subnet",help='spray one /24 instead, e.g. "203.0.113."')
+    ap.add_argument("--mix",type=float,default=0.7,help="share of attack lines that are failed logins")
+    ap.add_argument("--noise",type=float,default=0.9,help="share of lines that are benign")
+    ap.add_argument("--seed",type=int,default=1)
+    args=ap.parse_args(argv)
+    if args.duration is None and args.count is None: args.duration=10.0
+    gen=LoadGen(args.ips,args.mix,args.noise,args.subnet,args.seed)
+    fd=sys.stdout.fileno() if args.out=="-" else os.open(args.out,os.O_WRONLY|os.O_CREAT|os.O_APPEND|getattr(os,"O_BINARY",0),0o644)
+    try:
+        res=gen.run(fd,args.rate,args.duration,args.count)
+    finally:
+        if args.out!="-": os.close(fd)
+    print(f"wrote {res['lines']:,} lines in {res['seconds']}s ({res['lines_per_sec'] or 0:,} lines/s)", file=sys.stderr)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
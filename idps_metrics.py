@@ -0,0 +1,191 @@
+# idps_metrics.py — counters, latency histograms, /metrics endpoint, sampling profiler
+#
+# Everything here is stdlib and cheap enough for the hot path: a counter is
+# one add, a histogram observation one bisect over ~20 bounds. Updates are
+# not locked; under thread contention a rare increment may be lost, which is
+# fine for monitoring. render() emits the Prometheus text format.
+import bisect, collections, os, sys, threading, time
+
+METRICS_PORT = 9108
+LATENCY_BUCKETS = tuple(b*m for m in (1e-6,1e-5,1e-4,1e-3,1e-2,1e-1,1.0) for b in (1,2.5,5))+(10.0,)
+
+class Counter:
+    kind = "counter"
+    def __init__(self, name, help):
+        self.name=name; self.help=help; self.value=0
+    def inc(self, n=1): self.value+=n
+    def samples(self): yield self.name, self.value
+
+class Gauge:
+    """Value read from `fn` at scrape time, so owners never have to push it."""
+    kind = "gauge"
+    def __init__(self, name, help, fn):
+        self.name=name; self.help=help; self.fn=fn
+    def samples(self):
+        try: yield self.name, self.fn()
+        except Exception: pass
+
+class Histogram:
+    kind = "histogram"
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name=name; self.help=help; self.bounds=tuple(buckets)
+        self.counts=[0]*(len(self.bounds)+1); self.sum=0.0; self.count=0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.bounds,v)]+=1; self.sum+=v; self.count+=1
+
+    def since(self, t0):
+        """observe(perf_counter() - t0); returns now, to chain stages."""
+        t=time.perf_counter(); self.observe(t-t0); return t
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count: return None
+        rank=q*self.count; acc=0
+        for b,c in zip(self.bounds+(float("inf"),),self.counts):
+            acc+=c
+            if acc>=rank: return b
+        return float("inf")
+
+    def samples(self):
+        acc=0
+        for b,c in zip(self.bounds,self.counts):
+            acc+=c; yield f'{self.name}_bucket{{le="{b:g}"}}', acc
+        yield f'{self.name}_bucket{{le="+Inf"}}', self.count
+        yield self.name+"_sum", self.sum
+        yield self.name+"_count", self.count
+
+class Registry:
+    def __init__(self):
+        self.metrics=collections.OrderedDict()
+
+    def add(self, m):
+        self.metrics[m.name]=m; return m
+
+    def counter(self, name, help): return self.metrics.get(name) or self.add(Counter(name,help))
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS): return self.metrics.get(name) or self.add(Histogram(name,help,buckets))
+    def gauge(self, name, help, fn): return self.add(Gauge(name,help,fn))   # re-registering replaces the source
+
+    def render(self):
+        out=[]
+        for m in list(self.metrics.values()):
+            out.append(f"# HELP {m.name} {m.help}"); out.append(f"# TYPE {m.name} {m.kind}")
+            for k,v in m.samples(): out.append(f"{k} {v:g}" if isinstance(v,float) else f"{k} {v}")
+        return "\n".join(out)+"\n"
+
+    def summary(self, last=None, dt=None):
+        """One readable line per metric -> (text, counters); pass the counters back for per-second rates."""
+        lines=[]; now={}
+        for m in list(self.metrics.values()):
+            if m.kind=="counter":
+                now[m.name]=m.value
+                rate=f"  {(m.value-last[m.name])/dt:>12,.0f}/s" if last and dt and m.name in last else ""
+                lines.append(f"{m.name:<28} {m.value:>14,}{rate}")
+            elif m.kind=="gauge":
+                for k,v in m.samples(): lines.append(f"{k:<28} {v:>14,}")
+            else:
+                q=lambda p: fmt_seconds(m.quantile(p))
+                lines.append(f"{m.name:<28} {m.count:>14,}  p50 {q(.5):>7}  p95 {q(.95):>7}  p99 {q(.99):>7}")
+        return "\n".join(lines), now
+
+def fmt_seconds(s):
+    if s is None: return "-"
+    if s==float("inf"): return ">10s"
+    return f"{s*1e6:g}us" if s<1e-3 else f"{s*1e3:g}ms" if s<1 else f"{s:g}s"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+
+# ---- Stage metrics (shared by engine, tailer, responder, firewall, GUI) ----
+LINES = counter("idps_lines_total","Log lines read by tailers")
+BYTES = counter("idps_read_bytes_total","Log bytes read by tailers")
+HITS = counter("idps_hits_total","Lines that matched a signature")
+ALERTS = counter("idps_alerts_total","Alerts raised")
+READ_SECONDS = histogram("idps_read_seconds","Tailer read time per block")
+CLASSIFY_SECONDS = histogram("idps_classify_seconds","Signature matching time per block")
+COUNT_SECONDS = histogram("idps_count_seconds","Sliding-window counting time per block")
+ENRICH_SECONDS = histogram("idps_enrich_seconds","Geo lookup time per alert")
+FIREWALL_SECONDS = histogram("idps_firewall_seconds","Firewall backend time per batch")
+UI_RENDER_SECONDS = histogram("idps_ui_render_seconds","GUI event drain + table sync per tick")
+gauge("idps_threads","Live Python threads",threading.active_count)
+
+# ---- Sampling profiler ----
+class SamplingProfiler:
+    """Every `interval` seconds, note the innermost frame of every other thread.
+
+    Cost is one sys._current_frames() per sample; off (no thread) until start().
+    """
+    def __init__(self, interval=0.005, depth=1):
+        self.interval=interval; self.depth=depth
+        self.samples=collections.Counter(); self.taken=0
+        self._thread=None; self._stop=threading.Event()
+
+    @property
+    def running(self): return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread=threading.Thread(target=self._run,name="idps-profiler",daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set(); self._thread.join(2); self._thread=None
+
+    def reset(self):
+        self.samples.clear(); self.taken=0
+
+    def _run(self):
+        me=threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid,f in sys._current_frames().items():
+                if tid==me: continue
+                key=[]
+                while f is not None and len(key)<self.depth:
+                    key.append(f"{os.path.basename(f.f_code.co_filename)}:{f.f_lineno} {f.f_code.co_name}")
+                    f=f.f_back
+                self.samples[" <- ".join(key)]+=1
+            self.taken+=1
+
+    def report(self, n=25):
+        total=sum(self.samples.values()) or 1
+        lines=[f"{self.taken} samples every {self.interval*1e3:g} ms ({'running' if self.running else 'stopped'})"]
+        for k,c in self.samples.most_common(n): lines.append(f"{100*c/total:6.2f}%  {k}")
+        return "\n".join(lines)+"\n"
+
+PROFILER = SamplingProfiler()
+
+# ---- HTTP endpoint ----
+# http.server is imported on first serve(): it costs ~40 ms at startup otherwise.
+def _handler():
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            u=urlparse(self.path); q=parse_qs(u.query)
+            if u.path=="/metrics":
+                body=REGISTRY.render(); ctype="text/plain; version=0.0.4"
+            elif u.path=="/profile":
+                act=q.get("action",[""])[0]
+                if act=="start": PROFILER.start()
+                elif act=="stop": PROFILER.stop()
+                elif act=="reset": PROFILER.reset()
+                body=PROFILER.report(int(q.get("top",["25"])[0])); ctype="text/plain"
+            else:
+                self.send_error(404); return
+            data=body.encode()
+            self.send_response(200); self.send_header("Content-Type",ctype)
+            self.send_header("Content-Length",str(len(data))); self.end_headers(); self.wfile.write(data)
+
+        def log_message(self, *a): pass
+    return _Handler
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+    """Start /metrics and /profile?action=start|stop|reset on a daemon thread; returns the server."""
+    from http.server import ThreadingHTTPServer
+    srv=ThreadingHTTPServer((host,port),_handler()); srv.daemon_threads=True
+    threading.Thread(target=srv.serve_forever,name="idps-metrics",daemon=True).start()
+    return srv
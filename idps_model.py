@@ -0,0 +1,173 @@
+# idps_model.py — what the events table shows, kept apart from the widget
+#
+# The Treeview only mirrors this: rows are found by (ip, type) or by ip
+# through dicts, updated in place, and pushed to the widget in one sync
+# per UI tick. Unblocks read from here, never from the widget; history and
+# exports come from the event store (idps_store). MapModel does the same for
+# the attack map: dots clustered per cell/city/country, a fixed number of
+# canvas items, and pulses advanced by one frame call on the Tk thread.
+import math
+from collections import OrderedDict
+from idps_engine import utc
+
+COLUMNS = ("ip","time","type","count","geo","status")
+
+_last_ts = [None, ""]
+
+def fmt_ts(ts):
+    sec=int(ts)
+    if sec!=_last_ts[0]: _last_ts[:]=[sec,utc(sec).strftime("%Y-%m-%d %H:%M:%S")]   # bursts share a second
+    return _last_ts[1]
+
+def display(rec):
+    """(ip, ts, type, count, geo, status) -> column values"""
+    return (rec[0], fmt_ts(rec[1]))+tuple(rec[2:])
+
+class Row:
+    __slots__ = ("ip","ts","typ","count","geo","status","iid")
+
+    def __init__(self, ip, ts, typ, count, status):
+        self.ip=ip; self.ts=ts; self.typ=typ; self.count=count
+        self.geo=""; self.status=status; self.iid=None
+
+    def record(self): return (self.ip, self.ts, self.typ, self.count, self.geo, self.status)
+    def values(self): return display(self.record())
+
+class EventTable:
+    """One row per (ip, type), at most `max_rows`; the least recently updated drop off."""
+    def __init__(self, max_rows=500):
+        self.max_rows=max_rows
+        self.rows=OrderedDict()        # (ip, type) -> Row, least recently updated first
+        self.by_ip={}                  # ip -> {type: Row}
+        self.by_iid={}                 # widget id -> Row
+        self._added={}; self._changed={}; self._gone=[]
+
+    def __len__(self): return len(self.rows)
+
+    def hit(self, ip, typ, ts, cnt, status=None):
+        key=(ip,typ); r=self.rows.get(key)
+        if r is None:
+            r=Row(ip,ts,typ,cnt,status or "seen")
+            self.rows[key]=r; self.by_ip.setdefault(ip,{})[typ]=r; self._added[id(r)]=r
+            while len(self.rows)>self.max_rows: self._evict()
+            return r
+        self.rows.move_to_end(key)
+        r.ts=ts; r.count=cnt
+        if status: r.status=status
+        self._touch(r)
+        return r
+
+    def enrich(self, ip, label, status):
+        """Fill geo/status on the attacker's rows that have no geo yet."""
+        rows=[r for r in self.by_ip.get(ip,{}).values() if not r.geo]
+        for r in rows:
+            r.geo=label; r.status=status; self._touch(r)
+        return rows
+
+    def _touch(self, r):
+        if r.iid is not None: self._changed[id(r)]=r
+
+    def _evict(self):
+        (ip,typ),r=self.rows.popitem(last=False)
+        d=self.by_ip[ip]; del d[typ]
+        if not d: del self.by_ip[ip]
+        if self._added.pop(id(r),None) is None:     # already on screen
+            self._changed.pop(id(r),None); self._gone.append(r)
+
+    def sync(self, insert, update, delete):
+        """Apply pending changes through insert(values)->iid / update(iid, values) / delete(iid)."""
+        for r in self._gone:
+            self.by_iid.pop(r.iid,None); delete(r.iid)
+        for r in self._changed.values(): update(r.iid,r.values())
+        for r in self._added.values():
+            r.iid=insert(r.values()); self.by_iid[r.iid]=r
+        n=len(self._gone)+len(self._changed)+len(self._added)
+        self._added={}; self._changed={}; self._gone=[]
+        return n
+
+    def row(self, iid): return self.by_iid.get(iid)
+
+
+# ---- Attack map ----
+MAP_CELL = 16                      # px: alerts closer than this share a dot (mode "cell")
+MAP_MAX_CLUSTERS = 200             # dots on the map; the least recently hit one is reused
+MAP_PULSE_SECONDS = 0.4
+MAP_MAX_PULSES = 40                # dots animated at once; past that a hit just redraws (frame budget)
+
+class Cluster:
+    __slots__ = ("key","x","y","label","count","t0","items")
+
+    def __init__(self, key, x, y, label):
+        self.key=key; self.x=x; self.y=y; self.label=label
+        self.count=0; self.t0=None; self.items=None     # items: whatever the view made for it
+
+    def radius(self, now=None, pulse=MAP_PULSE_SECONDS):
+        r=4+min(8.0,2*math.log2(self.count)) if self.count>1 else 4
+        if self.t0 is None or now is None: return r
+        f=(now-self.t0)/pulse                           # 0..1: grow 4 px, shrink back
+        return r+4*(1-abs(2*f-1)) if 0<=f<1 else r
+
+    def text(self):
+        return f"{self.label} ×{self.count}" if self.count>1 else self.label
+
+class MapModel:
+    """Attack dots clustered by `mode`: "cell" (MAP_CELL px grid), "city" or "country" (geo label)."""
+    def __init__(self, w, h, mode="cell", cell=MAP_CELL, max_clusters=MAP_MAX_CLUSTERS, pulse=MAP_PULSE_SECONDS,
+                 max_pulses=MAP_MAX_PULSES):
+        self.w=w; self.h=h; self.mode=mode; self.cell=cell
+        self.max_clusters=max_clusters; self.pulse=pulse; self.max_pulses=max_pulses
+        self.clusters=OrderedDict()    # key -> Cluster, least recently hit first
+        self.pulsing={}; self._dirty={}; self.spare=[]; self._hide=[]
+        self.hits=0; self.evicted=0
+
+    def __len__(self): return len(self.clusters)
+
+    def xy(self, lon, lat):
+        return (float(lon)+180.0)/360.0*self.w,(90.0-float(lat))/180.0*self.h
+
+    def _key(self, x, y, label):
+        if self.mode=="city" and label: return label
+        if self.mode=="country" and label: return label.rsplit(", ",1)[-1]
+        return (int(x//self.cell),int(y//self.cell))
+
+    def add(self, lon, lat, label="", now=None):
+        x,y=self.xy(lon,lat); key=self._key(x,y,label); c=self.clusters.get(key)
+        if c is None:
+            if self.mode=="cell": x,y=(key[0]+0.5)*self.cell,(key[1]+0.5)*self.cell
+            c=Cluster(key,x,y,label); self.clusters[key]=c
+            while len(self.clusters)>self.max_clusters: self._evict()
+            if self.spare: c.items=self.spare.pop()
+        else:
+            self.clusters.move_to_end(key)
+            if label and not c.label: c.label=label
+        c.count+=1; self.hits+=1
+        if now is not None and (key in self.pulsing or len(self.pulsing)<self.max_pulses):
+            c.t0=now; self.pulsing[key]=c
+        self._dirty[key]=c
+        return c
+
+    def _evict(self):
+        key,c=self.clusters.popitem(last=False)
+        self.pulsing.pop(key,None); self._dirty.pop(key,None); self.evicted+=1
+        if c.items is not None: self.spare.append(c.items)     # the next new cluster takes its items over
+
+    def clear(self):
+        for c in self.clusters.values():
+            if c.items is not None: self.spare.append(c.items); self._hide.append(c.items)
+        self.clusters.clear(); self.pulsing.clear(); self._dirty.clear()
+
+    @property
+    def busy(self): return bool(self._dirty or self.pulsing or self._hide)
+
+    def frame(self, now, draw, hide=None):
+        """Redraw changed and pulsing clusters through draw(cluster, radius); hide(items) parks
+        the items of cleared clusters. Returns how many clusters were drawn."""
+        if hide is not None:
+            for items in self._hide: hide(items)
+        self._hide=[]; todo=self._dirty; self._dirty={}
+        for key,c in list(self.pulsing.items()):
+            if now-c.t0>=self.pulse:
+                c.t0=None; del self.pulsing[key]
+            todo[key]=c
+        for c in todo.values(): draw(c,c.radius(now,self.pulse))
+        return len(todo)
@@ -0,0 +1,247 @@
+# idps_peer.py — share block decisions (and, optionally, hit counts) between IDPS instances
+#
+# Each instance sends its own blocks and early unblocks to its peers as UDP
+# datagrams, to a list of host:port peers or to one multicast group. Ops are
+# batched every PEER_BATCH_SECONDS and packed into datagrams that fit one
+# Ethernet frame. A block carries its absolute deadline, so every node lets it
+# run out at the same moment as the node that decided it, and it goes straight
+# to the responder's firewall (no second geo lookup). Expiry needs no message;
+# only an operator's early unblock is sent. Duplicates (multicast loopback,
+# several peers reporting the same block, a replayed datagram) are dropped by
+# (node, seq) and by comparing deadlines with blocked_until.
+#
+# With share_counts, each node also sends the per-IP hits it matched itself, so
+# an attacker spreading attempts over the fleet reaches the threshold on the
+# fleet's total. A peer can block addresses here: outside a trusted segment,
+# set a shared key and unsigned or forged datagrams are dropped.
+import hashlib, hmac, json, math, os, socket, struct, threading
+from collections import OrderedDict, deque
+from idps_iplist import canonical
+from idps_metrics import counter, histogram
+
+PEER_PORT = 9109
+PEER_GROUP = "239.255.73.1"        # --peer-group default (administratively scoped)
+PEER_BATCH_SECONDS = 0.05
+PEER_MAX_DATAGRAM = 1200           # bytes: below a 1500 MTU with IP/UDP headers and the MAC
+PEER_SLACK = 1.0                   # seconds: deadlines this close count as the same block
+PEER_SEEN = 4096                   # (node, seq) pairs remembered for duplicate detection
+MAGIC = b"IDPSP1"
+MAC_LEN = 32
+
+PEER_OPS = counter("idps_peer_ops_total","Block/unblock/count ops received from peers")
+PEER_LATENCY_SECONDS = histogram("idps_peer_latency_seconds","Block decided on a peer -> applied here")
+
+def parse_peer(s, port=PEER_PORT):
+    """'host', 'host:port' or '[v6]:port' -> (host, port)."""
+    if s.startswith("["):
+        host,_,rest=s[1:].partition("]"); return host,int(rest[1:]) if rest.startswith(":") else port
+    host,sep,p=s.rpartition(":")
+    if sep and ":" not in host: return host,int(p)
+    return s,port
+
+def local_address(host, port=PEER_PORT):
+    """The address this host sends from to reach host: the interface its peers talk to."""
+    with socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET,socket.SOCK_DGRAM) as s:
+        s.connect((host,port)); return s.getsockname()[0]     # UDP connect: a route lookup, nothing is sent
+
+def _num(v): return type(v) in (int,float) and math.isfinite(v)
+
+def check_op(op):
+    """op if every field has the right type and the address is canonical, else None."""
+    try:
+        if type(op) is not list: return None
+        if op[0]=="b": ok=len(op)==4 and _num(op[2]) and _num(op[3])
+        elif op[0]=="u": ok=len(op)==2
+        elif op[0]=="c": ok=len(op)==5 and op[1] in ("fail","scan") and type(op[3]) is int and _num(op[4])
+        else: return None
+        return op if ok and canonical(op[2] if op[0]=="c" else op[1]) else None   # the address goes into a root firewall script
+    except (ValueError,TypeError,IndexError): return None
+
+class PeerSync:
+    """Engine subscriber that mirrors block decisions to peers and applies theirs.
+
+    `responder` is a Responder or AsyncRuntime; peer blocks go through its
+    adopt(), peer unblocks through its unblock(). One thread receives, one
+    sends a batch every `batch` seconds.
+    """
+    def __init__(self, engine, responder, port=PEER_PORT, peers=(), group=None, key=None,
+                 share_counts=False, node=None, batch=PEER_BATCH_SECONDS, bind="0.0.0.0"):
+        self.engine=engine; self.responder=responder
+        self.port=port; self.peers=[parse_peer(p) if isinstance(p,str) else p for p in peers]
+        self.group=group; self.key=key.encode() if isinstance(key,str) else key
+        self.share_counts=share_counts; self.batch=batch; self.bind=bind
+        self.node=node or f"{socket.gethostname()}:{port}:{os.getpid()}"
+        self.sock=None; self.seq=0
+        self._lock=threading.Lock(); self._stop=threading.Event(); self._threads=[]
+        self._blocks=OrderedDict(); self._unblocks=set(); self._counts={}   # outbox
+        self._deadlines={}             # ip -> until of every block we know of, to tell early unblocks from expiry
+        self._adopted={}               # ip -> until being applied for a peer: not echoed back
+        self._unblocking=set()         # peer unblocks being applied: not echoed back
+        self._seen=OrderedDict(); self._recv_ident=None
+        # metrics
+        self.sent=0; self.sent_ops=0; self.received=0; self.bad=0; self.dups=0; self.invalid=0
+        self.adopted=0; self.deduped=0; self.unblocked=0; self.hits_in=0
+        self.latencies=deque(maxlen=2048)   # seconds, decided on a peer -> handed to our responder
+
+    # ---- lifecycle ----
+    def start(self):
+        fam=socket.AF_INET6 if ":" in (self.group or self.bind) else socket.AF_INET
+        s=socket.socket(fam,socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        if self.group and hasattr(socket,"SO_REUSEPORT"):
+            s.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEPORT,1)      # several nodes on one host share the group port
+        s.bind((self.bind,self.port))
+        if self.group:
+            if fam==socket.AF_INET:
+                s.setsockopt(socket.IPPROTO_IP,socket.IP_ADD_MEMBERSHIP,socket.inet_aton(self.group)+socket.inet_aton("0.0.0.0"))
+                s.setsockopt(socket.IPPROTO_IP,socket.IP_MULTICAST_TTL,1)    # stay on the local segment
+                s.setsockopt(socket.IPPROTO_IP,socket.IP_MULTICAST_LOOP,1)
+            else:
+                s.setsockopt(socket.IPPROTO_IPV6,socket.IPV6_JOIN_GROUP,socket.inet_pton(fam,self.group)+struct.pack("@I",0))
+                s.setsockopt(socket.IPPROTO_IPV6,socket.IPV6_MULTICAST_HOPS,1)
+            self.peers.append((self.group,self.port))
+        s.settimeout(0.5); self.sock=s
+        self.engine.subscribe(self.on_event)
+        for fn,name in ((self._recv_loop,"idps-peer-recv"),(self._send_loop,"idps-peer-send")):
+            t=threading.Thread(target=fn,name=name,daemon=True); t.start(); self._threads.append(t)
+        self._send({"hello":1})        # peers answer with the blocks they hold
+        return self
+
+    def close(self):
+        self.engine.unsubscribe(self.on_event)
+        self._stop.set()
+        for t in self._threads: t.join(2)
+        self.flush()
+        if self.sock is not None: self.sock.close(); self.sock=None
+
+    # ---- outgoing ----
+    def on_event(self, ev):
+        kind=ev[0]
+        if kind=="blocked":
+            _,ip,ts,until,_=ev
+            with self._lock:
+                self._deadlines[ip]=until
+                if self._adopted.get(ip)==until: del self._adopted[ip]; return    # a peer's block coming back
+                self._blocks[ip]=[ip,until,ts]; self._unblocks.discard(ip)
+        elif kind=="unblocked":
+            _,ip,ts=ev
+            with self._lock:
+                until=self._deadlines.pop(ip,None)
+                if ip in self._unblocking or until is None or ts>=until-PEER_SLACK: return   # echo, or plain expiry
+                self._unblocks.add(ip); self._blocks.pop(ip,None)
+        elif kind in ("fail","scan") and self.share_counts:
+            if threading.get_ident()==self._recv_ident: return      # hits a peer sent us
+            _,ip,ts,_=ev
+            with self._lock:
+                c=self._counts.get((kind,ip))
+                if c is None: self._counts[(kind,ip)]=[1,ts]
+                else: c[0]+=1; c[1]=ts
+
+    def _send_loop(self):
+        while not self._stop.wait(self.batch): self.flush()
+
+    def flush(self):
+        """Send what is queued now; returns the number of datagrams."""
+        with self._lock:
+            if not (self._blocks or self._unblocks or self._counts): return 0
+            ops=[["b",*v] for v in self._blocks.values()]+[["u",ip] for ip in self._unblocks]
+            ops+=[["c",kind,ip,n,ts] for (kind,ip),(n,ts) in self._counts.items()]
+            self._blocks=OrderedDict(); self._unblocks=set(); self._counts={}
+        return self._send_ops(ops)
+
+    def _send_ops(self, ops):
+        n=0; chunk=[]; size=0
+        for op in ops:
+            b=len(json.dumps(op,separators=(",",":")))+1
+            if chunk and size+b>PEER_MAX_DATAGRAM-100:
+                self._send({"ops":chunk}); n+=1; chunk=[]; size=0
+            chunk.append(op); size+=b
+        if chunk: self._send({"ops":chunk}); n+=1
+        self.sent_ops+=len(ops)
+        return n
+
+    def _send(self, msg):
+        with self._lock: self.seq+=1; msg["n"]=self.node; msg["q"]=self.seq
+        body=json.dumps(msg,separators=(",",":")).encode()
+        data=MAGIC+(b"s"+hmac.new(self.key,body,hashlib.sha256).digest() if self.key else b"u")+body
+        for addr in self.peers:
+            try: self.sock.sendto(data,addr); self.sent+=1
+            except OSError as e: self.engine.emit("error",f"peer {addr[0]}:{addr[1]}: {e}")
+
+    # ---- incoming ----
+    def _recv_loop(self):
+        self._recv_ident=threading.get_ident()
+        while not self._stop.is_set():
+            try: data,addr=self.sock.recvfrom(65536)
+            except socket.timeout: continue
+            except OSError: break
+            try: self.handle(data)
+            except Exception as e: self.engine.emit("error",f"peer datagram from {addr[0]}: {e}")
+
+    def decode(self, data):
+        """Verified message dict, or None."""
+        if not data.startswith(MAGIC): return None
+        flag=data[len(MAGIC):len(MAGIC)+1]; body=data[len(MAGIC)+1:]
+        if flag==b"s":
+            mac,body=body[:MAC_LEN],body[MAC_LEN:]
+            if self.key and not hmac.compare_digest(mac,hmac.new(self.key,body,hashlib.sha256).digest()): return None
+        elif flag!=b"u" or self.key: return None      # with a key, unsigned is refused
+        try: msg=json.loads(body)
+        except ValueError: return None
+        return msg if isinstance(msg,dict) and "n" in msg else None
+
+    def handle(self, data):
+        msg=self.decode(data)
+        if msg is None: self.bad+=1; return
+        node=msg["n"]
+        if node==self.node: return                    # our own multicast, looped back
+        key=(node,msg.get("q"))
+        if key in self._seen: self.dups+=1; return
+        self._seen[key]=True
+        if len(self._seen)>PEER_SEEN: self._seen.popitem(last=False)
+        self.received+=1
+        if msg.get("hello"): self.resync(); return
+        eng=self.engine; now=eng.clock(); hits=[]
+        for op in msg.get("ops",()):
+            PEER_OPS.inc()
+            if check_op(op) is None: self.invalid+=1; continue
+            if op[0]=="b":
+                _,ip,until,at=op
+                if until<=now: continue
+                have=eng.blocked_until.get(ip)
+                if have is not None and have>=until-PEER_SLACK: self.deduped+=1; continue
+                with self._lock: self._adopted[ip]=until      # before adopt(): its "blocked" event must not be echoed
+                if not self.responder.adopt(ip,until,node):   # whitelisted or protect mode off here
+                    with self._lock: self._adopted.pop(ip,None)
+                    continue
+                self.adopted+=1
+                if at:                                # 0: a resync of an older block, not a fresh decision
+                    lat=max(0.0,eng.clock()-at); self.latencies.append(lat); PEER_LATENCY_SECONDS.observe(lat)
+            elif op[0]=="u":
+                ip=op[1]
+                if ip not in eng.blocked_until: continue
+                with self._lock: self._unblocking.add(ip)
+                try: self.responder.unblock(ip); self.unblocked+=1
+                finally:
+                    with self._lock: self._unblocking.discard(ip)
+                eng.emit("log",f"Unblocked {ip} (peer {node})")
+            elif op[0]=="c":
+                _,kind,ip,n,ts=op
+                if n>0: hits+=[(kind,ip,min(ts,now))]*min(n,1000)   # a peer clock ahead of ours must not sweep our windows
+        if hits:
+            self.hits_in+=len(hits); eng.feed_hits(hits)    # events from here are not re-shared: see on_event
+
+    def resync(self):
+        """Queue every block we hold for the next batch (a node just joined)."""
+        now=self.engine.clock()
+        with self.engine.lock: held=[(ip,until) for ip,until in self.engine.blocked_until.items() if until>now]
+        with self._lock:
+            for ip,until in held: self._blocks.setdefault(ip,[ip,until,0])
+
+    def stats(self):
+        lat=sorted(self.latencies)
+        pct=lambda p: round(lat[min(len(lat)-1,int(p*len(lat)))]*1e3,2) if lat else None
+        return {"node":self.node,"peers":len(self.peers),"sent":self.sent,"sent_ops":self.sent_ops,
+                "received":self.received,"bad":self.bad,"dups":self.dups,"invalid":self.invalid,"adopted":self.adopted,
+                "deduped":self.deduped,"unblocked":self.unblocked,"hits_in":self.hits_in,
+                "latency_ms_p50":pct(0.5),"latency_ms_p95":pct(0.95),"latency_ms_max":pct(1.0)}
@@ -0,0 +1,206 @@
+# idps_replay.py — run the detector over old logs, on the logs' own clock
+#   python idps_replay.py /var/log/auth.log.2.gz /var/log/auth.log.1 --threshold 3 5 10
+#   python idps_replay.py incident.log --json > report.json
+#
+# Files are read from the start as fast as they decode (gzip is detected by
+# magic, not name). Every hit is stamped with the time parsed from its line
+# and the sliding windows run on that time, so a replay reports what a live
+# run would have alerted on and blocked. Nothing touches the firewall.
+import argparse, calendar, csv, gzip, json, re, sys, time
+from collections import Counter
+from idps_engine import DetectionEngine, Classifier, EXTRA_SIGNATURES, THRESHOLD_DEFAULT, BLOCK_SECONDS_DEFAULT, WINDOW_SECONDS, utc
+
+CHUNK_BYTES = 4 << 20              # decoded and scanned one block at a time
+
+MONTHS = {m:i+1 for i,m in enumerate("Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split())}
+ISO_RE = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(\.\d+)?(Z|[+-]\d\d:?\d\d)?")
+SYSLOG_RE = re.compile(r"([A-Z][a-z]{2}) +(\d{1,2}) (\d\d):(\d\d):(\d\d)")
+CLF_RE = re.compile(r"\[(\d\d)/([A-Z][a-z]{2})/(\d{4}):(\d\d):(\d\d):(\d\d) ([+-])(\d\d)(\d\d)\]")
+
+# ---- Timestamps ----
+class TimeParser:
+    """Line -> epoch seconds, from the timestamp the line carries.
+
+    Understands ISO 8601 (and the simulator's `datetime.now()`), syslog
+    `Mon DD HH:MM:SS` (year from `year`, bumped when the log wraps past
+    December) and common-log `[DD/Mon/YYYY:HH:MM:SS +ZZZZ]`. Naive times are
+    taken as UTC, so reports show the same wall clock as the log. Whole
+    seconds are memoised on the text that produced them: a burst of lines in
+    one second costs a dict lookup each. Lines without a time get the last
+    one seen, or `fallback` (None) before the first.
+    """
+    def __init__(self, year=None, fallback=None):
+        self.year=year or utc(time.time()).year
+        self.last=fallback; self.unparsed=0
+        self._month=0; self._cache={}
+
+    def __call__(self, line):
+        ts=self._parse(line)
+        if ts is None:
+            self.unparsed+=1; return self.last
+        self.last=ts
+        return ts
+
+    def _parse(self, line):
+        cache=self._cache
+        m=ISO_RE.match(line)
+        if m:
+            tz=m.group(8) or ""; key=line[:m.end(6)]+tz
+            sec=cache.get(key)
+            if sec is None:
+                y,mo,d,h,mi,s=map(int,m.group(1,2,3,4,5,6))
+                sec=cache[key]=calendar.timegm((y,mo,d,h,mi,s))-_tz_offset(tz)
+            frac=m.group(7)
+            return sec+float(frac) if frac else float(sec)
+        m=SYSLOG_RE.match(line)
+        if m:
+            mo=MONTHS.get(m.group(1))
+            if mo is None: return None
+            if mo<self._month-6: self.year+=1         # Dec -> Jan: next year
+            self._month=mo
+            key=(self.year,line[:m.end()])
+            sec=cache.get(key)
+            if sec is None:
+                sec=cache[key]=calendar.timegm((self.year,mo,int(m.group(2)),*map(int,m.group(3,4,5))))
+            return float(sec)
+        m=CLF_RE.search(line)
+        if m:
+            key=m.group(0); sec=cache.get(key)
+            if sec is None:
+                mo=MONTHS.get(m.group(2))
+                if mo is None: return None
+                off=(int(m.group(8))*3600+int(m.group(9))*60)*(1 if m.group(7)=="+" else -1)
+                sec=cache[key]=calendar.timegm((int(m.group(3)),mo,int(m.group(1)),*map(int,m.group(4,5,6))))-off
+            return float(sec)
+        return None
+
+def _tz_offset(tz):
+    if not tz or tz=="Z": return 0
+    sign=1 if tz[0]=="+" else -1; tz=tz[1:].replace(":","")
+    return sign*(int(tz[:2])*3600+int(tz[2:])*60)
+
+# ---- Input ----
+def read_blocks(path, chunk_bytes=CHUNK_BYTES):
+    """Yield text blocks of whole lines from a plain or gzipped file ("-" = stdin)."""
+    fp=sys.stdin.buffer if path=="-" else open(path,"rb")
+    try:
+        if hasattr(fp,"peek") and fp.peek(2)[:2]==b"\x1f\x8b": fp=gzip.GzipFile(fileobj=fp)
+        rest=b""
+        while True:
+            b=fp.read(chunk_bytes)
+            if not b: break
+            b=rest+b; cut=b.rfind(b"\n")+1
+            rest=b[cut:]
+            if cut: yield b[:cut].decode("utf-8","ignore")
+        if rest: yield rest.decode("utf-8","ignore")+"\n"
+    finally:
+        if fp is not sys.stdin.buffer: fp.close()
+
+# ---- Runs ----
+class ReplayRun:
+    """One engine at one threshold, and the blocks it would have placed."""
+    def __init__(self, threshold, block_seconds, window, classifier, whitelist=(), blocklist=()):
+        self.engine=DetectionEngine(threshold,block_seconds,window,classifier=classifier)
+        self.engine.whitelist.update(whitelist); self.engine.blocklist.update(blocklist)
+        self.alerts=Counter(); self.blocks=[]; self.ignored=0
+        self.engine.subscribe(self.on_event)
+
+    def on_event(self, ev):
+        kind=ev[0]
+        if kind=="alert":
+            _,ip,ts,typ,cnt=ev; eng=self.engine
+            self.alerts[typ]+=1
+            until=eng.blocked_until.get(ip)
+            if until is not None and ts<until: return
+            if eng.may_block(ip) is None:
+                eng.mark_blocked(ip,ts+eng.block_seconds)
+                self.blocks.append((ip,ts,ts+eng.block_seconds,typ,cnt))
+        elif kind=="ignored":
+            self.ignored+=1
+
+    def summary(self, top=10):
+        per_ip=Counter(b[0] for b in self.blocks)
+        return {"threshold":self.engine.threshold,"alerts":sum(self.alerts.values()),
+                "alerts_by_type":dict(self.alerts),"blocks":len(self.blocks),
+                "ips_blocked":len(per_ip),"ignored":self.ignored,
+                "top_blocked":per_ip.most_common(top)}
+
+def replay(paths, runs, year=None, chunk_bytes=CHUNK_BYTES):
+    """Feed every file to every run; returns the shared counters."""
+    clf=runs[0].engine.classifier; parse=TimeParser(year)
+    lines=hits=nbytes=0; first=None
+    early=[]                       # hits before the first timestamp: they happened no later than it
+    def feed(kind, ip, ts):
+        hit=((kind,ip,ts),)
+        for r in runs: r.engine.feed_hits(hit)         # one at a time: a block lands before the next line
+    t0=time.perf_counter()
+    for path in paths:
+        for text in read_blocks(path,chunk_bytes):
+            lines+=text.count("\n"); nbytes+=len(text)
+            find=text.find
+            for kind,ip,s in clf.scan(text,pos=True):
+                e=find("\n",s); ts=parse(text[s:e]); hits+=1
+                if ts is None: early.append((kind,ip)); continue
+                if first is None:
+                    first=ts
+                    for k,i in early: feed(k,i,ts)
+                feed(kind,ip,ts)
+    undated=len(early)
+    if first is None and early:    # no timestamp anywhere: count them as of now
+        first=parse.last=time.time()
+        for k,i in early: feed(k,i,first)
+    secs=time.perf_counter()-t0
+    return {"files":list(paths),"lines":lines,"bytes":nbytes,"hits":hits,"unparsed_times":parse.unparsed,
+            "undated_leading":undated,"first":first,"last":parse.last if hits else None,
+            "seconds":round(secs,3),"lines_per_sec":round(lines/secs) if secs else None}
+
+# ---- CLI ----
+def build_parser():
+    ap=argparse.ArgumentParser(description="Replay old logs through the detector (no firewall changes).")
+    ap.add_argument("files",nargs="+",help="log files in time order; .gz is fine, - for stdin")
+    ap.add_argument("--threshold",type=int,nargs="+",default=[THRESHOLD_DEFAULT],help="one run per value")
+    ap.add_argument("--block-seconds",type=int,default=BLOCK_SECONDS_DEFAULT)
+    ap.add_argument("--window",type=int,default=WINDOW_SECONDS)
+    ap.add_argument("--year",type=int,help="year for syslog timestamps (default: this year)")
+    ap.add_argument("--whitelist",nargs="*",default=[],metavar="IP/CIDR")
+    ap.add_argument("--blocklist",nargs="*",default=[],metavar="IP/CIDR",help="blocked on their first hit")
+    ap.add_argument("--signature",nargs="*",default=[],choices=sorted(EXTRA_SIGNATURES))
+    ap.add_argument("--top",type=int,default=10,help="most-blocked IPs to list per run")
+    ap.add_argument("--csv",metavar="PATH",help="write every would-be block here")
+    ap.add_argument("--json",action="store_true",help="print the report as JSON")
+    return ap
+
+def main(argv=None):
+    args=build_parser().parse_args(argv)
+    clf=Classifier()
+    for name in args.signature: clf.add(*EXTRA_SIGNATURES[name])
+    try:
+        runs=[ReplayRun(t,args.block_seconds,args.window,clf,args.whitelist,args.blocklist) for t in args.threshold]
+    except ValueError as e:
+        print(f"replay: {e}", file=sys.stderr); return 2
+    try:
+        rep=replay(args.files,runs,year=args.year)
+    except OSError as e:
+        print(f"replay: {e}", file=sys.stderr); return 2
+    rep["runs"]=[r.summary(args.top) for r in runs]
+    if args.csv:
+        with open(args.csv,"w",newline="",encoding="utf-8") as fp:
+            w=csv.writer(fp); w.writerow(["threshold","ip","blocked_at","until","type","count"])
+            for r in runs:
+                for ip,ts,until,typ,cnt in r.blocks: w.writerow([r.engine.threshold,ip,utc(ts),utc(until),typ,cnt])
+    if args.json:
+        print(json.dumps(rep,indent=2)); return 0
+    span=f"{utc(rep['first'])} → {utc(rep['last'])}" if rep["hits"] else "no hits"
+    print(f"Replayed {rep['lines']:,} lines ({rep['bytes']/1e6:.1f} MB) in {rep['seconds']}s "
+          f"({rep['lines_per_sec'] or 0:,} lines/s); {rep['hits']:,} hits, {span}")
+    if rep["unparsed_times"]:
+        print(f"  {rep['unparsed_times']:,} hit lines had no timestamp (used the previous one"
+              +(f", or the first one for the {rep['undated_leading']:,} before it)" if rep["undated_leading"] else ")"))
+    print(f"{'threshold':>9} {'alerts':>8} {'blocks':>8} {'IPs':>7} {'ignored':>8}")
+    for s in rep["runs"]:
+        print(f"{s['threshold']:>9} {s['alerts']:>8,} {s['blocks']:>8,} {s['ips_blocked']:>7,} {s['ignored']:>8,}")
+        for ip,n in s["top_blocked"]: print(f"{'':>12}{ip:<18} blocked {n}x")
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
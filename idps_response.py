@@ -0,0 +1,284 @@
+# idps_response.py — what happens after an alert: enrich, block, unblock
+import os, json, heapq, threading, time, queue
+from collections import deque
+from idps_geo import get_geo, UNKNOWN
+from idps_firewall import BatchingFirewall, default_backend
+from idps_metrics import ENRICH_SECONDS, gauge
+
+RESPONSE_WORKERS = 4               # threads doing geo + firewall work
+RESPONSE_QUEUE = 1024              # pending alerts before the tailer is held back
+RESPONSE_PUT_TIMEOUT = 5.0         # ...for at most this long, then the alert is dropped
+BLOCKS_STATE = "idps_blocks.json"  # active block deadlines, survives restarts
+BLOCKS_SAVE_EVERY = 2.0            # seconds between state writes (only when changed)
+
+# ---- Block expiry ----
+class BlockScheduler:
+    """One thread and one min-heap for every block deadline.
+
+    `deadlines` is the source of truth; heap entries that no longer match it
+    (extended or cancelled blocks) are skipped when they surface, so
+    schedule/extend/cancel are all O(log n) or better. Deadlines are saved
+    to `path` so a restart can re-arm them, or expire the ones that passed
+    while we were down. Without start() it is just the heap and the file
+    (idps_async runs the timer on its event loop).
+    """
+    def __init__(self, on_expire, clock=time.time, path=None, save_every=BLOCKS_SAVE_EVERY):
+        self.on_expire=on_expire; self.clock=clock
+        self.path=path; self.save_every=save_every
+        self.deadlines={}; self._heap=[]
+        self._cv=threading.Condition(); self._dirty=False; self._stop=False
+        self._thread=None
+
+    def start(self):
+        if self._thread is None:
+            self._thread=threading.Thread(target=self._run,name="idps-block-timer",daemon=True)
+            self._thread.start()
+        return self
+
+    def __len__(self): return len(self.deadlines)
+
+    @property
+    def dirty(self): return self._dirty
+
+    def next_deadline(self):
+        """Earliest armed deadline (possibly a stale one), or None."""
+        with self._cv:
+            return self._heap[0][0] if self._heap else None
+
+    def schedule(self, ip, deadline):
+        """Arm or move (extend/shorten) the deadline for ip."""
+        with self._cv:
+            self.deadlines[ip]=deadline
+            heapq.heappush(self._heap,(deadline,ip))
+            self._dirty=True
+            if self._heap[0][1]==ip: self._cv.notify()
+            self._compact()
+
+    def cancel(self, ip):
+        with self._cv:
+            if self.deadlines.pop(ip,None) is None: return False
+            self._dirty=True; self._compact()
+            return True
+
+    def clear(self):
+        with self._cv:
+            self.deadlines.clear(); self._heap=[]; self._dirty=True
+
+    def _compact(self):
+        if len(self._heap)>64 and len(self._heap)>3*len(self.deadlines):
+            self._heap=[(d,ip) for ip,d in self.deadlines.items()]; heapq.heapify(self._heap)
+
+    def due(self, now):
+        """Pop every (ip, deadline) that has expired by `now`."""
+        out=[]
+        with self._cv:
+            heap=self._heap; dl=self.deadlines
+            while heap and heap[0][0]<=now:
+                d,ip=heapq.heappop(heap)
+                if dl.get(ip)==d:
+                    del dl[ip]; out.append((ip,d)); self._dirty=True
+        return out
+
+    def _run(self):
+        last_save=time.monotonic()
+        while True:
+            with self._cv:
+                if self._stop: break
+                wait=self.save_every
+                if self._heap: wait=min(wait,max(0.0,self._heap[0][0]-self.clock()))
+                if wait>0: self._cv.wait(wait)
+                if self._stop: break
+            for ip,d in self.due(self.clock()):
+                try: self.on_expire(ip,d)
+                except Exception: pass
+            if self._dirty and time.monotonic()-last_save>=self.save_every:
+                self.save(); last_save=time.monotonic()
+
+    def stop(self):
+        with self._cv:
+            self._stop=True; self._cv.notify()
+        if self._thread is not None: self._thread.join(5)
+        if self._dirty: self.save()
+
+    # ---- persistence ----
+    def save(self):
+        if not self.path: return
+        with self._cv:
+            snap=dict(self.deadlines); self._dirty=False
+        tmp=self.path+".tmp"
+        try:
+            with open(tmp,"w",encoding="utf-8") as fp: json.dump(snap,fp)
+            os.replace(tmp,self.path)
+        except OSError:
+            self._dirty=True
+
+    def load(self):
+        """Read saved deadlines; returns {ip: deadline} (not yet armed)."""
+        if not self.path: return {}
+        try:
+            with open(self.path,encoding="utf-8") as fp: d=json.load(fp)
+            return {str(ip):float(t) for ip,t in d.items()}
+        except (OSError,ValueError,AttributeError):
+            return {}
+
+class Responder:
+    """Engine subscriber that geolocates alerting IPs and blocks them.
+
+    Alerts go through a bounded queue to a fixed pool of workers. An IP that
+    is already queued, being handled or blocked is not queued again, so a
+    noisy attacker costs one enrich/block no matter how many lines it writes.
+    A full queue makes the tail thread wait (backpressure) instead of
+    growing without bound.
+    """
+    def __init__(self, engine, geo=get_geo, firewall=None,
+                 workers=RESPONSE_WORKERS, queue_size=RESPONSE_QUEUE, put_timeout=RESPONSE_PUT_TIMEOUT,
+                 state_path=BLOCKS_STATE):
+        self.engine=engine; self.geo=geo
+        if firewall is None: firewall=default_backend()
+        if not isinstance(firewall,BatchingFirewall):
+            firewall=BatchingFirewall(firewall)
+        if firewall.on_result is None: firewall.on_result=self._fw_result
+        self.firewall=firewall
+        self.put_timeout=put_timeout
+        self.q=queue.Queue(queue_size)
+        self.uq=queue.SimpleQueue()    # expiries: unbounded and never behind a full alert queue
+        self.inflight=set(); self._lock=threading.Lock()
+        # metrics
+        self.queued=0; self.done=0; self.deduped=0; self.dropped=0; self.failed=0
+        self.queue_max=0; self.latencies=deque(maxlen=2048)   # seconds, alert queued -> handled
+        self._workers=[threading.Thread(target=self._work,args=(self.q,),name=f"idps-responder-{i}",daemon=True)
+                       for i in range(workers)]
+        self._unblocker=threading.Thread(target=self._work,args=(self.uq,),name="idps-unblocker",daemon=True)
+        for t in self._workers+[self._unblocker]: t.start()
+        self.scheduler=BlockScheduler(self._expired,clock=engine.clock,path=state_path)
+        self.restore()
+        self.scheduler.start()
+        engine.subscribe(self.on_event)
+        gauge("idps_response_queue_depth","Alerts waiting for a responder worker",self.q.qsize)
+        gauge("idps_tracked_ips","IPs with events in the sliding window",lambda: len(engine.fail_events)+len(engine.scan_events))
+        gauge("idps_blocked_ips","IPs currently blocked",lambda: len(engine.blocked_until))
+
+    def restore(self):
+        """Re-arm blocks saved by a previous run; lift the ones that ran out meanwhile."""
+        now=self.engine.clock(); n=0
+        saved=self.scheduler.load()
+        for ip,until in list(self.engine.blocked_until.items()): saved.setdefault(ip,until)   # from the state journal
+        for ip,until in saved.items():
+            if until>now:
+                self.engine.mark_blocked(ip,until); self.scheduler.schedule(ip,until); n+=1
+                if self.firewall.volatile: self.firewall.block(ip)
+            else:
+                self.uq.put(("unblock",ip,until,time.perf_counter()))
+        if n: self.engine.emit("log",f"Re-armed {n} saved blocks")
+        return n
+
+    def on_event(self, ev):
+        if ev[0]=="alert":
+            _,ip,ts,typ,cnt=ev
+            self.submit(ip,typ)
+
+    def submit(self, ip, typ):
+        until=self.engine.blocked_until.get(ip)
+        with self._lock:
+            if (until is not None and until>self.engine.clock()) or ip in self.inflight:
+                self.deduped+=1; return False       # already queued, or a stale alert from before the block landed
+            self.inflight.add(ip)
+        try:
+            self.q.put(("block",ip,typ,time.perf_counter()),timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock: self.inflight.discard(ip); self.dropped+=1
+            self.engine.emit("error",f"response queue full — dropped alert for {ip}")
+            return False
+        depth=self.q.qsize()
+        with self._lock:
+            self.queued+=1
+            if depth>self.queue_max: self.queue_max=depth
+        return True
+
+    def _work(self, q):
+        while True:
+            item=q.get()
+            if item is None: break
+            job,ip,arg,t0=item
+            try:
+                if job=="block": self.enrich_and_act(ip,arg)
+                else: self.expire(ip,arg)
+            except Exception as e:
+                with self._lock: self.failed+=1
+                self.engine.emit("error",f"{job} for {ip}: {e}")
+            finally:
+                if job=="block":
+                    with self._lock:
+                        self.inflight.discard(ip); self.done+=1
+                        self.latencies.append(time.perf_counter()-t0)
+
+    def close(self, wait=True):
+        self.scheduler.stop()
+        for _ in self._workers: self.q.put(None)
+        self.uq.put(None)
+        if wait:
+            for t in self._workers+[self._unblocker]: t.join(5)
+        self.firewall.close()
+
+    def _fw_result(self, op, ips, out, err):
+        if err: self.engine.emit("error",f"firewall {op} of {len(ips)} IP(s) failed: {err}")
+        elif len(ips)>1: self.engine.emit("log",f"Firewall {op}: {len(ips)} IPs in one batch")
+
+    def stats(self):
+        lat=sorted(self.latencies)
+        pct=lambda p: round(lat[min(len(lat)-1,int(p*len(lat)))]*1e3,2) if lat else None
+        return {"workers":len(self._workers),"queue_depth":self.q.qsize(),"queue_max":self.queue_max,
+                "inflight":len(self.inflight),"queued":self.queued,"done":self.done,
+                "deduped":self.deduped,"dropped":self.dropped,"failed":self.failed,
+                "latency_ms_p50":pct(0.5),"latency_ms_p95":pct(0.95),"latency_ms_max":pct(1.0)}
+
+    def enrich_and_act(self, ip, typ):
+        t=time.perf_counter()
+        try: label,lat,lon=self.geo(ip.partition("/")[0])      # a subnet: place it by its first address
+        except Exception as e: label,lat,lon=UNKNOWN; self.engine.emit("error",f"geo lookup for {ip}: {e}")   # still block
+        ENRICH_SECONDS.since(t)
+        self.engine.emit("enrich",ip,label,lat,lon,typ)
+        self.block_with_timeout(ip, self.engine.block_seconds)
+
+    # ---- Blocking with timeout ----
+    def block_with_timeout(self, ip, secs):
+        eng=self.engine
+        why=eng.may_block(ip)
+        if why=="whitelisted":
+            eng.emit("log",f"Skipped block (whitelisted): {ip}"); return
+        if why:
+            eng.emit("log",f"Protect Mode OFF — alert only (no block) for {ip}"); return
+        resp=self.firewall.block(ip)
+        ts=eng.clock(); until=ts+secs
+        eng.mark_blocked(ip,until); self.scheduler.schedule(ip,until)
+        eng.emit("blocked",ip,ts,until,resp)
+
+    def adopt(self, ip, until, origin):
+        """Block ip until a peer's deadline: no geo lookup, the same checks and expiry as our own blocks."""
+        eng=self.engine
+        if eng.may_block(ip): return False
+        resp=self.firewall.block(ip)
+        eng.mark_blocked(ip,until); self.scheduler.schedule(ip,until)
+        eng.emit("blocked",ip,eng.clock(),until,f"{resp} (from peer {origin})")
+        return True
+
+    def _expired(self, ip, until):
+        # scheduler thread: hand the firewall call and the event fan-out to the unblocker
+        self.uq.put(("unblock",ip,until,time.perf_counter()))
+
+    def expire(self, ip, until):
+        if ip in self.scheduler.deadlines: return        # re-blocked since it fell due
+        self.firewall.unblock(ip); self.engine.mark_unblocked(ip,until)
+        self.engine.emit("unblocked",ip,self.engine.clock())
+
+    def forget_all(self):
+        """After the firewall rules were wiped wholesale."""
+        self.scheduler.clear()
+        self.engine.unblock_all()
+
+    def unblock(self, ip):
+        """Operator-requested unblock; returns the firewall output."""
+        self.scheduler.cancel(ip)
+        resp=self.firewall.unblock(ip)
+        if self.engine.mark_unblocked(ip): self.engine.emit("unblocked",ip,self.engine.clock())
+        return resp
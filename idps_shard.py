@@ -0,0 +1,173 @@
+# idps_shard.py — multi-process ingestion for several logs / big files
+#
+#   source process (one per log)      shard process (one per IP hash bucket)
+#   Tailer -> Classifier.scan  --->   DetectionEngine.feed_hits  --->  main: engine.emit
+#
+# Parsing happens outside the main interpreter, hits travel in packed
+# batches (one message per block per shard, not per line), and every IP
+# always lands on the same shard, so per-IP counters are never shared.
+# The main-process DetectionEngine is the hub: subscribers (Responder, GUI,
+# idpsd output) see the shards' events there, and its block bookkeeping is
+# echoed to the owning shard so blocked IPs stop counting.
+import os, time, zlib, threading, multiprocessing as mp
+from array import array
+from idps_engine import DetectionEngine, Classifier, DEFAULT_SIGNATURES
+
+SHARD_FORWARD = ("alert","ignored","log","error")   # shard events passed to the hub
+KIND_CODE = {"fail":"f","scan":"s"}
+CODE_KIND = {"f":"fail","s":"scan"}
+
+def shard_of(ip, n):
+    # crc32, not hash(): must agree across processes
+    return zlib.crc32(ip.encode())%n if n>1 else 0
+
+# ---- Packed hit batches ----
+def pack_hits(hits):
+    """[(kind, ip, ts)] -> (kinds str, "\\n"-joined ips, ts doubles); pickles in a few memcpys."""
+    return ("".join(KIND_CODE[k] for k,_,_ in hits), "\n".join(ip for _,ip,_ in hits),
+            array("d",(ts for _,_,ts in hits)).tobytes())
+
+def unpack_hits(batch):
+    kinds,ips,tss=batch; ts=array("d"); ts.frombytes(tss)
+    return [(CODE_KIND[k],ip,t) for k,ip,t in zip(kinds,ips.split("\n"),ts)]
+
+def route(hits, n):
+    """Split hits into n packed batches by IP hash (empty buckets are None)."""
+    buckets=[[] for _ in range(n)]
+    for h in hits: buckets[shard_of(h[1],n)].append(h)
+    return [pack_hits(b) if b else None for b in buckets]
+
+# ---- Worker processes ----
+def _source_main(path, from_end, signatures, shard_qs, stop):
+    from idps_tail import Tailer
+    clf=Classifier(signatures); n=len(shard_qs)
+    def on_block(text):
+        hits=clf.scan(text)
+        if not hits: return
+        ts=time.time()
+        for q,b in zip(shard_qs,route([(k,ip,ts) for k,ip in hits],n)):
+            if b is not None: q.put(("hits",b))
+    try:
+        Tailer(path,from_end=from_end).run(on_block,stop)
+    except Exception as e:
+        shard_qs[0].put(("error",f"{path}: {e}"))
+
+def _shard_main(inq, outq, threshold, block_seconds, window, whitelist, blocklist, forward):
+    eng=DetectionEngine(threshold,block_seconds,window)
+    eng.whitelist.update(whitelist); eng.blocklist.update(blocklist)
+    out=[]; eng.subscribe(lambda ev: out.append(ev) if ev[0] in forward else None)
+    while True:
+        try: msg=inq.get(timeout=1.0)
+        except Exception:
+            eng.tick(); continue
+        if msg is None: break
+        op=msg[0]
+        if op=="hits": eng.feed_hits(unpack_hits(msg[1]))
+        elif op=="blocked": eng.mark_blocked(msg[1],msg[2])
+        elif op=="unblocked": eng.mark_unblocked(msg[1])
+        elif op=="whitelist": eng.whitelist.reload(msg[1])
+        elif op=="blocklist": eng.blocklist.reload(msg[1])
+        elif op=="error": out.append(msg)
+        if out:
+            outq.put(out); out=[]
+    outq.put(None)
+
+# ---- Coordinator ----
+class ShardedIngest:
+    """Tail `paths` in worker processes and count in `shards` processes.
+
+    Alerts and other forwarded events are re-emitted on `engine`, so the
+    Responder and any other subscriber work unchanged. Threshold, window,
+    whitelist and blocklist are copied to the shards at start().
+    """
+    def __init__(self, paths, engine, shards=None, signatures=None, from_end=True, forward=SHARD_FORWARD):
+        self.paths=list(paths); self.engine=engine
+        self.shards=shards or max(1,min(os.cpu_count() or 1,4))
+        self.signatures=signatures or list(engine.classifier.signatures or DEFAULT_SIGNATURES)
+        self.from_end=from_end; self.forward=tuple(forward)
+        self.procs=[]; self._pump=None; self.batches=0
+
+    def start(self):
+        eng=self.engine
+        self._stop=mp.Event(); self.outq=mp.Queue()
+        self.inqs=[mp.Queue() for _ in range(self.shards)]
+        for i,q in enumerate(self.inqs):
+            p=mp.Process(target=_shard_main,name=f"idps-shard-{i}",daemon=True,
+                         args=(q,self.outq,eng.threshold,eng.block_seconds,eng.fail_events.window,
+                               list(eng.whitelist),list(eng.blocklist),self.forward))
+            p.start(); self.procs.append(p)
+        for path in self.paths:
+            p=mp.Process(target=_source_main,name=f"idps-source-{os.path.basename(path)}",daemon=True,
+                         args=(path,self.from_end,self.signatures,self.inqs,self._stop))
+            p.start(); self.procs.append(p)
+        eng.subscribe(self._on_hub_event)
+        self._pump=threading.Thread(target=self._run_pump,name="idps-shard-pump",daemon=True)
+        self._pump.start()
+        return self
+
+    def _on_hub_event(self, ev):
+        # block state lives where the IP is counted
+        if ev[0]=="blocked": self.inqs[shard_of(ev[1],self.shards)].put(("blocked",ev[1],ev[3]))
+        elif ev[0]=="unblocked": self.inqs[shard_of(ev[1],self.shards)].put(("unblocked",ev[1]))
+
+    def set_lists(self, whitelist=None, blocklist=None):
+        """Push new whitelist/blocklist entries to every shard."""
+        for name,entries in (("whitelist",whitelist),("blocklist",blocklist)):
+            if entries is None: continue
+            entries=list(entries)
+            for q in self.inqs: q.put((name,entries))
+
+    def _run_pump(self):
+        live=self.shards
+        while live:
+            evs=self.outq.get()
+            if evs is None:
+                live-=1; continue
+            self.batches+=1
+            self.engine.emit_all(evs)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for p in self.procs[self.shards:]: p.join(timeout)
+        for q in self.inqs: q.put(None)
+        for p in self.procs[:self.shards]: p.join(timeout)
+        if self._pump is not None: self._pump.join(timeout)
+        self.engine.unsubscribe(self._on_hub_event)
+        for p in self.procs:
+            if p.is_alive(): p.terminate()
+
+# ---- Whole-file parsing (backfill, benchmarks) ----
+def file_ranges(path, parts):
+    """Split a file into `parts` byte ranges that start and end on line boundaries."""
+    size=os.path.getsize(path); cuts=[0]
+    with open(path,"rb") as fp:
+        for i in range(1,parts):
+            fp.seek(size*i//parts); fp.readline()
+            cuts.append(max(cuts[-1],min(fp.tell(),size)))
+    cuts.append(size)
+    return [(cuts[i],cuts[i+1]) for i in range(parts) if cuts[i+1]>cuts[i]]
+
+def scan_range(args):
+    """Pool worker: (path, start, end, signatures, shards, ts) -> (lines, [packed batch per shard])."""
+    path,start,end,signatures,shards,ts=args
+    clf=Classifier(signatures); lines=0; buckets=[[] for _ in range(shards)]
+    with open(path,"rb") as fp:
+        fp.seek(start); left=end-start
+        while left>0:
+            data=fp.read(min(left,4<<20)); left-=len(data)
+            if not data: break
+            extra=b"" if left<=0 or data.endswith(b"\n") else fp.readline()
+            left-=len(extra); data+=extra
+            text=data.decode("utf-8","ignore"); lines+=text.count("\n")
+            for kind,ip in clf.scan(text): buckets[shard_of(ip,shards)].append((kind,ip,ts))
+    return lines,[pack_hits(b) if b else None for b in buckets]
+
+def scan_file(path, procs, shards=None, signatures=DEFAULT_SIGNATURES, ts=None):
+    """Parse a whole file with `procs` processes; returns (lines, [[batch,...] per shard])."""
+    shards=shards or procs; ts=time.time() if ts is None else ts
+    jobs=[(path,s,e,list(signatures),shards,ts) for s,e in file_ranges(path,procs)]
+    if procs==1: results=[scan_range(j) for j in jobs]
+    else:
+        with mp.Pool(procs) as pool: results=pool.map(scan_range,jobs)
+    per_shard=[[b for _,bs in results if (b:=bs[i]) is not None] for i in range(shards)]
+    return sum(n for n,_ in results),per_shard
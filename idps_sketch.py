@@ -0,0 +1,250 @@
+# idps_sketch.py — subnet-level detection in fixed memory
+#
+# Per-IP counting misses a botnet that rotates through a /24: every address
+# stays under the threshold. SubnetDetector counts hits per prefix (/24 and
+# /16, /64 and /48 for IPv6) in a windowed count-min sketch, and keeps a
+# windowed HyperLogLog of distinct sources plus an EWMA rate for the
+# prefixes that are heavy enough to matter. A prefix alerts once it has both many hits
+# and many sources in the window, so one noisy IP never takes its
+# neighbours down with it. Memory is set by the sketch sizes and
+# `max_tracked`, not by how many addresses are seen.
+import math
+from array import array
+from collections import OrderedDict
+from idps_engine import V6_TAG, WINDOW_SECONDS, ip_str
+
+CMS_WIDTH = 16384                  # counters per row (power of two); 2 epochs x 4 rows x 4 B = 512 KB
+CMS_DEPTH = 4                      # rows; error <= e/width * hits with prob. 1 - e^-depth
+HLL_P = 8                          # 2 x 2^p one-byte registers per tracked prefix: ~6.5% error
+SUBNET_TRACKED = 1024              # prefixes with a HyperLogLog + EWMA; least recently hit goes first
+SUBNET_HITS = 20                   # /24 (/64) alerts at this many hits in the window...
+SUBNET_SOURCES = 4                 # ...from at least this many distinct IPs; /16 (/48) needs 4x both
+EWMA_TAU = 60.0                    # seconds
+EVICT_SAMPLE = 8                   # tracked prefixes looked at per eviction
+
+M64 = (1 << 64)-1
+
+def subnet_levels(hits=SUBNET_HITS, sources=SUBNET_SOURCES):
+    """(IPv4 prefix, IPv6 prefix, hits, sources) per level."""
+    return ((24,64,hits,sources),(16,48,4*hits,4*sources))
+
+def mix64(x):
+    """splitmix64 finalizer: a well-spread 64-bit hash of an int (IPv6 keys folded first)."""
+    x=((x^(x>>64))+0x9E3779B97F4A7C15)&M64
+    x=((x^(x>>30))*0xBF58476D1CE4E5B9)&M64
+    x=((x^(x>>27))*0x94D049BB133111EB)&M64
+    return x^(x>>31)
+
+class CountMinSketch:
+    """Approximate counts that never undercount; conservative update, one hash per key."""
+    __slots__=("width","depth","total","_mask","_rows")
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        if width&(width-1): raise ValueError("width must be a power of two")
+        self.width=width; self.depth=depth; self.total=0; self._mask=width-1
+        self._rows=array("I",bytes(4*width*depth))
+
+    def cells(self, h):
+        """Counter index per row. Kirsch-Mitzenmacher: row j uses h1 + j*h2, so one hash serves every row."""
+        h1=h&0xFFFFFFFF; h2=(h>>32)|1; m=self._mask; w=self.width
+        return [j*w+((h1+j*h2)&m) for j in range(self.depth)]
+
+    def add(self, h, n=1, cells=None):
+        rows=self._rows; cells=cells or self.cells(h); self.total+=n
+        new=min([rows[c] for c in cells])+n
+        for c in cells:
+            if rows[c]<new: rows[c]=new
+        return new
+
+    def estimate(self, h, cells=None):
+        rows=self._rows
+        return min([rows[c] for c in cells or self.cells(h)])
+
+    def clear(self): self._rows=array("I",bytes(4*self.width*self.depth)); self.total=0
+    @property
+    def nbytes(self): return len(self._rows)*self._rows.itemsize
+
+class WindowedCMS:
+    """Counts over roughly the last `window` seconds: the current epoch plus the
+    previous one scaled by how much of it still overlaps the window."""
+    __slots__=("window","_cur","_prev","_start","_mask","_offs")
+
+    def __init__(self, window=WINDOW_SECONDS, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.window=window; self._cur=CountMinSketch(width,depth); self._prev=CountMinSketch(width,depth)
+        self._start=None; self._mask=width-1; self._offs=tuple(enumerate(range(0,width*depth,width)))
+
+    def _roll(self, ts):
+        if self._start is None: self._start=ts; return
+        el=ts-self._start
+        if el<self.window: return
+        if el<2*self.window: self._prev,self._cur=self._cur,self._prev
+        else: self._prev.clear()
+        self._cur.clear(); self._start+=el//self.window*self.window
+
+    def add(self, h, ts, n=1):
+        # CountMinSketch.add + estimate inlined: this runs twice per hit
+        st=self._start
+        if st is None or ts-st>=self.window: self._roll(ts); st=self._start
+        h1=h&0xFFFFFFFF; h2=(h>>32)|1; m=self._mask
+        cells=[o+((h1+j*h2)&m) for j,o in self._offs]     # both epochs share one layout
+        cur=self._cur; cur.total+=n; rows=cur._rows; new=min([rows[c] for c in cells])+n
+        for c in cells:
+            if rows[c]<new: rows[c]=new
+        left=1.0-(ts-st)/self.window
+        if left<=0: return new
+        rows=self._prev._rows; old=min([rows[c] for c in cells])
+        return new+int(old*left) if old else new
+
+    def estimate(self, h, ts):
+        self._roll(ts)
+        cells=self._cur.cells(h); left=1.0-(ts-self._start)/self.window
+        return self._cur.estimate(h,cells)+(int(self._prev.estimate(h,cells)*left) if left>0 else 0)
+
+    def noise(self, ts):
+        """Average count per counter over the window: roughly what any key may be overcounted by."""
+        left=max(0.0,1.0-(ts-self._start)/self.window) if self._start is not None else 0.0
+        return (self._cur.total+self._prev.total*left)/self._cur.width
+
+    @property
+    def nbytes(self): return self._cur.nbytes+self._prev.nbytes
+
+class HyperLogLog:
+    """Distinct-count estimate; the harmonic sum is kept up to date so count() is O(1)."""
+    __slots__=("p","m","_reg","_inv","_zeros")
+
+    def __init__(self, p=HLL_P):
+        self.p=p; self.m=1<<p; self._reg=bytearray(self.m)
+        self._inv=float(self.m); self._zeros=self.m
+
+    def add(self, h):
+        """h: a 64-bit hash. Returns True if the estimate may have changed."""
+        p=self.p; i=h>>(64-p); rho=(64-p)-(h&((1<<(64-p))-1)).bit_length()+1
+        old=self._reg[i]
+        if rho<=old: return False
+        self._reg[i]=rho; self._inv+=2.0**-rho-2.0**-old
+        if old==0: self._zeros-=1
+        return True
+
+    def count(self):
+        m=self.m; est=(0.7213/(1+1.079/m))*m*m/self._inv
+        if est<=2.5*m and self._zeros: return m*math.log(m/self._zeros)   # small-range correction
+        return est
+
+    def __len__(self): return round(self.count())
+
+    def copy(self):
+        c=HyperLogLog(self.p); c._reg[:]=self._reg; c._inv=self._inv; c._zeros=self._zeros
+        return c
+
+class WindowedHLL:
+    """Distinct count over roughly the last `window` seconds, the way WindowedCMS
+    counts hits: the current epoch's sources plus those seen only in the
+    previous epoch, scaled by how much of it still overlaps the window."""
+    __slots__=("window","p","_cur","_both","_start")
+
+    def __init__(self, window=WINDOW_SECONDS, p=HLL_P):
+        self.window=window; self.p=p; self._cur=HyperLogLog(p); self._both=HyperLogLog(p); self._start=None
+
+    def _roll(self, ts):
+        if self._start is None: self._start=ts; return
+        el=ts-self._start
+        if el<self.window: return
+        self._both=self._cur.copy() if el<2*self.window else HyperLogLog(self.p)   # union of previous and (empty) current
+        self._cur=HyperLogLog(self.p); self._start+=el//self.window*self.window
+
+    def add(self, h, ts):
+        if self._start is None or ts-self._start>=self.window: self._roll(ts)
+        self._both.add(h); return self._cur.add(h)
+
+    def count(self, ts):
+        self._roll(ts)
+        cur=self._cur.count(); left=1.0-(ts-self._start)/self.window
+        return cur+max(0.0,self._both.count()-cur)*left if left>0 else cur
+
+    @property
+    def nbytes(self): return 2*len(self._cur._reg)
+
+class EWMA:
+    """Events per second, decayed with time constant `tau`."""
+    __slots__=("tau","rate","last")
+
+    def __init__(self, tau=EWMA_TAU):
+        self.tau=tau; self.rate=0.0; self.last=None
+
+    def add(self, ts, n=1):
+        if self.last is not None and ts>self.last: self.rate*=math.exp((self.last-ts)/self.tau)
+        self.rate+=n/self.tau; self.last=ts if self.last is None or ts>self.last else self.last
+
+    def value(self, ts):
+        return self.rate*math.exp((self.last-ts)/self.tau) if self.last is not None and ts>self.last else self.rate
+
+class _Prefix:
+    __slots__=("net","hll","ewma","last","quiet_until","sources")
+
+    def __init__(self, net, window, p, tau):
+        self.net=net; self.hll=WindowedHLL(window,p); self.ewma=EWMA(tau)
+        self.last=0.0; self.quiet_until=0.0; self.sources=0
+
+class SubnetDetector:
+    """hit(ip_key, ts) -> [(net, hits, sources, rate/s)] for prefixes that just crossed their level."""
+    def __init__(self, window=WINDOW_SECONDS, levels=None, width=CMS_WIDTH, depth=CMS_DEPTH,
+                 max_tracked=SUBNET_TRACKED, hll_p=HLL_P, tau=EWMA_TAU):
+        self.window=window; self.levels=tuple(levels or subnet_levels())
+        self.counts=WindowedCMS(window,width,depth)
+        self.max_tracked=max_tracked; self.hll_p=hll_p; self.tau=tau
+        self.tracked=OrderedDict()     # sketch key -> _Prefix, least recently hit first
+        self.hits=0; self.evicted=0
+
+    @property
+    def nbytes(self):
+        """Memory ceiling: sketches plus a full table of tracked prefixes."""
+        return self.counts.nbytes+self.max_tracked*(2*(1<<self.hll_p)+360)
+
+    def hit(self, key, ts):
+        self.hits+=1; out=None
+        v6=key>=V6_TAG; addr=key^V6_TAG if v6 else key; bits=128 if v6 else 32
+        hsrc=None
+        for p4,p6,need_hits,need_src in self.levels:
+            plen=p6 if v6 else p4
+            pk=((addr>>(bits-plen))<<9)|(plen<<1)|v6     # prefix, length and family in one int
+            h=mix64(pk); n=self.counts.add(h,ts)
+            low=max(2,need_hits//4)
+            if n<low or (n<low+self.counts.noise(ts) and pk not in self.tracked):
+                continue                              # too light to track, or could be all collisions
+            t=self.tracked.get(pk)
+            if t is None or ts-t.last>self.window:    # new, or quiet for a whole window: start over
+                if t is None and len(self.tracked)>=self.max_tracked: self._evict()
+                net=(addr>>(bits-plen))<<(bits-plen)
+                t=self.tracked[pk]=_Prefix(f"{ip_str(net|V6_TAG if v6 else net)}/{plen}",self.window,self.hll_p,self.tau)
+            else:
+                self.tracked.move_to_end(pk)
+            if hsrc is None: hsrc=mix64(key)
+            t.hll.add(hsrc,ts); t.sources=round(t.hll.count(ts))   # also falls as old sources leave the window
+            t.ewma.add(ts); t.last=ts
+            if n>=need_hits and t.sources>=need_src and ts>=t.quiet_until:
+                t.quiet_until=ts+self.window          # once per window per prefix
+                (out if out is not None else (out:=[])).append((t.net,n,t.sources,t.ewma.value(ts)))
+        return out or ()
+
+    def _evict(self):
+        # among the least recently hit few, drop the one with the fewest sources: when the
+        # sketch overcounts, the table fills with one-IP prefixes and those should go first
+        it=iter(self.tracked.items()); victim=None
+        for _ in range(EVICT_SAMPLE):
+            pk,t=next(it,(None,None))
+            if t is None: break
+            if victim is None or t.sources<victim[1]: victim=(pk,t.sources)
+            if victim[1]<=1: break
+        del self.tracked[victim[0]]; self.evicted+=1
+
+    def top(self, n=10, ts=None):
+        """Busiest tracked prefixes by EWMA rate: [(net, hits in window, sources, rate/s)]."""
+        rows=[]
+        for pk,t in self.tracked.items():
+            now=t.last if ts is None else ts
+            rows.append((t.net,self.counts.estimate(mix64(pk),now),t.sources,t.ewma.value(now)))
+        return sorted(rows,key=lambda r: -r[3])[:n]
+
+    def clear(self):
+        self.counts=WindowedCMS(self.window,self.counts._cur.width,self.counts._cur.depth)
+        self.tracked.clear()
@@ -0,0 +1,216 @@
+# idps_store.py — every detection, alert, block and unblock in a local SQLite file
+#   python idps_store.py export --since "2026-01-01" --type alert --csv alerts.csv
+#   python idps_store.py export --ip 203.0.113.7 --html attacker.html
+#
+# The engine subscriber only appends the event tuple to a list; a writer
+# thread swaps the list out every `flush_every` seconds and inserts it in
+# one transaction. WAL mode lets the GUI and exports read while it writes;
+# readers open their own connection. Queries walk the (ts), (ip, ts) and
+# (type, ts) indexes, and exports stream rows a batch at a time.
+import argparse, csv, html, os, sqlite3, sys, threading, time
+from contextlib import closing
+from datetime import datetime
+from idps_engine import utc
+
+STORE_PATH = "idps_events.db"
+STORE_FLUSH = 0.5                  # seconds between batched inserts
+STORE_KEEP_DAYS = 30               # older rows are pruned (0 = keep everything)
+STORE_MAX_PENDING = 1_000_000      # events waiting for the writer before new ones are dropped
+STORE_FETCH = 10_000               # rows per fetchmany() when streaming
+STORED = ("fail","scan","alert","blocked","unblocked","ignored")
+REPORT_COLUMNS = ("time","ip","type","count","detail","geo")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events(
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    ip TEXT NOT NULL,
+    type TEXT NOT NULL,            -- fail, scan, alert, blocked, unblocked, ignored
+    count INTEGER,
+    detail TEXT                    -- alert type, block deadline, ...
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_ip ON events(ip, ts);
+CREATE INDEX IF NOT EXISTS events_type ON events(type, ts);
+CREATE TABLE IF NOT EXISTS geo(ip TEXT PRIMARY KEY, label TEXT, lat REAL, lon REAL);
+"""
+# ts is formatted by SQLite, not per row in Python
+SELECT = ("SELECT e.id, e.ts, strftime('%Y-%m-%d %H:%M:%S',e.ts,'unixepoch'), e.ip, e.type, e.count, e.detail,"
+          " coalesce(g.label,'') FROM events e LEFT JOIN geo g ON g.ip=e.ip")
+
+def parse_when(s):
+    """Epoch seconds or an ISO date/time (UTC, like everything the store shows) -> epoch."""
+    if s is None or isinstance(s,(int,float)): return s
+    try: return float(s)
+    except ValueError: pass
+    d=datetime.fromisoformat(s)
+    return d.timestamp() if d.tzinfo else (d-datetime(1970,1,1)).total_seconds()
+
+def _where(since=None, until=None, ip=None, type=None):
+    conds=[]; args=[]
+    if since is not None: conds.append("e.ts>=?"); args.append(parse_when(since))
+    if until is not None: conds.append("e.ts<?"); args.append(parse_when(until))
+    if ip: conds.append("e.ip=?"); args.append(ip)
+    if type: conds.append("e.type=?"); args.append(type)
+    return conds,args
+
+def _row(ev):
+    kind=ev[0]
+    if kind in ("fail","scan"): return (ev[2],ev[1],kind,ev[3],None)
+    if kind=="alert": return (ev[2],ev[1],kind,ev[4],ev[3])
+    if kind=="blocked": return (ev[2],ev[1],kind,None,f"until {utc(ev[3]):%Y-%m-%d %H:%M:%S}")
+    if kind=="unblocked": return (ev[2],ev[1],kind,None,None)
+    return (ev[2],ev[1],kind,None,"whitelisted")
+
+class EventStore:
+    def __init__(self, path=STORE_PATH, flush_every=STORE_FLUSH, keep_days=STORE_KEEP_DAYS, max_pending=STORE_MAX_PENDING):
+        self.path=path; self.flush_every=flush_every; self.keep_days=keep_days; self.max_pending=max_pending
+        self._pending=[]; self._db=None; self._io=threading.Lock()
+        self._thread=None; self._stop=threading.Event(); self._engine=None
+        self.written=0; self.dropped=0; self.last_prune=0.0
+
+    def open(self):
+        self._db=sqlite3.connect(self.path,check_same_thread=False,isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL"); self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        return self
+
+    # ---- writing ----
+    def attach(self, engine):
+        """Record `engine`'s events from now on (starts the writer thread)."""
+        self._engine=engine; engine.subscribe(self.on_event)
+        self._thread=threading.Thread(target=self._run,name="idps-store",daemon=True); self._thread.start()
+        return self
+
+    def on_event(self, ev):
+        if ev[0] in STORED or ev[0]=="enrich":
+            if len(self._pending)<self.max_pending: self._pending.append(ev)
+            else: self.dropped+=1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_every):
+            try:
+                self.flush()
+                if self.keep_days and time.monotonic()-self.last_prune>3600: self.prune()
+            except sqlite3.Error as e:
+                if self._engine is not None: self._engine.emit("error",f"event store: {e}")
+
+    def flush(self):
+        with self._io:
+            evs=self._pending; self._pending=[]
+            if not evs: return 0
+            rows=[_row(ev) for ev in evs if ev[0]!="enrich"]
+            geo=[ev[1:5] for ev in evs if ev[0]=="enrich"]
+            db=self._db
+            db.execute("BEGIN")
+            try:
+                db.executemany("INSERT INTO events(ts,ip,type,count,detail) VALUES(?,?,?,?,?)",rows)
+                if geo: db.executemany("INSERT OR REPLACE INTO geo(ip,label,lat,lon) VALUES(?,?,?,?)",geo)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK"); raise
+            self.written+=len(rows)
+            return len(rows)
+
+    def prune(self, chunk=50_000):
+        """Delete rows older than keep_days, a chunk per transaction so readers never wait long."""
+        cutoff=time.time()-self.keep_days*86400; n=0
+        with self._io:
+            while True:
+                cur=self._db.execute("DELETE FROM events WHERE id IN (SELECT id FROM events WHERE ts<? LIMIT ?)",(cutoff,chunk))
+                n+=cur.rowcount
+                if cur.rowcount<chunk: break
+        self.last_prune=time.monotonic()
+        return n
+
+    def close(self):
+        if self._engine is not None: self._engine.unsubscribe(self.on_event)
+        self._stop.set()
+        if self._thread is not None: self._thread.join(5)
+        if self._db is not None:
+            self.flush(); self._db.close(); self._db=None
+
+    # ---- reading (any thread; each call uses its own connection) ----
+    def _reader(self):
+        return sqlite3.connect(f"file:{self.path}?mode=ro",uri=True)
+
+    def page(self, before=None, size=500, **filters):
+        """Newest first: rows (id, ts, time, ip, type, count, detail, geo) older than the `before`
+        row's (ts, id); pass the last row of a page as `before` for the next one."""
+        conds,args=_where(**filters)
+        if before is not None:
+            conds.append("(e.ts,e.id)<(?,?)"); args+=[before[1],before[0]]
+        sql=SELECT+(" WHERE "+" AND ".join(conds) if conds else "")+" ORDER BY e.ts DESC, e.id DESC LIMIT ?"
+        with closing(self._reader()) as db:         # a bare `with` only commits, it never closes
+            return db.execute(sql,args+[size]).fetchall()
+
+    def count(self, **filters):
+        conds,args=_where(**filters)
+        with closing(self._reader()) as db:
+            return db.execute("SELECT count(*) FROM events e"+(" WHERE "+" AND ".join(conds) if conds else ""),args).fetchone()[0]
+
+    def rows(self, batch=STORE_FETCH, **filters):
+        """Oldest first, as (time, ip, type, count, detail, geo); fetched `batch` rows at a time."""
+        conds,args=_where(**filters)
+        sql=SELECT+(" WHERE "+" AND ".join(conds) if conds else "")+" ORDER BY e.ts, e.id"
+        db=self._reader()
+        try:
+            cur=db.execute(sql,args)
+            while True:
+                chunk=cur.fetchmany(batch)
+                if not chunk: break
+                yield [r[2:] for r in chunk]
+        finally:
+            db.close()
+
+    def export_csv(self, path, **filters):
+        n=0
+        with open(path,"w",newline="",encoding="utf-8") as fp:
+            w=csv.writer(fp); w.writerow([c.upper() for c in REPORT_COLUMNS])
+            for chunk in self.rows(**filters):
+                w.writerows(chunk); n+=len(chunk)
+        return n
+
+    def export_html(self, path, title="IDPS Report", **filters):
+        n=0; esc=html.escape
+        with open(path,"w",encoding="utf-8") as fp:
+            fp.write("<html><head><meta charset='utf-8'><title>IDPS Report</title>")
+            fp.write("<style>body{font-family:Segoe UI;background:#0b0e17;color:#eaf2ff;}table{border-collapse:collapse;width:100%;}th,td{border:1px solid #22324a;padding:8px;}th{background:#12223a;}</style></head><body>")
+            fp.write(f"<h2>{esc(title)} — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</h2>")
+            fp.write("<table><tr>"+"".join(f"<th>{c.upper()}</th>" for c in REPORT_COLUMNS)+"</tr>\n")
+            for chunk in self.rows(**filters):
+                fp.write("".join("<tr>"+"".join(f"<td>{esc('' if v is None else str(v))}</td>" for v in row)+"</tr>\n"
+                                 for row in chunk))      # every cell: addresses and types may come from peers
+                n+=len(chunk)
+            fp.write("</table></body></html>\n")
+        return n
+
+# ---- CLI ----
+def main(argv=None):
+    ap=argparse.ArgumentParser(description="Query or export the IDPS event store.")
+    sub=ap.add_subparsers(dest="cmd",required=True)
+    for name,hlp in (("export","write matching events as CSV and/or HTML"),("count","number of matching events")):
+        p=sub.add_parser(name,help=hlp)
+        p.add_argument("--db",default=STORE_PATH)
+        p.add_argument("--since",help="epoch or ISO time (UTC)")
+        p.add_argument("--until",help="epoch or ISO time (UTC), exclusive")
+        p.add_argument("--ip")
+        p.add_argument("--type",choices=STORED)
+        if name=="export":
+            p.add_argument("--csv",metavar="PATH"); p.add_argument("--html",metavar="PATH")
+    args=ap.parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"{args.db}: no such store", file=sys.stderr); return 2
+    st=EventStore(args.db); flt=dict(since=args.since,until=args.until,ip=args.ip,type=args.type)
+    if args.cmd=="count":
+        print(st.count(**flt)); return 0
+    if not args.csv and not args.html:
+        print("export: give --csv and/or --html", file=sys.stderr); return 2
+    for path,fn in ((args.csv,st.export_csv),(args.html,st.export_html)):
+        if not path: continue
+        t=time.perf_counter(); n=fn(path,**flt)
+        print(f"{path}: {n:,} rows in {time.perf_counter()-t:.2f}s", file=sys.stderr)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# idps_tail.py — follow a log file and feed new lines to an engine
+#
+# Reads in large chunks and hands over whole blocks of complete lines.
+# Wakes on inotify where available (Linux), otherwise polls. Survives
+# logrotate: rename + create (inode changes, including several rotations
+# before we got to look), copytruncate and plain truncation (file shrinks
+# below our offset).
+import os, re, time, select, ctypes, ctypes.util
+from collections import deque
+from idps_metrics import LINES, BYTES, READ_SECONDS
+
+CHUNK_SIZE = 1 << 16               # bytes per read()
+MAX_BATCH = 1 << 20                # hand over at most this much per block
+POLL_SECONDS = 0.2                 # fallback / safety-net wake interval
+SIG_BYTES = 512                    # tail fingerprint used to spot copytruncate
+ROTATED = re.compile(r"[.-]\d[\d.-]*")      # suffix of a rotated generation: .1, -20261018 (never .gz, .bak, -old)
+
+# ---- inotify (Linux only; everything else polls) ----
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+
+class Inotify:
+    """Minimal ctypes inotify: watch a directory, wait for any change in it."""
+    MASK = IN_MODIFY|IN_ATTRIB|IN_CLOSE_WRITE|IN_MOVED_FROM|IN_MOVED_TO|IN_CREATE|IN_DELETE
+
+    def __init__(self, directory):
+        libc=ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd=libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+        if self.fd<0: raise OSError(ctypes.get_errno(),"inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory or "."), self.MASK)<0:
+            err=ctypes.get_errno(); os.close(self.fd)
+            raise OSError(err,"inotify_add_watch failed")
+
+    def wait(self, timeout):
+        """Block until something changed or `timeout` passed; True if woken."""
+        r,_,_=select.select([self.fd],[],[],timeout)
+        if not r: return False
+        self.drain(); return True
+
+    def drain(self):
+        """Swallow queued change records (the fd is non-blocking)."""
+        try:
+            while os.read(self.fd,4096): pass
+        except BlockingIOError: pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd); self.fd=None
+
+def make_waiter(path):
+    try: return Inotify(os.path.dirname(os.path.abspath(path)))
+    except (OSError,AttributeError): return None
+
+# ---- Tailer ----
+class Tailer:
+    """Reads appended lines from `path`, block at a time."""
+    def __init__(self, path, from_end=True, chunk_size=CHUNK_SIZE, max_batch=MAX_BATCH,
+                 poll=POLL_SECONDS, use_inotify=True):
+        self.path=path; self.from_end=from_end
+        self.chunk_size=chunk_size; self.max_batch=max_batch; self.poll=poll
+        self.use_inotify=use_inotify
+        self.fd=None; self.ident=None; self.pos=0; self._partial=b""; self._reopen=False
+        self._sig=b""               # last bytes before pos, to spot a rewritten file
+        self.rotations=0; self.truncations=0; self.bytes_read=0
+        self._done=deque(maxlen=64)  # (dev, ino) of generations finished, so _missed never reads one twice
+        self._later=deque()          # (fd, ident) still to read after this one: missed generations, then the live file
+
+    # ---- file handle ----
+    def _open(self, at_end):
+        g=self._open_fd(self.path)
+        if g is None: return False
+        self._use(*g,at_end); self._reopen=False
+        return True
+
+    def _open_fd(self, path):
+        try:
+            fd=os.open(path, os.O_RDONLY|getattr(os,"O_BINARY",0))
+        except FileNotFoundError:
+            return None
+        st=os.fstat(fd)
+        return fd,(st.st_dev,st.st_ino)
+
+    def _use(self, fd, ident, at_end=False):
+        self.fd=fd; self.ident=ident; self._partial=b""; self._sig=b""
+        self.pos=os.lseek(fd,0,os.SEEK_END) if at_end else 0
+
+    def close(self):
+        while self._later: os.close(self._later.popleft()[0])
+        if self.fd is not None:
+            os.close(self.fd); self.fd=None
+
+    # ---- reading ----
+    def _read_raw(self, limit):
+        parts=[]; got=0
+        while got<limit:
+            b=os.pread(self.fd,self.chunk_size,self.pos) if hasattr(os,"pread") else self._seek_read()
+            if not b: break
+            parts.append(b); got+=len(b); self.pos+=len(b)
+            if len(b)<self.chunk_size: break
+        self.bytes_read+=got
+        return b"".join(parts)
+
+    def _seek_read(self):
+        os.lseek(self.fd,self.pos,os.SEEK_SET)
+        return os.read(self.fd,self.chunk_size)
+
+    def _split(self, data, final=False):
+        data=self._partial+data
+        if final:
+            self._partial=b""
+            if data and not data.endswith(b"\n"): data+=b"\n"
+        else:
+            cut=data.rfind(b"\n")+1
+            self._partial=data[cut:]; data=data[:cut]
+            if data: self._sig=data[-SIG_BYTES:]
+        return data.decode("utf-8","ignore") if data else ""
+
+    def _check_rotation(self):
+        """Returns text still owed from the old file if it was rotated away."""
+        try:
+            st=os.stat(self.path)
+        except FileNotFoundError:
+            return ""                  # moved away, new one not created yet: keep the old fd
+        if (st.st_dev,st.st_ino)!=self.ident:
+            # rename/create rotation: finish the old file, then start the new one at 0;
+            # generations rotated away in between are read first, max_batch at a time
+            tail=[]
+            while True:
+                data=self._read_raw(self.max_batch)
+                if not data: break
+                tail.append(data)
+            text=self._split(b"".join(tail),final=True)
+            done=os.fstat(self.fd).st_mtime_ns; self._done.append(self.ident)
+            os.close(self.fd); self.fd=None; self.rotations+=1
+            if not self._later:
+                self._reopen=True
+                if self._open(at_end=False): self._later.append((self.fd,self.ident))   # before the scan: no gap
+                for path in self._missed(done):
+                    g=self._open_fd(path)
+                    if g is not None: self._later.insert(len(self._later)-(self.fd is not None),g)
+            if self._later: self._use(*self._later.popleft())
+            return text or self.read_block()
+        if os.fstat(self.fd).st_size<self.pos:
+            # copytruncate / truncation: same inode, shorter than where we were
+            self.pos=0; self._partial=b""; self._sig=b""; self.truncations+=1
+        return ""
+
+    def _missed(self, done):
+        """Generations rotated away while we were still on an older one, oldest first:
+        siblings named like `path`.1 or `path`-date, last written no earlier than
+        the file we finished (mtime `done`; clock ticks are coarse), that are
+        neither one we have read nor the one now open."""
+        d,base=os.path.split(os.path.abspath(self.path)); found=[]
+        try: it=os.scandir(d)
+        except OSError: return []
+        with it:
+            for e in it:
+                n=e.name
+                if not n.startswith(base) or not ROTATED.fullmatch(n,len(base)): continue
+                try: st=e.stat()
+                except OSError: continue
+                ident=(st.st_dev,st.st_ino)
+                if st.st_mtime_ns>=done and ident!=self.ident and ident not in self._done:
+                    found.append((st.st_mtime_ns,st.st_ctime_ns,e.path))
+        found.sort()
+        return [f[2] for f in found]
+
+    def _rewritten(self):
+        # copytruncate that regrew past our offset before we looked: the bytes
+        # just before where we stopped are no longer the ones we read there
+        sig=self._sig
+        if not sig or self._partial or not hasattr(os,"pread"): return False
+        return os.pread(self.fd,len(sig),self.pos-len(sig))!=sig
+
+    def read_block(self):
+        """All complete lines available right now (up to max_batch bytes), as one str."""
+        if self.fd is None and not self._open(self.from_end and not self._reopen): return ""
+        if self._rewritten():
+            self.pos=0; self._sig=b""; self.truncations+=1
+        t=time.perf_counter()
+        data=self._read_raw(self.max_batch)
+        if data:
+            text=self._split(data)
+            READ_SECONDS.since(t); BYTES.inc(len(data)); LINES.inc(text.count("\n"))
+            return text
+        return self._check_rotation()
+
+    def run(self, on_block, stop):
+        """Call on_block(text) for every new block until `stop` is set."""
+        waiter=make_waiter(self.path) if self.use_inotify else None
+        try:
+            while not stop.is_set():
+                text=self.read_block()
+                if text:
+                    on_block(text); continue
+                if waiter is not None: waiter.wait(self.poll*5)
+                else: stop.wait(self.poll)
+        finally:
+            if waiter is not None: waiter.close()
+            self.close()
+
+def tail_worker(path, engine, stop, from_end=True):
+    """Run until `stop` (a threading.Event) is set."""
+    try:
+        Tailer(path, from_end=from_end).run(engine.feed_text, stop)
+    except Exception as e:
+        engine.emit("error",str(e))
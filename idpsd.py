@@ -0,0 +1,213 @@
+# idpsd.py — headless IDPS daemon (no display, no Tk)
+#   python idpsd.py --log /var/log/auth.log --threshold 5
+#   python idpsd.py --log /var/log/auth.log /var/log/nginx/access.log --shards 4 --signature nginx-401
+#   python idpsd.py --log /var/log/auth.log --whitelist 10.0.0.0/8 --blocklist-file drop.txt   (kill -HUP reloads lists)
+#   python idpsd.py --log /var/log/auth.log /var/log/secure --asyncio      (one event-loop thread for tail/geo/firewall)
+#   python idpsd.py --log /var/log/auth.log --subnets         (also alert/block a /24 or /16 that attacks from many IPs)
+#   python idpsd.py --log /var/log/auth.log --peers 10.0.0.2 10.0.0.3 --peer-key-file /etc/idps/peer.key   (share blocks)
+#   python idps_store.py export --since 2026-01-01 --type alert --csv alerts.csv   (events recorded by --store)
+import argparse, json, re, signal, sqlite3, sys, threading, time
+from idps_engine import DetectionEngine, Classifier, EXTRA_SIGNATURES, THRESHOLD_DEFAULT, BLOCK_SECONDS_DEFAULT, WINDOW_SECONDS, utc
+import idps_geo
+from idps_response import Responder, RESPONSE_WORKERS, BLOCKS_STATE
+from idps_tail import tail_worker
+from idps_firewall import BACKENDS, FIREWALL_BATCH_SECONDS, BatchingFirewall, default_backend
+from idps_shard import ShardedIngest
+from idps_journal import StateJournal, JOURNAL_PATH
+from idps_store import EventStore, STORE_PATH, STORE_KEEP_DAYS
+from idps_iplist import IPList
+from idps_async import AsyncRuntime, make_async_geo, GEO_CONCURRENCY
+from idps_peer import PeerSync, PEER_PORT, PEER_GROUP, local_address, parse_peer
+from idps_sketch import SubnetDetector, subnet_levels, SUBNET_HITS, SUBNET_SOURCES
+import idps_metrics
+
+def describe(ev):
+    kind=ev[0]
+    if kind in ("fail","scan"):
+        _,ip,ts,cnt=ev; return f"[{utc(ts)}] {kind.upper()} {ip} (count={cnt})"
+    if kind=="ignored":
+        _,ip,ts=ev; return f"[{utc(ts)}] Ignored whitelisted IP {ip}"
+    if kind=="alert":
+        _,ip,ts,typ,cnt=ev; return f"[{utc(ts)}] ALERT: {typ} — {ip} (count={cnt})"
+    if kind=="enrich":
+        _,ip,label,lat,lon,typ=ev; return f"GEO {ip}: {label} ({lat}, {lon})"
+    if kind=="blocked":
+        _,ip,ts,until,resp=ev; return f"[{utc(ts)}] BLOCKED {ip} for {int(until-ts)}s\n{resp}"
+    if kind=="unblocked":
+        _,ip,ts=ev; return f"[{utc(ts)}] UNBLOCKED {ip}"
+    if kind=="error": return f"[ERROR] {ev[1]}"
+    return " ".join(str(x) for x in ev[1:])
+
+def build_parser():
+    ap=argparse.ArgumentParser(description="Headless IDPS: tail a log, alert and block.")
+    ap.add_argument("--log",required=True,nargs="+",help="log file(s) to follow (e.g. /var/log/auth.log)")
+    ap.add_argument("--shards",type=int,default=0,metavar="N",
+                    help="parse each log in its own process and count in N processes (default: in-process, one log)")
+    ap.add_argument("--threshold",type=int,default=THRESHOLD_DEFAULT)
+    ap.add_argument("--block-seconds",type=int,default=BLOCK_SECONDS_DEFAULT)
+    ap.add_argument("--window",type=int,default=WINDOW_SECONDS)
+    ap.add_argument("--subnets",action="store_true",
+                    help="count hits per /24 and /16 (/64, /48) in fixed-size sketches; alert on busy prefixes")
+    ap.add_argument("--subnet-hits",type=int,default=SUBNET_HITS,metavar="N",help="hits in the window for a /24 alert (/16: 4x)")
+    ap.add_argument("--subnet-sources",type=int,default=SUBNET_SOURCES,metavar="N",
+                    help="distinct IPs a /24 alert needs (/16: 4x)")
+    ap.add_argument("--alert-only",action="store_true",help="never touch the firewall")
+    ap.add_argument("--whitelist",nargs="*",default=[],metavar="IP/CIDR",help="never count or block these")
+    ap.add_argument("--whitelist-file",metavar="PATH",help="one IP/CIDR per line, # comments; re-read on SIGHUP")
+    ap.add_argument("--blocklist",nargs="*",default=[],metavar="IP/CIDR",help="block these on their first hit")
+    ap.add_argument("--blocklist-file",metavar="PATH",help="like --whitelist-file, for the blocklist")
+    ap.add_argument("--signature",nargs="*",default=[],choices=sorted(EXTRA_SIGNATURES),
+                    help="enable extra built-in signatures")
+    ap.add_argument("--custom-signature",nargs=3,action="append",default=[],metavar=("KIND","LITERAL","PATTERN"),
+                    help='e.g. fail "Invalid user" "Invalid user .*from {ip}"')
+    ap.add_argument("--geo-db",default=idps_geo.GEO_DB,help="local IP range CSV (or compiled .bin)")
+    ap.add_argument("--no-online-geo",action="store_true",help="never call ip-api.com")
+    ap.add_argument("--workers",type=int,default=RESPONSE_WORKERS,help="enrich/block workers (threads, or tasks with --asyncio)")
+    ap.add_argument("--asyncio",action="store_true",
+                    help="tail, geolocate and block on one asyncio loop instead of worker threads")
+    ap.add_argument("--geo-concurrency",type=int,default=GEO_CONCURRENCY,help="--asyncio: online geo lookups in flight")
+    ap.add_argument("--stats-every",type=float,default=0,metavar="SEC",help="print response stats to stderr")
+    ap.add_argument("--firewall",default="auto",choices=["auto"]+sorted(BACKENDS),
+                    help="auto = netsh on Windows, nft where available, else dry-run")
+    ap.add_argument("--batch-ms",type=float,default=FIREWALL_BATCH_SECONDS*1e3,help="coalesce firewall changes for this long")
+    ap.add_argument("--peers",nargs="*",default=[],metavar="HOST[:PORT]",
+                    help="send our blocks/unblocks to these IDPS instances and apply theirs (UDP)")
+    ap.add_argument("--peer-group",nargs="?",const=PEER_GROUP,metavar="ADDR",
+                    help=f"...or to everyone in this multicast group (default {PEER_GROUP}), same port")
+    ap.add_argument("--peer-port",type=int,default=PEER_PORT,help="UDP port peer sync listens on")
+    ap.add_argument("--peer-key-file",metavar="PATH",help="shared secret: sign datagrams, drop unsigned ones")
+    ap.add_argument("--peer-insecure",action="store_true",help="allow peer sync without a key (trusted segment only)")
+    ap.add_argument("--peer-bind",metavar="ADDR",help="listen for peers on ADDR (default: the address that routes to the first peer)")
+    ap.add_argument("--peer-counts",action="store_true",help="also share per-IP hit counts, so the threshold counts fleet-wide")
+    ap.add_argument("--metrics-port",type=int,default=0,metavar="PORT",
+                    help=f"serve Prometheus /metrics and /profile on 127.0.0.1:PORT (e.g. {idps_metrics.METRICS_PORT})")
+    ap.add_argument("--state",default=JOURNAL_PATH,metavar="PATH",
+                    help="keep counters, blocks and whitelist in PATH.snap/PATH.journal across restarts ('' = off)")
+    ap.add_argument("--store",default=STORE_PATH,metavar="PATH",
+                    help="record every detection, alert, block and unblock in this SQLite file ('' = off)")
+    ap.add_argument("--store-days",type=float,default=STORE_KEEP_DAYS,metavar="DAYS",help="prune stored events older than this (0 = never)")
+    ap.add_argument("--blocks-file",default=BLOCKS_STATE,help="where active block deadlines are kept")
+    ap.add_argument("--from-start",action="store_true",help="read the whole file, not just new lines")
+    ap.add_argument("--verbose",action="store_true",help="also print every matched line")
+    ap.add_argument("--json",action="store_true",help="one JSON array per event")
+    return ap
+
+def load_lists(args):
+    """(whitelist, blocklist) entries from the command line plus the list files."""
+    out=[]
+    for entries,path in ((args.whitelist,args.whitelist_file),(args.blocklist,args.blocklist_file)):
+        lst=IPList(entries)
+        if path:
+            n,bad=lst.load_file(path)
+            if bad: print(f"{path}: skipped {bad} bad entries", file=sys.stderr)
+        out.append(list(lst))
+    return out
+
+def main(argv=None):
+    args=build_parser().parse_args(argv)
+    clf=Classifier()
+    try:
+        for name in args.signature: clf.add(*EXTRA_SIGNATURES[name])
+        for sig in args.custom_signature: clf.add(*sig)
+    except (ValueError,re.error) as e:
+        print(f"bad signature: {e}", file=sys.stderr); return 2
+    engine=DetectionEngine(args.threshold,args.block_seconds,args.window,protect_mode=not args.alert_only,classifier=clf)
+    try:
+        wl,bl=load_lists(args)
+    except (OSError,ValueError) as e:
+        print(f"ip lists: {e}", file=sys.stderr); return 2
+    engine.blocklist.update(bl)
+    sharded=bool(args.shards or (len(args.log)>1 and not args.asyncio))
+    if args.subnets and sharded:
+        print("--subnets: ignored with sharded ingest (each shard sees only some IPs of a prefix)", file=sys.stderr)
+    elif args.subnets:
+        engine.subnets=SubnetDetector(args.window,subnet_levels(args.subnet_hits,args.subnet_sources))
+    idps_geo.set_provider(idps_geo.make_provider(args.geo_db, online=not args.no_online_geo))
+
+    quiet=() if args.verbose else ("fail","scan","ignored")
+    def out(ev):
+        if ev[0] in quiet: return
+        print(json.dumps(ev,default=str) if args.json else describe(ev), flush=True)
+    engine.subscribe(out)
+    journal=None
+    if args.state:
+        journal=StateJournal(engine,args.state); r=journal.load()
+        if r["snapshot_ips"] or r["journal_records"]:
+            print(f"[{utc(engine.clock())}] State restored: {r['snapshot_ips']:,} IPs + {r['journal_records']:,} journal records "
+                  f"in {r['seconds']}s", file=sys.stderr, flush=True)
+        journal.start()
+    if args.whitelist or args.whitelist_file:
+        engine.whitelist.reload(wl)    # the operator's list replaces the snapshot's; the journal records the difference
+    store=None
+    if args.store:
+        try: store=EventStore(args.store,keep_days=args.store_days).open().attach(engine)
+        except sqlite3.Error as e:
+            print(f"event store {args.store}: {e}", file=sys.stderr); return 2
+    if args.asyncio:
+        geo=make_async_geo(args.geo_db,online=not args.no_online_geo,limit=args.geo_concurrency)
+        responder=AsyncRuntime(engine,geo=geo,backend=default_backend(args.firewall),workers=args.workers,
+                               batch_interval=args.batch_ms/1e3,state_path=args.blocks_file).start()
+    else:
+        fw=BatchingFirewall(default_backend(args.firewall),interval=args.batch_ms/1e3)
+        responder=Responder(engine,firewall=fw,workers=args.workers,state_path=args.blocks_file)
+
+    peer=None
+    if args.peers or args.peer_group:
+        try:
+            key=None
+            if args.peer_key_file:
+                with open(args.peer_key_file,"rb") as fp: key=fp.read().strip()
+            elif not args.peer_insecure:
+                print("peer sync needs --peer-key-file (or --peer-insecure on a trusted segment)", file=sys.stderr); return 2
+            else: print("peer sync without --peer-key-file: anyone who can reach the port can block addresses here", file=sys.stderr)
+            bind=args.peer_bind or (local_address(*parse_peer(args.peers[0],args.peer_port)) if args.peers and not args.peer_group else "0.0.0.0")
+            peer=PeerSync(engine,responder,port=args.peer_port,peers=args.peers,group=args.peer_group,key=key,
+                          share_counts=args.peer_counts,bind=bind).start()
+        except (OSError,ValueError) as e:
+            print(f"peer sync: {e}", file=sys.stderr); return 2
+    if args.metrics_port:
+        try: idps_metrics.serve(args.metrics_port)
+        except OSError as e:
+            print(f"metrics endpoint: {e}", file=sys.stderr); return 2
+    stop=threading.Event()
+    for sig in (signal.SIGINT,signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    reload=threading.Event()
+    if hasattr(signal,"SIGHUP"): signal.signal(signal.SIGHUP, lambda *_: reload.set())
+    ingest=None
+    if sharded:
+        ingest=ShardedIngest(args.log,engine,shards=args.shards or None,from_end=not args.from_start).start()
+    elif args.asyncio:
+        for path in args.log: responder.follow(path,from_end=not args.from_start)
+    else:
+        threading.Thread(target=tail_worker,args=(args.log[0],engine,stop,not args.from_start),daemon=True).start()
+    print(f"[{utc(engine.clock())}] Monitoring started: {', '.join(args.log)}", file=sys.stderr, flush=True)
+    last_stats=time.monotonic()
+    while not stop.wait(1.0):
+        engine.tick()
+        if reload.is_set():
+            reload.clear()
+            try:
+                wl,bl=load_lists(args)
+            except (OSError,ValueError) as e:
+                print(f"ip lists not reloaded: {e}", file=sys.stderr, flush=True)
+            else:
+                engine.whitelist.reload(wl); engine.blocklist.reload(bl)     # lookups keep running meanwhile
+                if ingest is not None: ingest.set_lists(wl,bl)
+                print(f"[{utc(engine.clock())}] Lists reloaded: {len(wl):,} whitelist, {len(bl):,} blocklist entries",
+                      file=sys.stderr, flush=True)
+        if args.stats_every and time.monotonic()-last_stats>=args.stats_every:
+            last_stats=time.monotonic()
+            st={"responder":responder.stats()}
+            if peer is not None: st["peers"]=peer.stats()
+            print(json.dumps(st), file=sys.stderr, flush=True)
+    if ingest is not None: ingest.stop()
+    if peer is not None: peer.close()
+    if journal is not None: journal.close()
+    responder.close(wait=False)
+    if store is not None: store.close()
+    print(f"[{utc(engine.clock())}] Monitoring stopped.", file=sys.stderr, flush=True)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
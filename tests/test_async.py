@@ -0,0 +1,18 @@
+import asyncio, threading
+from idps_async import AsyncGeo
+from idps_firewall import NftBackend
+from idps_geo import UNKNOWN
+
+def test_geo_errors_count_as_failures():
+    async def fetch(ip): raise KeyError(ip)
+    g=AsyncGeo(fetch=fetch)
+    assert asyncio.run(g("192.0.2.1"))==UNKNOWN and g.failures==1 and g.active==0
+
+def test_nft_setup_runs_off_the_loop():
+    b=NftBackend(); seen=[]
+    def setup():
+        if not b.ready: seen.append(threading.get_ident()); b.ready=True
+    b.setup=setup
+    async def go(): return threading.get_ident(),await b.apply_async("unblock",["192.0.2.1"])
+    loop_thread,out=asyncio.run(go())
+    assert out=="" and len(seen)==1 and seen[0]!=loop_thread
@@ -0,0 +1,55 @@
+import pytest
+from idps_engine import Classifier, WindowCounter, DetectionEngine, EXTRA_SIGNATURES, ip_key, ip_str
+
+# ---- Classifier ----
+def test_classify_default_signatures():
+    c=Classifier()
+    assert c.classify("Oct 18 sshd[1]: Failed password for root from 203.0.113.5 port 22 ssh2")==("fail","203.0.113.5")
+    assert c.classify("kernel: Port scan detected from 2001:db8::7")==("scan","2001:db8::7")
+    assert c.classify("Oct 18 sshd[1]: Accepted password for root from 203.0.113.5")is None
+    assert c.classify("Failed password for root")is None         # literal but no address
+
+def test_scan_matches_classify_line_by_line():
+    c=Classifier(); c.add(*EXTRA_SIGNATURES["sshd-invalid-user"])
+    lines=["noise","Failed password for x from 10.0.0.1 port 1","Invalid user admin from 10.0.0.2",
+           "Port scan SYN from 10.0.0.3","Failed password for y from 10.0.0.4"]
+    text="\n".join(lines)
+    assert c.scan(text)==[h for h in map(c.classify,lines) if h]
+    assert [p for _,_,p in c.scan(text,pos=True)]==[text.index(ln) for ln in lines[1:]]
+
+@pytest.mark.parametrize("sig",[("brute","x","{ip}"),("fail","x","no placeholder"),("fail","","{ip}")])
+def test_add_rejects_bad_signatures(sig):
+    with pytest.raises(ValueError): Classifier().add(*sig)
+
+# ---- WindowCounter ----
+def test_window_counter_counts_within_window():
+    w=WindowCounter(60)
+    assert [w.add(1,t) for t in (0,10,20)]==[1,2,3]
+    assert w.count(1,20)==3 and w.count(1,65)==2 and w.count(1,81)==0
+    assert w.add(1,100)==1                                   # everything before 40 fell out
+
+def test_window_counter_sweep_drops_idle_keys():
+    w=WindowCounter(60)
+    w.add(1,0); w.add(2,0); w.add(2,30); w.add(3,50)
+    assert w.sweep(70)==1 and 1 not in w and len(w)==2
+    assert w.sweep(200)==2 and len(w)==0
+
+def test_window_counter_export_restore_round_trip():
+    w=WindowCounter(60)
+    for k,t in ((1,0),(2,5),(2,6),(3,7),(2,8)): w.add(k,t)
+    r=WindowCounter(60); r.restore(*w.export())
+    assert [r.count(k,10) for k in (1,2,3)]==[1,3,1]
+    assert r.add(2,11)==4 and r.sweep(68)==2 and list(r.export()[0])==[2]
+
+# ---- DetectionEngine ----
+def test_engine_alerts_at_threshold_and_ignores_whitelist():
+    e=DetectionEngine(threshold=3,clock=lambda: 1000.0); ev=[]; e.subscribe(ev.append)
+    e.whitelist.add("10.0.0.0/8")
+    for _ in range(3): e.feed("Failed password for root from 198.51.100.9 port 1")
+    e.feed("Failed password for root from 10.1.2.3 port 1")
+    assert ("alert","198.51.100.9",1000.0,"FAILED_LOGIN",3) in ev
+    assert ("ignored","10.1.2.3",1000.0) in ev
+
+def test_ip_key_round_trip():
+    for ip in ("0.0.0.0","203.0.113.5","::1","2001:db8::7"): assert ip_str(ip_key(ip))==ip
+    assert ip_key("999.1.1.1") is None and ip_key("::1")!=ip_key("0.0.0.1")
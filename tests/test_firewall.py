@@ -0,0 +1,40 @@
+import pytest
+from idps_firewall import NftBackend, NetshBackend
+
+def nft():
+    b=NftBackend(); b.ready=True       # no nft here: only the scripts are checked
+    return b
+
+def run(b, op, ips):
+    cmd=b.command(op,ips)
+    if cmd is None: return ""
+    argv,script,done=cmd; done(0,""); return script
+
+def test_single_ips_and_networks_go_to_their_sets():
+    s=run(nft(),"block",["1.2.3.4","10.0.0.0/24","::1","2001:db8::/48"])
+    assert "add element inet idps blocked4 { 1.2.3.4 }" in s
+    assert "add element inet idps blocked4n { 10.0.0.0/24 }" in s
+    assert "add element inet idps blocked6 { ::1 }" in s
+    assert "add element inet idps blocked6n { 2001:db8::/48 }" in s
+
+def test_overlapping_prefixes_never_overlap_in_the_set():
+    b=nft()
+    assert run(b,"block",["10.0.1.0/24"])=="add element inet idps blocked4n { 10.0.1.0/24 }\n"
+    # the /16 replaces the /24 it covers in the same transaction; a single IP in the batch still goes in
+    s=run(b,"block",["10.0.0.0/16","9.9.9.9"])
+    assert s.index("delete element inet idps blocked4n { 10.0.1.0/24 }")<s.index("add element inet idps blocked4n { 10.0.0.0/16 }")
+    assert "add element inet idps blocked4 { 9.9.9.9 }" in s
+    assert run(b,"block",["10.0.2.0/24"])==""             # inside the /16: remembered only
+    assert {"10.0.1.0/24","10.0.2.0/24","10.0.0.0/16"}<=b.active
+    assert run(b,"unblock",["10.0.1.0/24"])==""           # still covered
+    s=run(b,"unblock",["10.0.0.0/16"])                   # the remaining /24 comes back
+    assert "delete element inet idps blocked4n { 10.0.0.0/16 }" in s and "add element inet idps blocked4n { 10.0.2.0/24 }" in s
+    assert "10.0.1.0/24" not in s
+    assert run(b,"unblock",["10.0.2.0/24"])=="delete element inet idps blocked4n { 10.0.2.0/24 }\n"
+    assert b.active=={"9.9.9.9"}
+
+@pytest.mark.parametrize("ip",["1.2.3.4 }\nflush ruleset\nadd element inet idps blocked4 { 5.6.7.8",
+                               "1.2.3.4/24","fe80::1%eth0","01.2.3.4"," 1.2.3.4",""])
+def test_scripts_refuse_non_canonical_addresses(ip):
+    with pytest.raises(ValueError): nft()._elements("add",[ip])
+    with pytest.raises(ValueError): NetshBackend()._lines("block",[ip])
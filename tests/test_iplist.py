@@ -0,0 +1,39 @@
+import pytest
+from idps_iplist import IPList, canonical
+
+def test_membership_addresses_and_networks():
+    lst=IPList(["203.0.113.5","10.0.0.0/8","2001:db8::/32","::1"])
+    assert "203.0.113.5" in lst and "10.200.1.1" in lst and "2001:db8:1::9" in lst and "::1" in lst
+    assert "203.0.113.6" not in lst and "11.0.0.1" not in lst and "2001:db9::1" not in lst
+    assert "not an ip" not in lst and "1.2.3.4 }" not in lst     # junk is never a member, never an error
+
+def test_entries_are_normalized():
+    lst=IPList(["10.1.2.3/8","1.2.3.4/32","2001:DB8::1"])
+    assert list(lst)==["1.2.3.4","10.0.0.0/8","2001:db8::1"]
+
+def test_overlaps():
+    lst=IPList(["10.0.1.0/24","2001:db8::1"])
+    assert lst.overlaps("10.0.0.0/16") and lst.overlaps("10.0.1.7") and lst.overlaps("2001:db8::/64")
+    assert not lst.overlaps("10.0.2.0/24") and not lst.overlaps("2001:db9::/32")
+
+def test_changes_rebuild_the_index():
+    lst=IPList(["10.0.0.0/8"])
+    lst.add("192.0.2.1"); assert "192.0.2.1" in lst
+    lst.discard("10.0.0.0/8"); assert "10.1.1.1" not in lst
+    lst.discard("junk")                                       # ignored
+    lst.reload(["172.16.0.0/12"]); assert list(lst)==["172.16.0.0/12"] and "192.0.2.1" not in lst
+    lst.clear(); assert not lst
+
+def test_load_file_skips_bad_lines(tmp_path):
+    p=tmp_path/"list.txt"; p.write_text("# header\n10.0.0.0/8  # office\nnonsense\n\n::1\n")
+    lst=IPList(["192.0.2.1"])
+    assert lst.load_file(str(p))==(2,1) and "192.0.2.1" in lst
+    assert lst.load_file(str(p),replace=True)==(2,1) and "192.0.2.1" not in lst
+
+@pytest.mark.parametrize("ip",["1.2.3.4","10.0.0.0/8","::1","2001:db8::/32"])
+def test_canonical_accepts_normalized(ip):
+    assert canonical(ip)==ip
+
+@pytest.mark.parametrize("ip",["1.2.3.4/24","1.2.3.4/32","2001:DB8::1","fe80::1%eth0"," 1.2.3.4","1.2.3.4\n","",None,5])
+def test_canonical_rejects_everything_else(ip):
+    with pytest.raises(ValueError): canonical(ip)
@@ -0,0 +1,62 @@
+from idps_engine import DetectionEngine, ip_key
+from idps_journal import StateJournal
+
+T0=1_000_000.0
+LINE="Failed password for root from {} port 22"
+
+def engine(): return DetectionEngine(threshold=100,clock=lambda: T0+30)
+
+def crash(j):
+    """Flush and stop the writer without the final snapshot close() would take."""
+    j.flush(); j._stop.set(); j._thread.join(2); j._fp.close()
+
+def fill(e, ips, ts):
+    for ip in ips: e.feed(LINE.format(ip),ts=ts)
+
+def test_snapshot_plus_journal_round_trip(tmp_path):
+    path=str(tmp_path/"st")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start()
+    fill(e,["198.51.100.1","198.51.100.1","2001:db8::5"],T0)
+    j.snapshot()                                             # gen 1: the hits above
+    fill(e,["198.51.100.1","203.0.113.9"],T0+1)               # journal only
+    e.mark_blocked("192.0.2.7",T0+3600); e.whitelist.add("10.0.0.0/8")
+    crash(j)
+
+    r=engine(); jr=StateJournal(r,path); res=jr.load()
+    assert res["journal_records"]==4
+    assert r.fail_events.count(ip_key("198.51.100.1"),T0+2)==3
+    assert r.fail_events.count(ip_key("2001:db8::5"),T0+2)==1
+    assert r.fail_events.count(ip_key("203.0.113.9"),T0+2)==1
+    assert r.blocked_until=={"192.0.2.7":T0+3600} and list(r.whitelist)==["10.0.0.0/8"]
+
+def test_torn_last_record_is_ignored(tmp_path):
+    path=str(tmp_path/"st")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start()
+    e.mark_blocked("192.0.2.7",T0+3600); crash(j)
+    with open(path+".journal","a") as fp: fp.write("block\t192.0.2.8\t99")   # no newline: write cut short
+    r=engine(); StateJournal(r,path).load()
+    assert list(r.blocked_until)==["192.0.2.7"]
+
+def test_start_replaces_a_journal_from_another_generation(tmp_path):
+    path=str(tmp_path/"st")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start(); j.close()    # snapshot gen 1
+    with open(path+".journal","w") as fp: fp.write("#gen 0\nblock\t192.0.2.9\t9e12\n")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start()
+    assert "192.0.2.9" not in e.blocked_until                 # stale: already inside the snapshot
+    e.mark_blocked("192.0.2.7",T0+3600); crash(j)
+    r=engine(); assert StateJournal(r,path).load()["journal_records"]==1
+    assert list(r.blocked_until)==["192.0.2.7"]
+
+def test_unblock_all_survives_a_restart(tmp_path):
+    path=str(tmp_path/"st")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start()
+    e.mark_blocked("192.0.2.7",T0+3600); e.mark_blocked("10.0.0.0/24",T0+3600); j.snapshot()
+    e.unblock_all(); crash(j)
+    r=engine(); StateJournal(r,path).load()
+    assert r.blocked_until=={} and not r.blocked_nets
+
+def test_garbled_generation_header_is_skipped(tmp_path):
+    path=str(tmp_path/"st")
+    e=engine(); j=StateJournal(e,path); j.load(); j.start(); j.close()
+    with open(path+".journal","w") as fp: fp.write("#gen 1x\nblock\t192.0.2.9\t9e12\n")
+    r=engine(); assert StateJournal(r,path).load()["journal_records"]==0 and r.blocked_until=={}
@@ -0,0 +1,95 @@
+import json, socket, time
+import pytest
+from idps_engine import DetectionEngine
+from idps_firewall import RecordingBackend
+from idps_peer import PeerSync, MAGIC, check_op, local_address, parse_peer
+from idps_response import Responder
+
+INJECT="1.2.3.4 }\nflush ruleset\nadd element inet idps blocked4 { 5.6.7.8"
+
+class FakeEngine:
+    def __init__(self, now=1000.0): self.now=now; self.blocked_until={}; self.fed=[]; self.events=[]
+    def clock(self): return self.now
+    def emit(self, *ev): self.events.append(ev)
+    def feed_hits(self, hits): self.fed+=hits
+
+class FakeResponder:
+    def __init__(self): self.adopted=[]; self.unblocked=[]
+    def adopt(self, ip, until, origin): self.adopted.append((ip,until,origin)); return not ip.startswith("10.")
+    def unblock(self, ip): self.unblocked.append(ip)
+
+def datagram(ops, node="peer", q=1): return MAGIC+b"u"+json.dumps({"n":node,"q":q,"ops":ops}).encode()
+
+def test_parse_peer():
+    assert parse_peer("10.0.0.1")==("10.0.0.1",9109) and parse_peer("host:1")==("host",1)
+    assert parse_peer("[::1]:7")==("::1",7) and parse_peer("::1")==("::1",9109)
+
+@pytest.mark.parametrize("op",[["b","192.0.2.1",2000,1000.5],["u","2001:db8::1"],["b","10.0.0.0/24",2000,0],
+                               ["c","fail","192.0.2.1",3,999.0]])
+def test_check_op_accepts(op):
+    assert check_op(op)==op
+
+@pytest.mark.parametrize("op",[["b",INJECT,2000,0],["b","1.2.3.4/24",2000,0],["u","fe80::1%eth0"],["b","192.0.2.1","2000",0],
+                               ["b","192.0.2.1",float("nan"),0],["b","192.0.2.1",True,0],["b","192.0.2.1",2000],
+                               ["c","brute","192.0.2.1",3,1.0],["c","fail","192.0.2.1",3.5,1.0],["c","fail","192.0.2.1",3,"x"],
+                               ["x","192.0.2.1"],[],"b192.0.2.1",{"0":"b"},None,7])
+def test_check_op_rejects(op):
+    assert check_op(op) is None
+
+def test_handle_drops_invalid_ops_and_applies_the_rest():
+    e=FakeEngine(); r=FakeResponder(); p=PeerSync(e,r)
+    p.handle(datagram([["b",INJECT,2000,0],["b","192.0.2.1",2000,0],["b","192.0.2.2",500,0],7,["u","junk"]]))
+    assert r.adopted==[("192.0.2.1",2000,"peer")]             # 192.0.2.2 already ran out
+    assert p.stats()["invalid"]==3 and p.adopted==1
+
+def test_peer_hit_timestamps_are_clamped_to_now():
+    e=FakeEngine(now=1000.0); p=PeerSync(e,FakeResponder())
+    p.handle(datagram([["c","fail","192.0.2.1",2,1e12],["c","scan","192.0.2.2",1,900.0],["c","fail","192.0.2.3",0,900.0]]))
+    assert e.fed==[("fail","192.0.2.1",1000.0)]*2+[("scan","192.0.2.2",900.0)]
+
+def test_duplicates_and_unsigned_datagrams():
+    e=FakeEngine(); r=FakeResponder(); p=PeerSync(e,r)
+    d=datagram([["b","192.0.2.1",2000,0]]); p.handle(d); p.handle(d)
+    assert p.dups==1 and len(r.adopted)==1
+    k=PeerSync(e,r,key=b"secret"); k.handle(datagram([["b","192.0.2.9",2000,0]],q=2))
+    assert k.bad==1 and len(r.adopted)==1
+
+def free_ports(n):
+    socks=[socket.socket(socket.AF_INET,socket.SOCK_DGRAM) for _ in range(n)]
+    for s in socks: s.bind(("127.0.0.1",0))
+    ports=[s.getsockname()[1] for s in socks]
+    for s in socks: s.close()
+    return ports
+
+def test_blocks_propagate_between_instances_on_localhost():
+    ports=free_ports(3); nodes=[]
+    try:
+        for i,port in enumerate(ports):
+            eng=DetectionEngine(threshold=3,block_seconds=3600)
+            resp=Responder(eng,geo=lambda ip: ("Somewhere",None,None),firewall=RecordingBackend(),workers=1,state_path=None)
+            peers=[("127.0.0.1",p) for p in ports if p!=port]
+            ps=PeerSync(eng,resp,port=port,peers=peers,key=b"test",node=f"node{i}",batch=0.02,bind="127.0.0.1").start()
+            nodes.append((eng,resp,ps))
+        eng0=nodes[0][0]; now=time.time()
+        eng0.feed_hits([("fail","203.0.113.7",now)]*3)
+        end=time.time()+5
+        while time.time()<end and not all("203.0.113.7" in e.blocked_until for e,_,_ in nodes): time.sleep(0.01)
+        untils={e.blocked_until.get("203.0.113.7") for e,_,_ in nodes}
+        assert len(untils)==1 and None not in untils            # same deadline everywhere
+        for _,r,_ in nodes: r.firewall.flush()
+        assert all(r.firewall.backend.active=={"203.0.113.7"} for _,r,_ in nodes)
+        assert sum(ps.adopted for _,_,ps in nodes)==2
+        nodes[1][1].unblock("203.0.113.7")                     # an operator's early unblock spreads too
+        end=time.time()+5
+        while time.time()<end and any("203.0.113.7" in e.blocked_until for e,_,_ in nodes): time.sleep(0.01)
+        assert not any("203.0.113.7" in e.blocked_until for e,_,_ in nodes)
+    finally:
+        for _,r,ps in nodes: ps.close(); r.close(wait=False)
+
+def test_refused_blocks_are_not_remembered():
+    e=FakeEngine(); r=FakeResponder(); p=PeerSync(e,r)
+    p.handle(datagram([["b",f"10.0.{i>>8}.{i&255}",2000,0] for i in range(50)]+[["b","192.0.2.1",2000,0]]))
+    assert len(r.adopted)==51 and p.adopted==1 and list(p._adopted)==["192.0.2.1"]
+
+def test_local_address_is_the_route_to_the_peer():
+    assert local_address("127.0.0.1")=="127.0.0.1"
@@ -0,0 +1,20 @@
+from idps_engine import Classifier
+from idps_replay import ReplayRun, TimeParser, replay
+
+LINE="Failed password for root from 198.51.100.4 port 22\n"
+
+def test_time_parser_formats():
+    p=TimeParser(year=2026)
+    assert p("2026-10-18T10:00:00Z sshd") == 1792317600.0
+    assert p("2026-10-18 12:00:00+02:00 sshd") == 1792317600.0
+    assert p("Oct 18 10:00:00 host sshd") == 1792317600.0
+    assert p('1.2.3.4 - - [18/Oct/2026:12:00:00 +0200] "GET /"') == 1792317600.0
+    assert p("no time here") == 1792317600.0 and p.unparsed == 1
+    assert TimeParser()("no time here") is None
+
+def test_undated_leading_lines_take_the_first_timestamp(tmp_path):
+    log=tmp_path/"auth.log"; log.write_text(LINE*2+"2026-10-18 10:00:00 "+LINE)
+    run=ReplayRun(3,3600,60,Classifier())
+    rep=replay([str(log)],[run],year=2026)
+    assert rep["first"]==rep["last"]==1792317600.0 and rep["undated_leading"]==2
+    assert [b[:2] for b in run.blocks]==[("198.51.100.4",1792317600.0)]
@@ -0,0 +1,89 @@
+import threading, time
+from idps_engine import DetectionEngine
+from idps_firewall import RecordingBackend
+from idps_response import BlockScheduler, Responder
+
+def test_due_skips_extended_and_cancelled():
+    s=BlockScheduler(lambda ip,d: None)
+    s.schedule("a",10); s.schedule("b",20); s.schedule("c",30)
+    s.schedule("a",40)                                        # extended: the old heap entry is stale
+    assert s.cancel("b") and not s.cancel("b")
+    assert s.due(35)==[("c",30)]
+    assert s.due(100)==[("a",40)] and len(s)==0
+
+def test_save_and_load(tmp_path):
+    path=str(tmp_path/"blocks.json")
+    s=BlockScheduler(lambda ip,d: None,path=path); s.schedule("192.0.2.1",123.5); s.schedule("10.0.0.0/24",99.0); s.save()
+    assert BlockScheduler(lambda ip,d: None,path=path).load()=={"192.0.2.1":123.5,"10.0.0.0/24":99.0}
+    (tmp_path/"blocks.json").write_text("{broken")
+    assert BlockScheduler(lambda ip,d: None,path=path).load()=={}
+
+def test_100k_blocks_one_thread():
+    n=100_000; ips=[f"10.{i>>16}.{(i>>8)&255}.{i&255}" for i in range(n)]
+    expired=set(); done=threading.Event()
+    def on_expire(ip, d):
+        expired.add(ip)
+        if len(expired)==n: done.set()
+    threads=threading.active_count()
+    s=BlockScheduler(on_expire).start()
+    try:
+        now=time.time()
+        for ip in ips: s.schedule(ip,now+3600)
+        assert threading.active_count()==threads+1 and len(s)==n
+        now=time.time()
+        for i,ip in enumerate(ips): s.schedule(ip,now+0.2+i/n)   # bring them all forward
+        assert done.wait(30) and len(s)==0
+        assert threading.active_count()==threads+1
+    finally:
+        s.stop()
+
+def test_expiry_is_not_held_up_by_a_full_alert_queue():
+    gate=threading.Event()
+    def geo(ip): gate.wait(10); return ("Somewhere",None,None)
+    e=DetectionEngine(); ev=[]; e.subscribe(lambda x: ev.append(x[:2]))
+    r=Responder(e,geo=geo,firewall=RecordingBackend(),workers=1,queue_size=2,put_timeout=0.01,state_path=None)
+    try:
+        for i in range(5): r.submit(f"198.51.100.{i}","FAILED_LOGIN")     # worker stuck, queue full
+        assert r.stats()["dropped"]>0
+        r.adopt("192.0.2.1",e.clock()+0.1,"peer")
+        end=time.time()+5
+        while ("unblocked","192.0.2.1") not in ev and time.time()<end: time.sleep(0.01)
+        assert ("unblocked","192.0.2.1") in ev and "192.0.2.1" not in e.blocked_until
+    finally:
+        gate.set(); r.close()
+
+def test_forget_all_lifts_subnet_blocks():
+    e=DetectionEngine(threshold=3,clock=lambda: 1000.0); ev=[]; e.subscribe(ev.append)
+    r=Responder(e,geo=lambda ip: ("Somewhere",None,None),firewall=RecordingBackend(),workers=1,state_path=None)
+    try:
+        assert r.adopt("198.51.100.0/24",5000.0,"peer")
+        e.feed("Failed password for root from 198.51.100.7 port 1"); assert ev[-1][0]=="blocked"    # dropped: inside the block
+        r.forget_all()
+        e.feed("Failed password for root from 198.51.100.7 port 1")
+        assert ev[-1]==("fail","198.51.100.7",1000.0,1)
+    finally:
+        r.close()
+
+def test_a_failing_geo_lookup_does_not_stop_the_block():
+    def geo(ip): raise KeyError(ip)
+    e=DetectionEngine(); ev=[]; e.subscribe(ev.append)
+    r=Responder(e,geo=geo,firewall=RecordingBackend(),workers=1,state_path=None)
+    try:
+        r.enrich_and_act("192.0.2.1","FAILED_LOGIN")
+        assert "192.0.2.1" in e.blocked_until and ("enrich","192.0.2.1","Unknown",None,None,"FAILED_LOGIN") in ev
+    finally:
+        r.close()
+
+def test_counters_add_up_under_concurrent_submits():
+    gate=threading.Event()
+    def geo(ip): gate.wait(10); return ("Somewhere",None,None)
+    r=Responder(DetectionEngine(),geo=geo,firewall=RecordingBackend(),workers=1,state_path=None)
+    try:
+        go=lambda: [r.submit(f"198.51.100.{i%50}","FAILED_LOGIN") for i in range(5000)]
+        threads=[threading.Thread(target=go) for _ in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        st=r.stats()
+        assert st["queued"]==50 and st["deduped"]==8*5000-50 and st["dropped"]==0
+    finally:
+        gate.set(); r.close()
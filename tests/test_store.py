@@ -0,0 +1,18 @@
+import sqlite3
+import pytest
+from idps_store import EventStore
+
+def test_page_and_count_close_their_connections(tmp_path):
+    s=EventStore(str(tmp_path/"ev.db")).open()
+    try:
+        s.on_event(("alert","192.0.2.1",1000.0,"FAILED_LOGIN",5)); s.on_event(("blocked","192.0.2.1",1001.0,2000.0,"ok"))
+        s.flush()
+        opened=[]; reader=s._reader
+        def tracked():
+            db=reader(); opened.append(db); return db
+        s._reader=tracked
+        assert s.count()==2 and [r[3] for r in s.page(size=10)]==["192.0.2.1"]*2
+        for db in opened:
+            with pytest.raises(sqlite3.ProgrammingError): db.execute("SELECT 1")     # closed
+    finally:
+        s.close()
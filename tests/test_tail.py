@@ -0,0 +1,96 @@
+import os, shutil, threading, time
+import pytest
+from idps_tail import Tailer
+
+def follow(path, use_inotify=True):
+    got=[]; stop=threading.Event(); t=Tailer(path,from_end=False,use_inotify=use_inotify)
+    th=threading.Thread(target=t.run,args=(lambda text: got.extend(int(ln.split(" ",1)[0]) for ln in text.splitlines()),stop),daemon=True)
+    th.start()
+    while t.fd is None: time.sleep(0.001)
+    return t,got,stop,th
+
+def wait_for(got, n, timeout=20):
+    end=time.time()+timeout
+    while len(got)<n and time.time()<end: time.sleep(0.005)
+
+def write(fd, i, k): os.write(fd,"".join(f"{j} sshd[1]: Failed password for root from 192.0.2.1 port 22\n" for j in range(i,i+k)).encode())
+def open_log(path): return os.open(path,os.O_WRONLY|os.O_APPEND|os.O_CREAT)
+
+@pytest.mark.parametrize("every,inotify",[(10_000,True),(500,True),(2_000,False)])
+def test_rename_rotation_under_load_loses_nothing(tmp_path, every, inotify):
+    path=str(tmp_path/"auth.log"); open(path,"w").close()
+    t,got,stop,th=follow(path,inotify); n=100_000; fd=open_log(path)
+    try:
+        for i in range(0,n,250):
+            write(fd,i,250)
+            if (i+250)%every==0 and i+250<n:                  # no waiting for the reader
+                os.close(fd); os.replace(path,f"{path}.{i+250}"); fd=open_log(path)
+        os.close(fd); wait_for(got,n)
+    finally:
+        stop.set(); th.join(2)
+    assert len(got)==n and set(got)==set(range(n))
+    assert t.rotations==n//every-1
+
+@pytest.mark.parametrize("mode",["copytruncate","truncate"])
+def test_truncation_under_load(tmp_path, mode):
+    path=str(tmp_path/"auth.log"); open(path,"w").close()
+    t,got,stop,th=follow(path); n=50_000; fd=open_log(path)
+    try:
+        for i in range(0,n,250):
+            write(fd,i,250)
+            if (i+250)%5000==0 and i+250<n:
+                wait_for(got,i+250)                           # truncating can only keep what was read
+                if mode=="copytruncate": shutil.copyfile(path,path+".1")
+                os.truncate(path,0)
+        os.close(fd); wait_for(got,n)
+    finally:
+        stop.set(); th.join(2)
+    assert got==list(range(n)) and t.truncations==n//5000-1
+
+def test_old_compressed_generations_are_not_read(tmp_path):
+    path=str(tmp_path/"auth.log")
+    with open(path,"w") as fp: fp.write("0 a\n")
+    t,got,stop,th=follow(path)
+    try:
+        wait_for(got,1)
+        os.replace(path,path+".1")
+        with open(path+".2.gz","w") as fp: fp.write("99 compressed\n")
+        with open(path,"w") as fp: fp.write("1 b\n")
+        wait_for(got,2); time.sleep(0.3)
+    finally:
+        stop.set(); th.join(2)
+    assert got==[0,1]
+
+def drain(t):
+    blocks=[]
+    while True:
+        text=t.read_block()
+        if not text: return blocks
+        blocks.append(text)
+
+def test_missed_generations_are_read_in_batches_and_only_rotated_names(tmp_path):
+    path=str(tmp_path/"auth.log")
+    with open(path,"w") as fp: fp.write("0 a\n")
+    t=Tailer(path,from_end=False,chunk_size=1024,max_batch=4096)
+    assert drain(t)==["0 a\n"]
+    os.replace(path,path+".2")
+    with open(path+".1","w") as fp: fp.writelines(f"{i} missed\n" for i in range(1,5001))
+    for junk in (".bak","-old",".2.gz"):
+        with open(path+junk,"w") as fp: fp.write("99 junk\n")
+    with open(path,"w") as fp: fp.write("5001 live\n")
+    blocks=drain(t)
+    assert [int(ln.split(" ",1)[0]) for b in blocks for ln in b.splitlines()]==list(range(1,5002))
+    assert max(map(len,blocks))<4096+16 and t.rotations==2      # max_batch plus a carried partial line
+
+def test_failed_reopen_after_rotation_still_starts_at_0(tmp_path):
+    path=str(tmp_path/"auth.log"); open(path,"w").close()
+    t=Tailer(path,from_end=True); assert drain(t)==[]
+    os.replace(path,path+".1")
+    with open(path,"w") as fp: fp.write("1 new\n")
+    real=t._open_fd; fails=[1,1]
+    def flaky(path):
+        if fails: fails.pop(); return None           # the new file vanished between stat and open
+        return real(path)
+    t._open_fd=flaky
+    assert t.read_block()=="" and t.fd is None
+    assert drain(t)==["1 new\n"]